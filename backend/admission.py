@@ -0,0 +1,195 @@
+"""
+Admission control for expensive API requests
+
+A full analysis extracts a database, vectorises it and renders outputs; if
+every request starts one immediately, a burst makes all of them slow and can
+run the machine out of memory. The AdmissionController runs at most
+``max_concurrent`` of them, lets up to ``max_queue`` more wait (first come,
+first served) for at most ``queue_timeout`` seconds, and refuses new work
+while the system's available memory is below a floor:
+
+    queue full             -> 429, Retry-After
+    waited too long        -> 503, Retry-After
+    low available memory   -> 503, Retry-After
+
+Retry-After is estimated from the recent mean service time and the current
+queue depth. Queue depth, wait times and rejections are reported by
+``stats()``.
+"""
+
+import math
+import time
+import asyncio
+from collections import deque
+from typing import Deque, Dict, Optional
+
+DEFAULT_RETRY_AFTER = 5
+WAIT_SAMPLES = 256
+
+def available_memory_bytes() -> Optional[int]:
+    """MemAvailable from /proc/meminfo (psutil elsewhere); None when unknown"""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import psutil
+        return int(psutil.virtual_memory().available)
+    except ImportError:
+        return None
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is not admitted; carries the HTTP status and Retry-After"""
+
+    def __init__(self, status_code: int, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Concurrency limit with a bounded FIFO wait queue and a memory floor
+
+    Args:
+        max_concurrent: Requests running at once
+        max_queue: Requests allowed to wait for a slot (0 = reject when busy)
+        queue_timeout: Seconds a request may wait before it is rejected
+        min_available_mb: Refuse new work while available memory is below this
+            (None disables the check)
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int = 0,
+                 queue_timeout: float = 30.0,
+                 min_available_mb: Optional[float] = None):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.min_available = int(min_available_mb * 1024 * 1024) if min_available_mb else None
+        self._active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._admitted = 0
+        self._rejected = {"queue_full": 0, "queue_timeout": 0, "memory": 0}
+        self._waits: Deque[float] = deque(maxlen=WAIT_SAMPLES)
+        self._service_mean: Optional[float] = None
+
+    # ---------------------------
+    # Admission
+    # ---------------------------
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely to be free, for the Retry-After header"""
+        if self._service_mean is None:
+            return DEFAULT_RETRY_AFTER
+        rounds = (len(self._waiters) + 1) / self.max_concurrent
+        return max(1, math.ceil(self._service_mean * rounds))
+
+    def _reject(self, status_code: int, reason: str, detail: str) -> AdmissionRejected:
+        self._rejected[reason] += 1
+        return AdmissionRejected(status_code, detail, self.retry_after())
+
+    def _check_memory(self) -> None:
+        if self.min_available is None:
+            return
+        available = available_memory_bytes()
+        if available is not None and available < self.min_available:
+            raise self._reject(503, "memory", "Server is low on memory; try again later")
+
+    async def acquire(self) -> float:
+        """
+        Wait for a slot
+
+        Returns: the admission time, to pass to ``release``
+        Raises: AdmissionRejected
+        """
+        self._check_memory()
+        arrived = time.monotonic()
+        if self._active < self.max_concurrent and not self._waiters:
+            self._active += 1
+        elif len(self._waiters) >= self.max_queue:
+            raise self._reject(429, "queue_full", "Too many analyses in progress; try again later")
+        else:
+            slot = asyncio.get_running_loop().create_future()
+            self._waiters.append(slot)
+            try:
+                await asyncio.wait_for(asyncio.shield(slot), self.queue_timeout)
+            except asyncio.TimeoutError:
+                if not self._abandon(slot):
+                    raise self._reject(503, "queue_timeout", "Timed out waiting for an analysis slot")
+            except asyncio.CancelledError:
+                if self._abandon(slot):
+                    self._hand_over()
+                raise
+            # release() handed its slot to us; _active already counts it
+
+        try:
+            # Memory may have run low while we waited
+            self._check_memory()
+        except AdmissionRejected:
+            self._hand_over()
+            raise
+        admitted = time.monotonic()
+        self._waits.append(admitted - arrived)
+        self._admitted += 1
+        return admitted
+
+    def _abandon(self, slot: asyncio.Future) -> bool:
+        """
+        Leave the queue
+
+        Returns: True if the slot had already been granted (the caller now
+        owns it and must use or hand it over)
+        """
+        if slot.done():
+            return True
+        slot.cancel()
+        try:
+            self._waiters.remove(slot)
+        except ValueError:
+            pass
+        return False
+
+    def _hand_over(self) -> None:
+        """Give our slot to the next waiter, or free it"""
+        while self._waiters:
+            slot = self._waiters.popleft()
+            if not slot.done():
+                slot.set_result(None)
+                return
+        self._active -= 1
+
+    def release(self, admitted: float) -> None:
+        """Finish a request admitted at ``admitted`` (the value returned by ``acquire``)"""
+        elapsed = time.monotonic() - admitted
+        # Exponentially weighted mean service time for Retry-After
+        self._service_mean = elapsed if self._service_mean is None else 0.8 * self._service_mean + 0.2 * elapsed
+        self._hand_over()
+
+    # ---------------------------
+    # Observability
+    # ---------------------------
+
+    def stats(self) -> Dict:
+        waits = sorted(self._waits)
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "queue_timeout_seconds": self.queue_timeout,
+            "min_available_bytes": self.min_available,
+            "active": self._active,
+            "queued": len(self._waiters),
+            "admitted": self._admitted,
+            "rejected": dict(self._rejected),
+            "wait_seconds": {
+                "mean": round(sum(waits) / len(waits), 4) if waits else 0.0,
+                "p95": round(waits[min(len(waits) - 1, int(0.95 * len(waits)))], 4) if waits else 0.0,
+                "max": round(waits[-1], 4) if waits else 0.0,
+            },
+            "mean_service_seconds": round(self._service_mean, 4) if self._service_mean is not None else None,
+            "available_memory_bytes": available_memory_bytes(),
+        }
@@ -0,0 +1,384 @@
+"""
+High-volume batch comparison with streaming JSONL output
+
+Screens a large number of input chapters against a fitted corpus without the
+5-file cap of ``load_inputs``. Inputs are streamed from a directory or a ZIP
+archive in a fixed order, scored in micro-batches, and every input produces
+one JSON line with its top-k matches and relation label. Memory depends on
+the micro-batch size, not on the number of inputs.
+
+A batch is resumable: the output file is the checkpoint. On restart, complete
+lines are counted, a torn last line is truncated, and that many inputs are
+skipped.
+
+Usage:
+    python batch_runner.py --db ./db --inputs ./new_chapters --out results.jsonl
+    python batch_runner.py --index corpus.pkl --inputs chapters.zip --out results.jsonl
+"""
+
+import os
+import re
+import sys
+import json
+import shutil
+import time
+import uuid
+import zipfile
+import argparse
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from corpus_reader import decode_text, read_text_file
+from novel_similarity_pipeline import classify_relation
+from similarity_engine import SimilarityEngine, top_candidates
+
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_TOP_K = 5
+
+# ---------------------------
+# Input streaming
+# ---------------------------
+
+def iter_input_names(source: str) -> Iterator[str]:
+    """Input document names in processing order (sorted, recursive)"""
+    if os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(".txt"):
+                    yield os.path.relpath(os.path.join(root, name), source)
+    elif zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as zf:
+            for name in sorted(n for n in zf.namelist() if n.lower().endswith(".txt") and not n.endswith("/")):
+                yield name
+    else:
+        raise SystemExit(f"Input source must be a folder or ZIP archive: {source}")
+
+
+def iter_input_documents(source: str, skip: int = 0) -> Iterator[Tuple[str, str]]:
+    """
+    Yield (name, raw_text) one document at a time, skipping the first ``skip``
+
+    Files and ZIP members are decoded with encoding detection (see corpus_reader.py),
+    so Thai cp874 / TIS-620 inputs keep their text.
+    """
+    names = iter_input_names(source)
+    if os.path.isdir(source):
+        for i, name in enumerate(names):
+            if i < skip:
+                continue
+            yield name, read_text_file(os.path.join(source, name))[0]
+    else:
+        with zipfile.ZipFile(source) as zf:
+            for i, name in enumerate(names):
+                if i < skip:
+                    continue
+                yield name, decode_text(zf.read(name))[0]
+
+
+def count_inputs(source: str) -> int:
+    return sum(1 for _ in iter_input_names(source))
+
+
+def iter_batches(docs: Iterator[Tuple[str, str]], batch_size: int) -> Iterator[List[Tuple[str, str]]]:
+    batch = []
+    for doc in docs:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+# ---------------------------
+# Checkpointing
+# ---------------------------
+
+def completed_lines(out_path: str) -> int:
+    """
+    Number of complete JSON lines in an existing output file. A torn trailing
+    line (interrupted write) is truncated so the file can be appended to.
+    """
+    if not os.path.exists(out_path):
+        return 0
+    count = 0
+    valid_end = 0
+    with open(out_path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                json.loads(line)
+            except ValueError:
+                break
+            count += 1
+            valid_end += len(line)
+    if valid_end != os.path.getsize(out_path):
+        with open(out_path, "r+b") as f:
+            f.truncate(valid_end)
+    return count
+
+# ---------------------------
+# Batch scoring
+# ---------------------------
+
+def score_batch(engine: SimilarityEngine, batch: List[Tuple[str, str]], top_k: int,
+                dup_threshold: float, similar_threshold: float, n_novels: int = 0) -> List[Dict]:
+    """Score one micro-batch and build its JSONL records"""
+    names = [name for name, _ in batch]
+    S = engine.score([text for _, text in batch], preprocess=True, n_novels=n_novels)
+    metadata = engine.metadata
+    records = []
+    for i, name in enumerate(names):
+        # With n_novels, S is sparse and only each input's candidates are ranked
+        order, scores = top_candidates(S, i, top_k)
+        top_score = float(scores[0]) if len(scores) else 0.0
+        records.append({
+            "input": name,
+            "relation": classify_relation(top_score, dup_threshold, similar_threshold),
+            "top_similarity": round(top_score, 4),
+            "top_matches": [
+                {
+                    "database_file": metadata[j].get("file_name"),
+                    "genre": metadata[j].get("genre"),
+                    "title": metadata[j].get("novel_title"),
+                    "display_name": metadata[j].get("display_name"),
+                    "similarity": round(float(score) * 100, 2)
+                }
+                for j, score in zip(order, scores)
+            ]
+        })
+    return records
+
+
+def run_batch(engine: SimilarityEngine, source: str, out_path: str,
+              batch_size: int = DEFAULT_BATCH_SIZE,
+              top_k: int = DEFAULT_TOP_K,
+              dup_threshold: float = 0.90,
+              similar_threshold: float = 0.60,
+              resume: bool = True,
+              n_novels: int = 0,
+              progress: Optional[Callable[[int, int], None]] = None,
+              should_stop: Optional[Callable[[], bool]] = None) -> Dict:
+    """
+    Stream ``source`` through ``engine`` and append one JSON line per input
+
+    Args:
+        engine: Fitted corpus engine
+        source: Folder of .txt files or ZIP archive
+        out_path: JSONL output file (also the resume checkpoint)
+        resume: Continue after the last complete line instead of starting over
+        n_novels: Score only the chapters of each input's n closest novels (0 = all)
+        progress: Called with (processed, total) after every micro-batch
+        should_stop: Polled between micro-batches to interrupt the run
+
+    Returns: summary with processed/skipped/total counts
+    """
+    total = count_inputs(source)
+    if resume:
+        done = completed_lines(out_path)
+    else:
+        done = 0
+        open(out_path, "w").close()
+    processed = done
+    started = time.time()
+
+    with open(out_path, "a", encoding="utf-8") as out:
+        for batch in iter_batches(iter_input_documents(source, skip=done), batch_size):
+            if should_stop and should_stop():
+                break
+            for record in score_batch(engine, batch, top_k, dup_threshold, similar_threshold, n_novels):
+                out.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+            out.flush()
+            processed += len(batch)
+            if progress:
+                progress(processed, total)
+
+    return {
+        "output": out_path,
+        "total": total,
+        "processed": processed,
+        "skipped_as_done": done,
+        "completed": processed >= total,
+        "seconds": round(time.time() - started, 3)
+    }
+
+# ---------------------------
+# Background jobs (API)
+# ---------------------------
+
+# Ids are generated by create (first 8 hex digits of a UUID4); anything else
+# from a URL is rejected before it becomes a path
+JOB_ID_PATTERN = re.compile(r"[0-9a-f]{8}")
+
+class BatchJobManager:
+    """
+    Runs batch jobs on background threads and persists their state
+
+    Each job folder holds ``job.json`` (parameters and progress), the input
+    archive and ``results.jsonl``. Jobs interrupted by a restart show up as
+    ``interrupted`` and can be resumed from their last complete line.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._running: Dict[str, threading.Thread] = {}
+        self._stop: Dict[str, threading.Event] = {}
+
+    def job_dir(self, job_id: str) -> Path:
+        """
+        Folder of a job; every path accessor goes through here
+
+        Raises: KeyError for ids not in the generated format (e.g. "..")
+        """
+        if not JOB_ID_PATTERN.fullmatch(job_id or ""):
+            raise KeyError(f"Unknown job: {job_id}")
+        return self.root / job_id
+
+    def results_path(self, job_id: str) -> Path:
+        return self.job_dir(job_id) / "results.jsonl"
+
+    def _write_state(self, job_id: str, state: Dict) -> None:
+        tmp = self.job_dir(job_id) / "job.json.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.job_dir(job_id) / "job.json")
+
+    def status(self, job_id: str) -> Dict:
+        path = self.job_dir(job_id) / "job.json"
+        if not path.exists():
+            raise KeyError(f"Unknown job: {job_id}")
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        with self._lock:
+            running = job_id in self._running
+        if state["status"] in ("queued", "running") and not running:
+            state["status"] = "interrupted"
+        return state
+
+    def create(self, corpus_id: str, params: Dict) -> Tuple[str, Path]:
+        """Create a job folder; the caller stores the input archive at the returned path"""
+        job_id = str(uuid.uuid4())[:8]
+        self.job_dir(job_id).mkdir(parents=True)
+        self._write_state(job_id, {
+            "job_id": job_id,
+            "corpus_id": corpus_id,
+            "status": "queued",
+            "params": params,
+            "processed": 0,
+            "total": None,
+            "created_at": time.time(),
+            "updated_at": time.time(),
+            "error": None
+        })
+        return job_id, self.job_dir(job_id) / "inputs.zip"
+
+    def remove(self, job_id: str) -> None:
+        """Delete a job that was never started (e.g. its upload was rejected)"""
+        shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+
+    def start(self, job_id: str, engine: SimilarityEngine) -> None:
+        """Run (or resume) a job on a background thread"""
+        state = self.status(job_id)
+        with self._lock:
+            if job_id in self._running:
+                return
+            stop = threading.Event()
+            self._stop[job_id] = stop
+            thread = threading.Thread(target=self._run, args=(job_id, engine, state, stop),
+                                      name=f"batch-{job_id}", daemon=True)
+            self._running[job_id] = thread
+        thread.start()
+
+    def stop(self, job_id: str) -> None:
+        with self._lock:
+            event = self._stop.get(job_id)
+        if event:
+            event.set()
+
+    def _run(self, job_id: str, engine: SimilarityEngine, state: Dict, stop: threading.Event) -> None:
+        params = state["params"]
+        state.update(status="running", error=None, updated_at=time.time())
+        self._write_state(job_id, state)
+
+        def progress(processed: int, total: int) -> None:
+            state.update(processed=processed, total=total, updated_at=time.time())
+            self._write_state(job_id, state)
+
+        try:
+            summary = run_batch(
+                engine,
+                str(self.job_dir(job_id) / "inputs.zip"),
+                str(self.results_path(job_id)),
+                batch_size=params.get("batch_size", DEFAULT_BATCH_SIZE),
+                top_k=params.get("top_k", DEFAULT_TOP_K),
+                dup_threshold=params.get("dup_threshold", 0.90),
+                similar_threshold=params.get("similar_threshold", 0.60),
+                resume=True,
+                n_novels=params.get("n_novels", 0),
+                progress=progress,
+                should_stop=stop.is_set
+            )
+            state.update(
+                status="completed" if summary["completed"] else "stopped",
+                processed=summary["processed"],
+                total=summary["total"]
+            )
+        except BaseException as e:
+            state.update(status="failed", error=str(e))
+        finally:
+            state["updated_at"] = time.time()
+            self._write_state(job_id, state)
+            with self._lock:
+                self._running.pop(job_id, None)
+                self._stop.pop(job_id, None)
+
+# ---------------------------
+# CLI
+# ---------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch-screen many input chapters against a corpus (JSONL output).")
+    parser.add_argument("--db", default=None, help="Database root folder (expects ./db/<genre>/*.txt).")
+    parser.add_argument("--index", default=None,
+                        help="Corpus index file: loaded if it exists, otherwise built from --db and saved here.")
+    parser.add_argument("--inputs", required=True, help="Folder of .txt files or ZIP archive to screen.")
+    parser.add_argument("--out", default="./batch_results.jsonl", help="JSONL output file (also the resume checkpoint).")
+    parser.add_argument("--batch_size", type=int, default=DEFAULT_BATCH_SIZE, help="Inputs scored per micro-batch.")
+    parser.add_argument("--topk", type=int, default=DEFAULT_TOP_K, help="Top matches written per input.")
+    parser.add_argument("--dup_threshold", type=float, default=0.90, help="Duplicate threshold (cosine).")
+    parser.add_argument("--similar_threshold", type=float, default=0.60, help="Similar threshold (cosine).")
+    parser.add_argument("--restart", action="store_true", help="Ignore existing output and start from the first input.")
+    parser.add_argument("--n_novels", type=int, default=0,
+                        help="Two-stage retrieval: score only the chapters of the n closest novels (0 = all).")
+    args = parser.parse_args()
+
+    if args.index and os.path.exists(args.index):
+        engine = SimilarityEngine.load(args.index)
+    elif args.db:
+        engine = SimilarityEngine.from_database(args.db, max_files_per_genre=None)
+        if args.index:
+            engine.save(args.index)
+    else:
+        parser.error("--db is required unless --index points to an existing index")
+
+    def progress(processed: int, total: int) -> None:
+        print(f"⚖️  {processed}/{total} inputs scored", file=sys.stderr)
+
+    summary = run_batch(
+        engine, args.inputs, args.out,
+        batch_size=args.batch_size,
+        top_k=args.topk,
+        dup_threshold=args.dup_threshold,
+        similar_threshold=args.similar_threshold,
+        resume=not args.restart,
+        n_novels=args.n_novels,
+        progress=progress
+    )
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
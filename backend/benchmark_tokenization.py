@@ -0,0 +1,168 @@
+"""
+Benchmark word vs character n-gram tokenization
+
+Indexes each corpus with both tokenization modes of the enhanced pipeline and
+reports, per mode, indexing throughput (preprocess + fit) and query time, and
+for ``char_ngrams`` how closely its rankings agree with the ``words`` path
+(pythainlp ``newmm`` for Thai when installed, otherwise the regex fallback):
+
+    top1_agreement   share of queries whose best match is the same
+    overlap_at_k     mean |top-k(words) ∩ top-k(char_ngrams)| / k
+    spearman         mean Spearman correlation of the full score vectors
+
+Queries are the files under ``--inputs``, or, without it, every corpus
+document scored against the rest of the corpus (leave-one-out).
+
+Usage:
+    python benchmark_tokenization.py --db ./database --db ./database_new
+    python benchmark_tokenization.py --db ../sample_data/database --inputs ../sample_data/input --out bench.json
+"""
+
+import os
+import glob
+import json
+import time
+import argparse
+from functools import partial
+from typing import Dict, List, Optional
+
+import numpy as np
+from scipy.stats import spearmanr
+
+from novel_similarity_pipeline import iter_database, read_txt
+from similarity_engine import SimilarityEngine
+from enhanced_pipeline import (
+    THAI_SUPPORT,
+    detect_language,
+    enhanced_preprocess,
+    make_enhanced_vectorizer,
+)
+
+MODES = ("words", "char_ngrams")
+
+# ---------------------------
+# Measurement
+# ---------------------------
+
+def load_queries(input_root: Optional[str]) -> List[str]:
+    if not input_root:
+        return []
+    files = sorted(glob.glob(os.path.join(input_root, "**", "*.txt"), recursive=True))
+    if not files:
+        raise SystemExit(f"No .txt files found in {input_root}")
+    return [read_txt(p) for p in files]
+
+
+def run_mode(texts: List[str], metadata: List[Dict], queries: List[str],
+             language: str, mode: str, repeat: int) -> Dict:
+    """Best-of-``repeat`` timings and the query score matrix for one mode"""
+    index_times, query_times = [], []
+    for _ in range(repeat):
+        engine = SimilarityEngine(
+            vectorizer_factory=partial(make_enhanced_vectorizer, language, mode),
+            preprocess=partial(enhanced_preprocess, language=language, tokenization=mode),
+        )
+        start = time.perf_counter()
+        engine.fit((engine.preprocess(t) for t in texts), metadata)
+        index_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        S = engine.score(queries or texts, preprocess=True)
+        query_times.append(time.perf_counter() - start)
+
+    n_bytes = sum(len(t.encode("utf-8")) for t in texts)
+    index_seconds = min(index_times)
+    return {
+        "scores": S,
+        "features": len(engine.vectorizer.vocabulary_),
+        "index_seconds": round(index_seconds, 4),
+        "docs_per_second": round(len(texts) / index_seconds, 1),
+        "mb_per_second": round(n_bytes / index_seconds / 1e6, 3),
+        "query_seconds": round(min(query_times), 4),
+    }
+
+
+def ranking_agreement(reference: np.ndarray, candidate: np.ndarray, k: int, leave_one_out: bool) -> Dict:
+    """Compare two (queries x corpus) score matrices row by row"""
+    top1, overlap, rho = [], [], []
+    for i in range(reference.shape[0]):
+        keep = np.ones(reference.shape[1], dtype=bool)
+        if leave_one_out:
+            keep[i] = False
+        ref, cand = reference[i, keep], candidate[i, keep]
+        if ref.size == 0:
+            continue
+        kk = min(k, ref.size)
+        ref_top = np.argsort(-ref, kind="stable")[:kk]
+        cand_top = np.argsort(-cand, kind="stable")[:kk]
+        top1.append(ref_top[0] == cand_top[0])
+        overlap.append(len(set(ref_top) & set(cand_top)) / kk)
+        if ref.size > 1 and np.ptp(ref) > 0 and np.ptp(cand) > 0:
+            rho.append(spearmanr(ref, cand).correlation)
+    return {
+        "queries": len(top1),
+        "top1_agreement": round(float(np.mean(top1)), 4) if top1 else None,
+        f"overlap_at_{k}": round(float(np.mean(overlap)), 4) if overlap else None,
+        "spearman": round(float(np.mean(rho)), 4) if rho else None,
+    }
+
+
+def benchmark_corpus(db_root: str, queries: List[str], k: int, repeat: int) -> Dict:
+    metadata, texts = [], []
+    for path, info in iter_database(db_root, max_files_per_genre=None):
+        metadata.append(info)
+        texts.append(read_txt(path))
+    if not texts:
+        raise SystemExit(f"No .txt files found in {db_root}")
+    language = detect_language(" ".join(texts[:10]))
+
+    print(f"📚 {db_root}: {len(texts)} documents, language={language}")
+    modes = {mode: run_mode(texts, metadata, queries, language, mode, repeat) for mode in MODES}
+    agreement = ranking_agreement(modes["words"]["scores"], modes["char_ngrams"]["scores"],
+                                  k, leave_one_out=not queries)
+    for mode, stats in modes.items():
+        stats.pop("scores")
+        print(f"   {mode:<12} {stats['docs_per_second']:>8} docs/s  {stats['mb_per_second']:>7} MB/s  "
+              f"query {stats['query_seconds']}s  features {stats['features']}")
+    print(f"   agreement    top-1 {agreement['top1_agreement']}  overlap@{k} {agreement[f'overlap_at_{k}']}  "
+          f"spearman {agreement['spearman']}")
+    return {
+        "db_root": db_root,
+        "documents": len(texts),
+        "language": language,
+        "modes": modes,
+        "speedup": round(modes["words"]["index_seconds"] / modes["char_ngrams"]["index_seconds"], 2),
+        "agreement": agreement,
+    }
+
+# ---------------------------
+# CLI
+# ---------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark word vs character n-gram tokenization")
+    parser.add_argument("--db", action="append", required=True,
+                        help="Database root (repeat for several corpora)")
+    parser.add_argument("--inputs", default=None,
+                        help="Query folder (default: leave-one-out over each corpus)")
+    parser.add_argument("--topk", type=int, default=3, help="k for overlap@k")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per mode; the fastest is reported")
+    parser.add_argument("--out", default=None, help="Write the results as JSON")
+    args = parser.parse_args()
+
+    queries = load_queries(args.inputs)
+    reference = "newmm" if THAI_SUPPORT else "regex (pythainlp not installed)"
+    print(f"🔤 Reference word tokenizer: {reference}")
+    results = {
+        "reference_tokenizer": reference,
+        "queries": "leave-one-out" if not queries else args.inputs,
+        "corpora": [benchmark_corpus(db, queries, args.topk, max(1, args.repeat)) for db in args.db],
+    }
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"💾 Saved: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Benchmark the compact vocabulary against the vectorizer's dict
+
+Fits the pipeline vectorizer on a corpus (optionally with word n-grams, as
+on Thai corpora) and reports, for the ``vocabulary_`` dict and for
+``CompactVocabulary``:
+
+    size_bytes        pickled size (dict) / buffer size (compact)
+    load_seconds      unpickling the dict / mapping the compact file
+    resident_bytes    Python heap allocated by the load (tracemalloc); the
+                      mapped file is page cache, shared between processes
+    pickle_load_seconds  unpickling the compact buffer without mapping it
+    transform_seconds vectorizing the queries through each vocabulary
+
+Queries are the files under ``--inputs``, or the corpus documents.
+
+Usage:
+    python benchmark_vocabulary.py --db ./database --ngram_max 2
+    python benchmark_vocabulary.py --db ../sample_data/database --inputs ../sample_data/input --out bench.json
+"""
+
+import os
+import glob
+import json
+import time
+import pickle
+import argparse
+import tempfile
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+from compact_vocabulary import CompactVocabulary
+from novel_similarity_pipeline import iter_database, make_vectorizer, read_txt, simple_preprocess
+
+# ---------------------------
+# Measurement
+# ---------------------------
+
+def best_of(fn: Callable, repeat: int) -> Tuple[float, object]:
+    """Fastest of ``repeat`` calls and the last result"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def allocated_by(fn: Callable) -> int:
+    """Python heap still allocated by ``fn``'s result"""
+    tracemalloc.start()
+    try:
+        result = fn()
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return current
+
+
+def load_texts(db_root: str, input_root: str) -> Tuple[List[str], List[str]]:
+    texts = [simple_preprocess(read_txt(path)) for path, _ in iter_database(db_root, max_files_per_genre=None)]
+    if not texts:
+        raise SystemExit(f"No .txt files found in {db_root}")
+    if not input_root:
+        return texts, texts
+    files = sorted(glob.glob(os.path.join(input_root, "**", "*.txt"), recursive=True))
+    if not files:
+        raise SystemExit(f"No .txt files found in {input_root}")
+    return texts, [simple_preprocess(read_txt(p)) for p in files]
+
+
+def benchmark(db_root: str, input_root: str, ngram_max: int, repeat: int) -> Dict:
+    texts, queries = load_texts(db_root, input_root)
+    vec = make_vectorizer().set_params(ngram_range=(1, ngram_max))
+    start = time.perf_counter()
+    vec.fit(texts)
+    fit_seconds = time.perf_counter() - start
+    vocabulary = vec.vocabulary_
+    print(f"📚 {db_root}: {len(texts)} documents, {len(vocabulary):,} terms (ngram_range=(1, {ngram_max}))")
+
+    build_seconds, compact = best_of(lambda: CompactVocabulary.from_mapping(vocabulary), repeat)
+    dict_pickle = pickle.dumps(vocabulary, protocol=pickle.HIGHEST_PROTOCOL)
+    compact_pickle = pickle.dumps(compact, protocol=pickle.HIGHEST_PROTOCOL)
+
+    with tempfile.TemporaryDirectory(prefix="benchmark_vocabulary_") as tmp:
+        path = os.path.join(tmp, "vocabulary.bin")
+        compact.save(path)
+        results = {
+            "dict": {
+                "size_bytes": len(dict_pickle),
+                "load_seconds": best_of(lambda: pickle.loads(dict_pickle), repeat)[0],
+                "resident_bytes": allocated_by(lambda: pickle.loads(dict_pickle)),
+            },
+            "compact": {
+                "size_bytes": compact.nbytes,
+                "build_seconds": build_seconds,
+                "load_seconds": best_of(lambda: CompactVocabulary.load(path), repeat)[0],
+                "resident_bytes": allocated_by(lambda: CompactVocabulary.load(path)),
+                "pickle_load_seconds": best_of(lambda: pickle.loads(compact_pickle), repeat)[0],
+            },
+        }
+        mapped = CompactVocabulary.load(path)
+        vec.vocabulary_ = vocabulary
+        results["dict"]["transform_seconds"], X_dict = best_of(lambda: vec.transform(queries), repeat)
+        vec.vocabulary_ = mapped
+        results["compact"]["transform_seconds"], X_compact = best_of(lambda: vec.transform(queries), repeat)
+        if X_dict.shape != X_compact.shape or abs(X_dict - X_compact).max() > 1e-12:
+            raise SystemExit("Compact vocabulary produced different vectors")
+        del mapped, X_compact
+        vec.vocabulary_ = vocabulary
+
+    for name, stats in results.items():
+        for key, value in stats.items():
+            if key.endswith("_seconds"):
+                stats[key] = round(value, 5)
+        print(f"   {name:<8} {stats['size_bytes'] / 1e6:>8.2f}MB  load {stats['load_seconds']:.4f}s  "
+              f"resident {stats['resident_bytes'] / 1e6:>8.2f}MB  transform {stats['transform_seconds']:.4f}s")
+    return {
+        "db_root": db_root,
+        "documents": len(texts),
+        "queries": len(queries),
+        "ngram_range": [1, ngram_max],
+        "terms": len(vocabulary),
+        "fit_seconds": round(fit_seconds, 4),
+        "vocabulary": results,
+        "load_speedup": round(results["dict"]["load_seconds"] / max(results["compact"]["load_seconds"], 1e-9), 1),
+        "resident_saving_bytes": results["dict"]["resident_bytes"] - results["compact"]["resident_bytes"],
+    }
+
+# ---------------------------
+# CLI
+# ---------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the compact vocabulary against the vectorizer's dict")
+    parser.add_argument("--db", required=True, help="Database root folder")
+    parser.add_argument("--inputs", default=None, help="Query folder (default: the corpus documents)")
+    parser.add_argument("--ngram_max", type=int, default=1, help="Fit word n-grams up to this length")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement; the fastest is reported")
+    parser.add_argument("--out", default=None, help="Write the results as JSON")
+    args = parser.parse_args()
+
+    results = benchmark(args.db, args.inputs, max(1, args.ngram_max), max(1, args.repeat))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"💾 Saved: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
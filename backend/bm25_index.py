@@ -0,0 +1,171 @@
+"""
+Okapi BM25 over a compact inverted index
+
+TF-IDF cosine compares whole-document vectors, so a long chapter that repeats
+a term many times, or simply has more words, drifts away from short inputs.
+BM25 saturates term frequency (``k1``) and normalises by document length
+(``b``). The index stores, per vocabulary term, one postings list of corpus
+document ids and term frequencies; a query only walks the postings of its
+own terms, so query time grows with the input's vocabulary, not with the
+corpus size.
+
+Layout (CSC-like, one contiguous array each):
+
+    vocabulary   term -> term id (a CompactVocabulary once fitted)
+    indptr       postings of term t are [indptr[t], indptr[t + 1])
+    doc_ids      int32 corpus document ids, ascending within a term
+    tfs          int32 term frequencies
+    doc_lengths  int32 tokens per corpus document
+
+Calibration: raw BM25 scores are unbounded and depend on the input, so they
+cannot be compared with the relation thresholds directly. Each input's
+scores are divided by its self-score, the BM25 score the input would get
+against a corpus document identical to it (same terms, same length), and
+capped at 1. An exact copy of the input in the corpus therefore scores ~1.0
+(100%), a document sharing no terms scores 0, and the duplicate / similar
+thresholds keep their meaning as a share of the best possible match.
+"""
+
+import math
+from array import array
+from collections import Counter
+from typing import Callable, Dict, Iterable, Iterator, List, Mapping
+
+import numpy as np
+
+from compact_vocabulary import CompactVocabulary
+
+DEFAULT_K1 = 1.2
+DEFAULT_B = 0.75
+
+
+class BM25Index:
+    """
+    Inverted index with BM25 scoring
+
+    Args:
+        analyzer: Callable splitting a (preprocessed) text into terms, e.g.
+            ``TfidfVectorizer.build_analyzer()`` so BM25 sees the same tokens
+        k1: Term frequency saturation
+        b: Document length normalisation (0 = none, 1 = full)
+    """
+
+    def __init__(self, analyzer: Callable[[str], List[str]], k1: float = DEFAULT_K1, b: float = DEFAULT_B):
+        self.analyzer = analyzer
+        self.k1 = k1
+        self.b = b
+        self.vocabulary: Mapping[str, int] = {}
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.doc_ids = np.zeros(0, dtype=np.int32)
+        self.tfs = np.zeros(0, dtype=np.int32)
+        self.doc_lengths = np.zeros(0, dtype=np.int32)
+        self.doc_norms = np.zeros(0, dtype=np.float64)
+        self.avg_doc_length = 0.0
+
+    # ---------------------------
+    # Build
+    # ---------------------------
+
+    def index_stream(self, texts: Iterable[str]) -> Iterator[str]:
+        """
+        Index documents as they pass through and yield them unchanged
+
+        Lets the index be built in the same pass that feeds the TF-IDF
+        vectorizer, so a streamed corpus is read only once.
+        """
+        terms, docs, tfs, lengths = array("i"), array("i"), array("i"), array("i")
+        vocabulary = {}
+        for doc_id, text in enumerate(texts):
+            counts = Counter(self.analyzer(text))
+            for term, tf in counts.items():
+                terms.append(vocabulary.setdefault(term, len(vocabulary)))
+                docs.append(doc_id)
+                tfs.append(tf)
+            lengths.append(sum(counts.values()))
+            yield text
+        self._finalize(vocabulary, terms, docs, tfs, lengths)
+
+    def fit(self, texts: Iterable[str]) -> "BM25Index":
+        for _ in self.index_stream(texts):
+            pass
+        return self
+
+    def _finalize(self, vocabulary: Dict[str, int], terms: array, docs: array, tfs: array, lengths: array) -> None:
+        term_ids = np.frombuffer(terms, dtype=np.int32)
+        # Postings were collected document by document; a stable sort groups
+        # them by term and keeps doc ids ascending within each term
+        order = np.argsort(term_ids, kind="stable")
+        self.vocabulary = CompactVocabulary.from_mapping(vocabulary)
+        self.indptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(vocabulary)), out=self.indptr[1:])
+        self.doc_ids = np.frombuffer(docs, dtype=np.int32)[order]
+        self.tfs = np.frombuffer(tfs, dtype=np.int32)[order]
+        self.doc_lengths = np.frombuffer(lengths, dtype=np.int32).copy()
+        self.avg_doc_length = float(self.doc_lengths.mean()) if len(self.doc_lengths) else 0.0
+        self.doc_norms = self._length_norm(self.doc_lengths)
+
+    # ---------------------------
+    # Score
+    # ---------------------------
+
+    @property
+    def n_docs(self) -> int:
+        return len(self.doc_lengths)
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the postings and length arrays"""
+        return (self.indptr.nbytes + self.doc_ids.nbytes + self.tfs.nbytes
+                + self.doc_lengths.nbytes + self.doc_norms.nbytes)
+
+    def idf(self, df: int) -> float:
+        # Lucene's variant: always positive, even for terms in most documents
+        return math.log(1.0 + (self.n_docs - df + 0.5) / (df + 0.5))
+
+    def _length_norm(self, length) -> np.ndarray:
+        avg = self.avg_doc_length or 1.0
+        return self.k1 * (1.0 - self.b + self.b * np.asarray(length, dtype=np.float64) / avg)
+
+    def score_text(self, text: str, calibrate: bool = True) -> np.ndarray:
+        """BM25 score of one (preprocessed) text against every corpus document"""
+        scores = np.zeros(self.n_docs)
+        query = Counter(self.analyzer(text))
+        if not query or not self.n_docs:
+            return scores
+        self_score = 0.0
+        query_norm = self._length_norm(sum(query.values()))
+        for term, qtf in query.items():
+            # Repeated query terms count, saturated like document terms
+            q_weight = qtf * (self.k1 + 1.0) / (qtf + self.k1)
+            t = self.vocabulary.get(term)
+            idf = self.idf(0 if t is None else self.indptr[t + 1] - self.indptr[t])
+            # A copy of the input would contain every query term, known or not
+            self_score += idf * q_weight * qtf * (self.k1 + 1.0) / (qtf + query_norm)
+            if t is None:
+                continue
+            start, end = self.indptr[t], self.indptr[t + 1]
+            docs, tf = self.doc_ids[start:end], self.tfs[start:end]
+            scores[docs] += idf * q_weight * tf * (self.k1 + 1.0) / (tf + self.doc_norms[docs])
+        if calibrate:
+            return np.minimum(scores / self_score, 1.0) if self_score > 0 else scores
+        return scores
+
+    def score(self, texts: List[str], calibrate: bool = True) -> np.ndarray:
+        """Scores of each text against every corpus document (N_in x N_db)"""
+        S = np.zeros((len(texts), self.n_docs))
+        for i, text in enumerate(texts):
+            S[i] = self.score_text(text, calibrate)
+        return S
+
+    def describe(self) -> Dict:
+        """Scoring method and calibration, for analysis outputs"""
+        return {
+            "method": "bm25",
+            "k1": self.k1,
+            "b": self.b,
+            "vocabulary_size": len(self.vocabulary),
+            "postings": int(len(self.doc_ids)),
+            "avg_doc_length": round(self.avg_doc_length, 2),
+            "calibration": ("similarity = BM25(input, doc) / BM25(input, copy of input), capped at 1; "
+                            "an exact copy of the input scores 1.0"),
+        }
@@ -0,0 +1,161 @@
+"""
+Binary output formats for the similarity matrix and comparison table
+
+``csv`` keeps the original text files. ``parquet`` and ``arrow`` (Arrow IPC /
+Feather v2) need the optional ``pyarrow`` package; without it they fall back
+to ``npz``, which only needs numpy.
+
+The similarity matrix is always stored as float32 with the row and column
+labels written once, so loaders get the matrix back without parsing text.
+"""
+
+import os
+import json
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    import pyarrow.feather as feather
+    PYARROW_SUPPORT = True
+except ImportError:
+    PYARROW_SUPPORT = False
+
+OUTPUT_FORMATS = ("csv", "parquet", "arrow", "npz")
+FORMAT_EXTENSIONS = {"csv": ".csv", "parquet": ".parquet", "arrow": ".arrow", "npz": ".npz"}
+
+MATRIX_LABELS_KEY = b"similarity_matrix.labels"
+
+
+def resolve_output_format(output_format: str) -> str:
+    """Validate the requested format and apply the npz fallback"""
+    fmt = (output_format or "csv").lower()
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format '{output_format}'. Expected one of: {', '.join(OUTPUT_FORMATS)}")
+    if fmt in ("parquet", "arrow") and not PYARROW_SUPPORT:
+        print(f"⚠️ pyarrow not available, writing '{fmt}' output as npz instead")
+        return "npz"
+    return fmt
+
+# ---------------------------
+# Similarity matrix
+# ---------------------------
+
+def write_similarity_matrix(matrix: np.ndarray, row_labels: List[str], col_labels: List[str],
+                            out_root: str, output_format: str = "csv", name: str = "similarity_matrix") -> str:
+    """
+    Write an (N_in x N_db) similarity matrix and return the file path
+    """
+    fmt = resolve_output_format(output_format)
+    path = os.path.join(out_root, name + FORMAT_EXTENSIONS[fmt])
+
+    if fmt == "csv":
+        pd.DataFrame(matrix, index=row_labels, columns=col_labels).to_csv(path, encoding="utf-8-sig")
+        return path
+
+    values = np.ascontiguousarray(matrix, dtype=np.float32)
+    n_rows, n_cols = values.shape
+
+    if fmt == "npz":
+        np.savez_compressed(
+            path,
+            values=values,
+            row_labels=np.array(row_labels, dtype=str),
+            col_labels=np.array(col_labels, dtype=str),
+        )
+        return path
+
+    # One row per input with a fixed-size float32 list; column labels live in
+    # the schema metadata so they are stored once, not per row
+    scores = pa.FixedSizeListArray.from_arrays(pa.array(values.reshape(-1), type=pa.float32()), n_cols)
+    table = pa.table({"input": pa.array(row_labels, type=pa.string()), "scores": scores})
+    table = table.replace_schema_metadata({
+        MATRIX_LABELS_KEY: json.dumps({"col_labels": list(col_labels)}, ensure_ascii=False).encode("utf-8")
+    })
+    if fmt == "parquet":
+        pq.write_table(table, path)
+    else:
+        feather.write_feather(table, path)
+    return path
+
+
+def read_similarity_matrix(path: str) -> Tuple[np.ndarray, List[str], List[str]]:
+    """
+    Load a matrix written by ``write_similarity_matrix``
+
+    Returns: values (float32 for binary formats), row_labels, col_labels
+    """
+    ext = os.path.splitext(path)[1].lower()
+
+    if ext == ".csv":
+        df = pd.read_csv(path, index_col=0, encoding="utf-8-sig")
+        return df.values, [str(x) for x in df.index], [str(x) for x in df.columns]
+
+    if ext == ".npz":
+        with np.load(path, allow_pickle=False) as data:
+            return data["values"], data["row_labels"].tolist(), data["col_labels"].tolist()
+
+    if not PYARROW_SUPPORT:
+        raise ValueError(f"pyarrow is required to read {path}")
+    table = pq.read_table(path) if ext == ".parquet" else feather.read_table(path)
+    labels = json.loads(table.schema.metadata[MATRIX_LABELS_KEY].decode("utf-8"))
+    col_labels = labels["col_labels"]
+    flat = table.column("scores").combine_chunks().flatten().to_numpy(zero_copy_only=False)
+    values = flat.reshape(table.num_rows, len(col_labels))
+    return values, table.column("input").to_pylist(), col_labels
+
+# ---------------------------
+# Comparison table
+# ---------------------------
+
+def _jsonify_nested(df: pd.DataFrame) -> pd.DataFrame:
+    """Nested list/dict cells are stored as JSON text in binary formats"""
+    out = df.copy()
+    for col in out.columns:
+        if out[col].map(lambda v: isinstance(v, (list, dict))).any():
+            out[col] = out[col].map(lambda v: json.dumps(v, ensure_ascii=False) if isinstance(v, (list, dict)) else v)
+    return out
+
+
+def write_table(df: pd.DataFrame, out_root: str, name: str, output_format: str = "csv") -> str:
+    """Write a DataFrame in the requested format and return the file path"""
+    fmt = resolve_output_format(output_format)
+    path = os.path.join(out_root, name + FORMAT_EXTENSIONS[fmt])
+
+    if fmt == "csv":
+        df.to_csv(path, index=False, encoding="utf-8-sig")
+    elif fmt == "npz":
+        flat = _jsonify_nested(df)
+        arrays = {}
+        for i, col in enumerate(flat.columns):
+            series = flat[col]
+            if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+                arrays[f"col_{i}"] = series.to_numpy()
+            else:
+                arrays[f"col_{i}"] = series.astype(str).to_numpy(dtype=str)
+        np.savez_compressed(path, __columns__=np.array([str(c) for c in flat.columns], dtype=str), **arrays)
+    else:
+        table = pa.Table.from_pandas(_jsonify_nested(df), preserve_index=False)
+        if fmt == "parquet":
+            pq.write_table(table, path)
+        else:
+            feather.write_feather(table, path)
+    return path
+
+
+def read_table(path: str) -> pd.DataFrame:
+    """Load a table written by ``write_table``"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        return pd.read_csv(path, encoding="utf-8-sig")
+    if ext == ".npz":
+        with np.load(path, allow_pickle=False) as data:
+            columns = data["__columns__"].tolist()
+            return pd.DataFrame({c: data[f"col_{i}"] for i, c in enumerate(columns)})
+    if not PYARROW_SUPPORT:
+        raise ValueError(f"pyarrow is required to read {path}")
+    table = pq.read_table(path) if ext == ".parquet" else feather.read_table(path)
+    return table.to_pandas()
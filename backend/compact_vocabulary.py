@@ -0,0 +1,284 @@
+"""
+Compact, memory-mappable vocabulary
+
+A fitted ``TfidfVectorizer`` keeps its vocabulary as a dict of Python
+strings: roughly 100+ bytes per term, millions of terms with word bigrams on
+Thai corpora, and every term is rebuilt object by object when an index is
+unpickled. ``CompactVocabulary`` is a read-only ``Mapping[str, int]`` over a
+single buffer instead:
+
+    header     magic, version, term count, slot count, flags (32 bytes)
+    offsets    int64, N + 1 entries: term i is terms[offsets[i]:offsets[i + 1]]
+    ids        int64 id per term (only when ids are not 0..N-1 in term order)
+    slots      uint32 open-addressing hash table over the terms (CRC-32 of
+               the UTF-8 bytes, linear probing, load <= 0.5); term index + 1,
+               0 = empty
+    terms      every term's UTF-8 bytes, sorted, concatenated
+
+Terms are sorted by code point (the order of their UTF-8 bytes), so for a
+fitted vectorizer ids are the term order and no ids array is stored. The
+buffer pickles as one bytes object, and ``save_index`` / ``load_index``
+write the vocabularies of an index next to its pickle so they are mapped
+read-only from disk on load: the pages come from the OS page cache and are
+shared by every worker process that loads the same index.
+
+Lookups (``vocabulary[term]``, ``get``, ``in``) hash the term and compare
+bytes in the buffer, so it drops in for ``vectorizer.vocabulary_`` (sklearn
+only indexes it and catches ``KeyError``) and for ``BM25Index.vocabulary``.
+"""
+
+import os
+import mmap
+import zlib
+import pickle
+import struct
+from collections.abc import ItemsView, Mapping
+from typing import Iterable, Iterator, List, Optional, Union
+
+import numpy as np
+
+MAGIC = b"CVOC"
+VERSION = 1
+HEADER = struct.Struct("<4sIQQQ")
+EXPLICIT_IDS = 1
+# Recently looked-up terms (hits and misses) kept in a plain dict; query text
+# repeats its terms, so most lookups skip the hash probe. Bounded: cleared when full
+HOT_TERMS = 1 << 16
+
+# ---------------------------
+# Vocabulary
+# ---------------------------
+
+class _Items(ItemsView):
+    def __iter__(self):
+        vocabulary = self._mapping
+        for i, term in enumerate(vocabulary):
+            yield term, vocabulary._id(i)
+
+
+class CompactVocabulary(Mapping):
+    """
+    Read-only term -> id mapping over one contiguous buffer
+
+    Args:
+        buffer: Bytes written by ``from_mapping`` (bytes or a read-only mmap)
+    """
+
+    def __init__(self, buffer: Union[bytes, mmap.mmap]):
+        self._buffer = buffer
+        view = memoryview(buffer)
+        if len(view) < HEADER.size:
+            raise ValueError("Not a compact vocabulary (buffer too small)")
+        magic, version, n_terms, n_slots, flags = HEADER.unpack_from(view)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a compact vocabulary (bad header)")
+        pos = HEADER.size
+        self._offsets = view[pos:pos + 8 * (n_terms + 1)].cast("q")
+        pos += 8 * (n_terms + 1)
+        self._ids = None
+        if flags & EXPLICIT_IDS:
+            self._ids = view[pos:pos + 8 * n_terms].cast("q")
+            pos += 8 * n_terms
+        self._slots = view[pos:pos + 4 * n_slots].cast("I")
+        self._terms = view[pos + 4 * n_slots:]
+        self._n_terms = n_terms
+        self._mask = n_slots - 1
+        self._hot = {}
+        self._positions = None
+
+    @classmethod
+    def from_mapping(cls, vocabulary: Mapping) -> "CompactVocabulary":
+        """Build from any term -> id mapping (e.g. a fitted ``vocabulary_``)"""
+        terms = sorted(vocabulary)
+        n = len(terms)
+        encoded = [term.encode("utf-8") for term in terms]
+        offsets = np.zeros(n + 1, dtype="<i8")
+        np.cumsum(np.fromiter(map(len, encoded), dtype=np.int64, count=n), out=offsets[1:])
+        ids = np.fromiter((vocabulary[term] for term in terms), dtype="<i8", count=n)
+        explicit_ids = not np.array_equal(ids, np.arange(n))
+
+        n_slots = 8
+        while n_slots < 2 * n:
+            n_slots *= 2
+        mask = n_slots - 1
+        slots = [0] * n_slots
+        for i, data in enumerate(encoded):
+            h = zlib.crc32(data) & mask
+            while slots[h]:
+                h = (h + 1) & mask
+            slots[h] = i + 1
+
+        parts = [HEADER.pack(MAGIC, VERSION, n, n_slots, EXPLICIT_IDS if explicit_ids else 0), offsets.tobytes()]
+        if explicit_ids:
+            parts.append(ids.tobytes())
+        parts.append(np.asarray(slots, dtype="<u4").tobytes())
+        parts.append(b"".join(encoded))
+        return cls(b"".join(parts))
+
+    def _find(self, term) -> int:
+        """Position of ``term`` in term order, or -1 (one function: this is the hot path)"""
+        if not isinstance(term, str):
+            return -1
+        try:
+            data = term.encode("utf-8")
+        except UnicodeEncodeError:  # lone surrogates cannot be in the vocabulary
+            return -1
+        slots, offsets, terms, mask = self._slots, self._offsets, self._terms, self._mask
+        n = len(data)
+        h = zlib.crc32(data) & mask
+        while True:
+            s = slots[h]
+            if not s:
+                return -1
+            start = offsets[s - 1]
+            if offsets[s] - start == n and terms[start:start + n] == data:
+                return s - 1
+            h = (h + 1) & mask
+
+    def _id(self, i: int) -> int:
+        return i if self._ids is None else self._ids[i]
+
+    def _lookup(self, term) -> int:
+        """Id of ``term``, or -1"""
+        hot = self._hot
+        i = hot.get(term)
+        if i is None:
+            i = self._find(term)
+            if i >= 0 and self._ids is not None:
+                i = self._ids[i]
+            if len(hot) >= HOT_TERMS:
+                hot.clear()
+            if isinstance(term, str):
+                hot[term] = i
+        return i
+
+    def __getitem__(self, term: str) -> int:
+        i = self._lookup(term)
+        if i < 0:
+            raise KeyError(term)
+        return i
+
+    def get(self, term: str, default: Optional[int] = None) -> Optional[int]:
+        i = self._lookup(term)
+        return default if i < 0 else i
+
+    def __contains__(self, term) -> bool:
+        return self._lookup(term) >= 0
+
+    def __len__(self) -> int:
+        return self._n_terms
+
+    def __iter__(self) -> Iterator[str]:
+        """Terms in sorted order"""
+        offsets, terms = self._offsets, self._terms
+        for i in range(self._n_terms):
+            yield str(terms[offsets[i]:offsets[i + 1]], "utf-8")
+
+    def items(self) -> ItemsView:
+        return _Items(self)
+
+    def terms_for_ids(self, ids: Iterable[int]) -> List[str]:
+        """
+        Terms of the given ids (feature columns), decoding only those terms
+
+        Stands in for ``get_feature_names_out()[ids]`` without building the
+        array of every term.
+        """
+        offsets, terms = self._offsets, self._terms
+        positions = ids
+        if self._ids is not None:
+            if self._positions is None:
+                order = np.argsort(np.asarray(self._ids), kind="stable")
+                self._positions = (np.asarray(self._ids)[order], order)
+            sorted_ids, order = self._positions
+            positions = order[np.searchsorted(sorted_ids, np.asarray(ids, dtype=np.int64))]
+        return [str(terms[offsets[i]:offsets[i + 1]], "utf-8") for i in map(int, positions)]
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._buffer)
+
+    # ---------------------------
+    # Persistence
+    # ---------------------------
+
+    def __reduce__(self):
+        return CompactVocabulary, (bytes(self._buffer),)
+
+    def save(self, path: str) -> None:
+        """Write the buffer to ``path`` (replaced atomically: a mapped old file stays valid)"""
+        tmp = f"{path}.tmp-{os.getpid()}"
+        with open(tmp, "wb") as f:
+            f.write(self._buffer)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str, mmap_mode: bool = True) -> "CompactVocabulary":
+        """Map ``path`` read-only (or read it into memory with ``mmap_mode=False``)"""
+        with open(path, "rb") as f:
+            if mmap_mode:
+                return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            return cls(f.read())
+
+
+def compact_vectorizer(vectorizer):
+    """Replace a fitted vectorizer's vocabulary with a ``CompactVocabulary`` (in place)"""
+    if not isinstance(vectorizer.vocabulary_, CompactVocabulary):
+        vectorizer.vocabulary_ = CompactVocabulary.from_mapping(vectorizer.vocabulary_)
+    # Older scikit-learn also keeps every pruned term; only for introspection
+    if getattr(vectorizer, "stop_words_", None) is not None:
+        vectorizer.stop_words_ = None
+    return vectorizer
+
+# ---------------------------
+# Index files
+# ---------------------------
+
+class _IndexPickler(pickle.Pickler):
+    """Writes each CompactVocabulary to ``<path>.vocab<k>`` instead of into the pickle"""
+
+    def __init__(self, f, path: str):
+        super().__init__(f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.path = path
+        self.saved = {}
+
+    def persistent_id(self, obj):
+        if not isinstance(obj, CompactVocabulary):
+            return None
+        if id(obj) not in self.saved:
+            name = f"{os.path.basename(self.path)}.vocab{len(self.saved)}"
+            obj.save(os.path.join(os.path.dirname(self.path), name))
+            self.saved[id(obj)] = ("vocabulary", name)
+        return self.saved[id(obj)]
+
+
+class _IndexUnpickler(pickle.Unpickler):
+    def __init__(self, f, path: str, mmap_mode: bool):
+        super().__init__(f)
+        self.root = os.path.dirname(path)
+        self.mmap_mode = mmap_mode
+
+    def persistent_load(self, pid):
+        kind, name = pid
+        if kind != "vocabulary":
+            raise pickle.UnpicklingError(f"Unknown persistent object: {kind}")
+        return CompactVocabulary.load(os.path.join(self.root, name), self.mmap_mode)
+
+
+def save_index(obj, path: str) -> None:
+    """
+    Pickle ``obj`` to ``path`` with its vocabularies in files next to it
+
+    Every file is replaced atomically, so processes that already loaded (and
+    mapped) the previous version keep working.
+    """
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, "wb") as f:
+        _IndexPickler(f, path).dump(obj)
+    os.replace(tmp, path)
+
+
+def load_index(path: str, mmap_mode: bool = True):
+    """Unpickle a ``save_index`` file (plain pickles load too), mapping its vocabularies"""
+    with open(path, "rb") as f:
+        return _IndexUnpickler(f, path, mmap_mode).load()
@@ -0,0 +1,237 @@
+"""
+Concurrent corpus file reading with encoding detection
+
+``read_txt`` used to decode every file as UTF-8 with ``errors="ignore"``, so
+Thai files saved as TIS-620 / cp874 lost all of their Thai characters
+without a warning. ``decode_text`` detects the encoding instead:
+
+    1. byte order mark     utf-8-sig, utf-16
+    2. strict UTF-8        (pure ASCII included), the common case
+    3. Thai codepage       almost all non-ASCII bytes in the TIS-620 range
+                           0xA1-0xFB, and the cp874 decoding reads as Thai
+                           (see ``looks_thai``) -> cp874 (a superset of TIS-620)
+    4. fallback            UTF-8 dropping invalid bytes (as before), and the
+                           number of invalid sequences is reported
+
+``CorpusReader`` reads and decodes files on a thread pool, keeping at most
+``read_ahead`` files in flight, and yields them in the order given, so a
+streamed corpus is still consumed one document at a time. Per-file
+statistics (size, encoding, read and decode time, invalid sequences) and a
+summary are kept on the reader.
+
+Usage:
+    python corpus_reader.py --db ./database --workers 8 --out decode_stats.json
+"""
+
+import re
+import json
+import time
+import codecs
+import argparse
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+DEFAULT_WORKERS = 8
+THAI_RANGE = bytes(range(0xA1, 0xFC))
+# cp874 bytes below the Thai range: euro sign, ellipsis, curly quotes, bullet, dashes
+CP874_EXTRAS = bytes([0x80, 0x85, 0x91, 0x92, 0x93, 0x94, 0x95, 0x96, 0x97])
+ASCII = bytes(range(0x80))
+THAI_CODEPAGE_RATIO = 0.95
+# Latin-1 / cp1252 accented letters fall in the same byte range (é -> Thai tone
+# mark), so the decoded text must also be Thai: a share of its letters, and
+# vowels / tone marks placed around consonants as Thai spelling requires
+THAI_MIN_LETTER_SHARE = 0.3
+THAI_LETTER = re.compile(r"[\u0e01-\u0e2e\u0e30-\u0e3a\u0e40-\u0e4e]")
+# Vowels and marks written after a consonant (or after another such mark)
+THAI_MISPLACED_MARK = re.compile(
+    r"(?<![\u0e01-\u0e2e\u0e30-\u0e3a\u0e45\u0e47-\u0e4e])[\u0e30-\u0e3a\u0e45\u0e47-\u0e4e]")
+# Leading vowels (เ แ โ ใ ไ) written before a consonant
+THAI_MISPLACED_LEADING_VOWEL = re.compile(r"[\u0e40-\u0e44](?![\u0e01-\u0e2e])")
+
+# ---------------------------
+# Decoding
+# ---------------------------
+
+def looks_thai(text: str) -> bool:
+    """Whether ``text`` (a cp874 decoding) has the structure of Thai writing"""
+    thai = len(THAI_LETTER.findall(text))
+    letters = sum(1 for ch in text if ch.isalpha())
+    if not thai or thai < THAI_MIN_LETTER_SHARE * letters:
+        return False
+    misplaced = len(THAI_MISPLACED_MARK.findall(text)) + len(THAI_MISPLACED_LEADING_VOWEL.findall(text))
+    return misplaced <= (1 - THAI_CODEPAGE_RATIO) * thai
+
+
+def decode_text(data: bytes) -> Tuple[str, str, int]:
+    """
+    Decode file contents with encoding detection
+
+    Returns: (text, encoding, invalid byte sequences dropped or replaced)
+    """
+    if data.startswith(codecs.BOM_UTF8):
+        return data[len(codecs.BOM_UTF8):].decode("utf-8", errors="replace"), "utf-8-sig", 0
+    if data.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        text = data.decode("utf-16", errors="replace")
+        return text, "utf-16", text.count("�")
+    try:
+        return data.decode("utf-8"), "utf-8", 0
+    except UnicodeDecodeError:
+        pass
+
+    high = data.translate(None, ASCII)
+    if high:
+        thai = len(high) - len(high.translate(None, THAI_RANGE + CP874_EXTRAS))
+        if thai / len(high) >= THAI_CODEPAGE_RATIO:
+            text = data.decode("cp874", errors="replace")
+            if looks_thai(text):
+                return text, "cp874", text.count("�")
+
+    # Not UTF-8 and not Thai: keep the previous behaviour (drop invalid bytes)
+    replaced = data.decode("utf-8", errors="replace")
+    text = data.decode("utf-8", errors="ignore")
+    return text, "utf-8", replaced.count("�") - text.count("�")
+
+
+@dataclass
+class FileDecodeStats:
+    path: str
+    bytes: int
+    encoding: str
+    invalid_sequences: int
+    read_ms: float
+    decode_ms: float
+
+
+def read_text_file(path: str) -> Tuple[str, FileDecodeStats]:
+    """Read and decode one file"""
+    start = time.perf_counter()
+    with open(path, "rb") as f:
+        data = f.read()
+    read_done = time.perf_counter()
+    text, encoding, invalid = decode_text(data)
+    decoded = time.perf_counter()
+    return text, FileDecodeStats(
+        path=path,
+        bytes=len(data),
+        encoding=encoding,
+        invalid_sequences=invalid,
+        read_ms=round((read_done - start) * 1000, 3),
+        decode_ms=round((decoded - read_done) * 1000, 3),
+    )
+
+# ---------------------------
+# Concurrent reading
+# ---------------------------
+
+class CorpusReader:
+    """
+    Ordered, bounded read-ahead over a thread pool
+
+    Args:
+        workers: Reader threads (0 = read in the calling thread)
+        read_ahead: Files read but not yet consumed, at most (default: 4 x workers)
+    """
+
+    def __init__(self, workers: int = DEFAULT_WORKERS, read_ahead: Optional[int] = None):
+        self.workers = max(0, workers)
+        self.read_ahead = max(1, read_ahead or 4 * max(1, self.workers))
+        self.file_stats: List[FileDecodeStats] = []
+        self._wall = 0.0
+
+    def iter_files(self, paths: Iterable[str]) -> Iterator[Tuple[str, str, FileDecodeStats]]:
+        """Yield (path, text, stats) in the order of ``paths``"""
+        started = time.perf_counter()
+        try:
+            if not self.workers:
+                for path in paths:
+                    text, stats = read_text_file(path)
+                    self.file_stats.append(stats)
+                    yield path, text, stats
+                return
+
+            paths = iter(paths)
+            pending = deque()
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="corpus-reader") as executor:
+                try:
+                    for path in paths:
+                        pending.append((path, executor.submit(read_text_file, path)))
+                        if len(pending) >= self.read_ahead:
+                            break
+                    while pending:
+                        path, future = pending.popleft()
+                        text, stats = future.result()
+                        # Keep the window full: one new read per consumed file
+                        for next_path in paths:
+                            pending.append((next_path, executor.submit(read_text_file, next_path)))
+                            break
+                        self.file_stats.append(stats)
+                        yield path, text, stats
+                finally:
+                    # Consumer stopped early (or a read failed): drop queued reads
+                    for _, future in pending:
+                        future.cancel()
+        finally:
+            self._wall += time.perf_counter() - started
+
+    def texts(self, paths: Iterable[str]) -> Iterator[str]:
+        """Decoded texts in the order of ``paths``"""
+        for _, text, _ in self.iter_files(paths):
+            yield text
+
+    def summary(self) -> Dict:
+        """Totals over every file read so far"""
+        stats = self.file_stats
+        total_bytes = sum(s.bytes for s in stats)
+        return {
+            "files": len(stats),
+            "bytes": total_bytes,
+            "encodings": dict(Counter(s.encoding for s in stats)),
+            "files_with_invalid_bytes": sum(1 for s in stats if s.invalid_sequences),
+            "invalid_sequences": sum(s.invalid_sequences for s in stats),
+            "read_seconds": round(sum(s.read_ms for s in stats) / 1000, 4),
+            "decode_seconds": round(sum(s.decode_ms for s in stats) / 1000, 4),
+            "wall_seconds": round(self._wall, 4),
+            "mb_per_second": round(total_bytes / self._wall / 1e6, 2) if self._wall > 0 else None,
+            "workers": self.workers,
+        }
+
+    def report(self) -> Dict:
+        """Summary plus the per-file statistics"""
+        return {"summary": self.summary(), "files": [asdict(s) for s in self.file_stats]}
+
+    def print_summary(self) -> None:
+        s = self.summary()
+        encodings = ", ".join(f"{enc}={n}" for enc, n in sorted(s["encodings"].items()))
+        print(f"📖 Read {s['files']} files ({s['bytes'] / 1e6:.2f}MB) in {s['wall_seconds']:.2f}s "
+              f"with {s['workers']} reader threads; encodings: {encodings or 'none'}")
+        if s["files_with_invalid_bytes"]:
+            print(f"⚠️  {s['files_with_invalid_bytes']} file(s) had {s['invalid_sequences']} undecodable byte sequence(s)")
+
+# ---------------------------
+# CLI
+# ---------------------------
+
+def main():
+    from novel_similarity_pipeline import iter_database
+
+    parser = argparse.ArgumentParser(description="Read a corpus and report per-file encoding and decode cost")
+    parser.add_argument("--db", required=True, help="Database root folder (<db>/<genre>/**/*.txt)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Reader threads (0 = serial)")
+    parser.add_argument("--read_ahead", type=int, default=None, help="Files read ahead of the consumer")
+    parser.add_argument("--out", default=None, help="Write the per-file report as JSON")
+    args = parser.parse_args()
+
+    reader = CorpusReader(args.workers, args.read_ahead)
+    for _ in reader.iter_files(path for path, _ in iter_database(args.db, max_files_per_genre=None)):
+        pass
+    reader.print_summary()
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(reader.report(), f, ensure_ascii=False, indent=2)
+        print(f"💾 Saved: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
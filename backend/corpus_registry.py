@@ -0,0 +1,209 @@
+"""
+Registered corpora: upload a database once, query it many times
+
+Each corpus lives in its own folder under the registry root:
+
+    <root>/<corpus_id>/manifest.json   name, size, genres, content hash
+    <root>/<corpus_id>/db/             extracted database (<genre>/.../*.txt)
+    <root>/<corpus_id>/texts/          memory-mapped text store (see text_store.py)
+    <root>/<corpus_id>/index.pkl       fitted SimilarityEngine, with its
+                                       vocabularies in index.pkl.vocab<k>
+                                       (memory-mapped, see compact_vocabulary.py)
+
+Corpora survive restarts because everything is on disk; once a corpus has
+been used its engine stays resident in memory. Document text is only read
+from the text store, which is mapped rather than loaded.
+"""
+
+import re
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import zipfile
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from corpus_reader import CorpusReader
+from similarity_engine import SimilarityEngine
+from text_store import TextStore, build_text_store
+
+MANIFEST_FILE = "manifest.json"
+INDEX_FILE = "index.pkl"
+TEXT_STORE_DIR = "texts"
+# Ids are generated by register (first 8 hex digits of a UUID4); anything else
+# from a URL is rejected before it becomes a path
+CORPUS_ID_PATTERN = re.compile(r"[0-9a-f]{8}")
+
+
+def file_sha256(path: Path, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class CorpusRegistry:
+    """
+    Persistent registry of fitted corpus indexes
+
+    Args:
+        root: Directory holding one folder per registered corpus
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._engines: Dict[str, SimilarityEngine] = {}
+        self._stores: Dict[str, TextStore] = {}
+
+    @staticmethod
+    def valid_id(corpus_id: str) -> bool:
+        return bool(CORPUS_ID_PATTERN.fullmatch(corpus_id or ""))
+
+    def corpus_dir(self, corpus_id: str) -> Path:
+        """
+        Folder of a corpus; every path accessor goes through here
+
+        Raises: KeyError for ids not in the generated format (e.g. "..")
+        """
+        if not self.valid_id(corpus_id):
+            raise KeyError(f"Unknown corpus: {corpus_id}")
+        return self.root / corpus_id
+
+    def db_root(self, corpus_id: str) -> Path:
+        return self.corpus_dir(corpus_id) / "db"
+
+    def index_path(self, corpus_id: str) -> Path:
+        return self.corpus_dir(corpus_id) / INDEX_FILE
+
+    def text_store_root(self, corpus_id: str) -> Path:
+        return self.corpus_dir(corpus_id) / TEXT_STORE_DIR
+
+    def exists(self, corpus_id: str) -> bool:
+        return self.valid_id(corpus_id) and (self.corpus_dir(corpus_id) / MANIFEST_FILE).exists()
+
+    def register(self, zip_path: Path, name: Optional[str] = None) -> Dict:
+        """
+        Extract a database ZIP, fit its index and persist both
+
+        Raises: ValueError if the ZIP cannot be extracted or holds no documents
+        """
+        corpus_id = str(uuid.uuid4())[:8]
+        corpus_dir = self.corpus_dir(corpus_id)
+        db_dir = self.db_root(corpus_id)
+        db_dir.mkdir(parents=True)
+        try:
+            try:
+                with zipfile.ZipFile(zip_path, "r") as zip_ref:
+                    zip_ref.extractall(db_dir)
+            except Exception as e:
+                raise ValueError(f"Failed to extract database ZIP: {str(e)}")
+
+            reader = CorpusReader()
+            try:
+                # A registered corpus is indexed in full (no per-genre sample)
+                store = build_text_store(str(db_dir), str(self.text_store_root(corpus_id)),
+                                         max_files_per_genre=None, reader=reader)
+            except SystemExit as e:
+                # iter_database reports layout problems with SystemExit
+                raise ValueError(str(e))
+            engine = SimilarityEngine.from_text_store(store)
+            engine.save(str(corpus_dir / INDEX_FILE))
+
+            manifest = {
+                "corpus_id": corpus_id,
+                "name": name or Path(zip_path).stem,
+                "created_at": time.time(),
+                "documents": engine.size,
+                "genres": sorted(set(engine.genres)),
+                "zip_sha256": file_sha256(Path(zip_path)),
+                "decoding": reader.summary(),
+            }
+            with open(corpus_dir / MANIFEST_FILE, "w", encoding="utf-8") as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2)
+        except Exception:
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+            raise
+
+        with self._lock:
+            self._engines[corpus_id] = engine
+            self._stores[corpus_id] = store
+        return manifest
+
+    def manifest(self, corpus_id: str) -> Dict:
+        with open(self.corpus_dir(corpus_id) / MANIFEST_FILE, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        with self._lock:
+            manifest["loaded"] = corpus_id in self._engines
+        return manifest
+
+    def list(self) -> List[Dict]:
+        manifests = []
+        for entry in sorted(self.root.iterdir()):
+            if entry.is_dir() and self.valid_id(entry.name) and (entry / MANIFEST_FILE).exists():
+                manifests.append(self.manifest(entry.name))
+        return sorted(manifests, key=lambda m: m["created_at"])
+
+    def get_engine(self, corpus_id: str) -> SimilarityEngine:
+        """
+        Return the corpus engine, loading it from disk on first use
+
+        Raises: KeyError for unknown corpus ids
+        """
+        with self._lock:
+            engine = self._engines.get(corpus_id)
+        if engine is not None:
+            return engine
+        if not self.exists(corpus_id):
+            raise KeyError(f"Unknown corpus: {corpus_id}")
+        engine = SimilarityEngine.load(str(self.corpus_dir(corpus_id) / INDEX_FILE))
+        with self._lock:
+            # Another thread may have loaded it meanwhile; keep the first one
+            return self._engines.setdefault(corpus_id, engine)
+
+    def text_store(self, corpus_id: str) -> TextStore:
+        """
+        Return the corpus text store, mapping it on first use
+
+        Raises: KeyError for unknown corpus ids and for corpora registered
+        before text stores existed
+        """
+        with self._lock:
+            store = self._stores.get(corpus_id)
+        if store is not None:
+            return store
+        root = self.text_store_root(corpus_id)
+        if not self.exists(corpus_id) or not TextStore.exists(str(root)):
+            raise KeyError(f"No text store for corpus: {corpus_id}")
+        store = TextStore(str(root))
+        with self._lock:
+            kept = self._stores.setdefault(corpus_id, store)
+        if kept is not store:
+            store.close()
+        return kept
+
+    def save_engine(self, corpus_id: str) -> None:
+        """Persist the resident engine again (e.g. after attaching a router)"""
+        engine = self.get_engine(corpus_id)
+        # Replaced atomically, vocabulary files included (see compact_vocabulary.save_index)
+        engine.save(str(self.corpus_dir(corpus_id) / INDEX_FILE))
+
+    def drop(self, corpus_id: str) -> bool:
+        """Forget a corpus and delete its files (False for unknown or invalid ids)"""
+        if not self.valid_id(corpus_id):
+            return False
+        with self._lock:
+            self._engines.pop(corpus_id, None)
+            store = self._stores.pop(corpus_id, None)
+        if store is not None:
+            store.close()
+        corpus_dir = self.corpus_dir(corpus_id)
+        if not corpus_dir.exists():
+            return False
+        shutil.rmtree(corpus_dir, ignore_errors=True)
+        return True
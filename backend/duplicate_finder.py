@@ -0,0 +1,229 @@
+"""
+Corpus-wide self-similarity: find duplicate and near-copied chapters
+
+Compares every database document with every other one without building the
+full N x N matrix. The TF-IDF matrix is multiplied in square tiles (a row
+block against one column block at a time, upper triangle only), and each
+tile is filtered to the pairs at or above the threshold before the next one
+is built. Row blocks are scored on a process pool, so a 100k+ document corpus
+uses all cores while each product stays bounded by block_size x block_size.
+
+Pairs are grouped into duplicate clusters (connected components of the pair
+graph) and exported with the ``extract_novel_info`` metadata of each member.
+
+Usage:
+    python duplicate_finder.py --db ./db --out ./duplicates --threshold 0.9
+"""
+
+import os
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+from columnar_io import OUTPUT_FORMATS, write_table
+from corpus_reader import CorpusReader
+from novel_similarity_pipeline import iter_database, make_vectorizer, simple_preprocess
+
+DEFAULT_THRESHOLD = 0.90
+DEFAULT_BLOCK_SIZE = 512
+
+# ---------------------------
+# Blocked all-pairs similarity
+# ---------------------------
+
+_worker_matrix = None
+
+def _init_worker(X) -> None:
+    # The matrix is sent once per worker process, not once per block
+    global _worker_matrix
+    _worker_matrix = X
+
+def _score_block(start: int, stop: int, threshold: float, X=None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Pairs (i, j, score) with start <= i < stop, j > i and score >= threshold"""
+    X = _worker_matrix if X is None else X
+    row_block = X[start:stop]
+    parts = []
+    # Column tiles as wide as the row block: one tile's product is alive at a time
+    for col_start, col_stop in iter_block_bounds(X.shape[0], stop - start, start):
+        # Rows are L2-normalised by TfidfVectorizer, so the dot product is the cosine
+        tile = (row_block @ X[col_start:col_stop].T).tocoo()
+        rows = tile.row + start
+        cols = tile.col + col_start
+        keep = (cols > rows) & (tile.data >= threshold)
+        parts.append((rows[keep].astype(np.int64), cols[keep].astype(np.int64), tile.data[keep].astype(np.float32)))
+    return tuple(np.concatenate(p) for p in zip(*parts))
+
+def iter_block_bounds(n_docs: int, block_size: int, first: int = 0) -> Iterator[Tuple[int, int]]:
+    for start in range(first, n_docs, block_size):
+        yield start, min(start + block_size, n_docs)
+
+def similar_pairs(X, threshold: float = DEFAULT_THRESHOLD,
+                  block_size: int = DEFAULT_BLOCK_SIZE,
+                  workers: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    All document pairs with cosine similarity >= threshold
+
+    Args:
+        X: Sparse TF-IDF matrix with L2-normalised rows (N x V)
+        block_size: Rows and columns per tile; bounds peak memory
+        workers: Worker processes (None = all cores, 1 = in-process)
+
+    Returns: (i, j, score) arrays with i < j
+    """
+    X = X.tocsr()
+    n_docs = X.shape[0]
+    bounds = list(iter_block_bounds(n_docs, block_size))
+    workers = workers or os.cpu_count() or 1
+
+    if workers <= 1 or len(bounds) <= 1:
+        parts = [_score_block(start, stop, threshold, X) for start, stop in bounds]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(bounds)),
+                                 initializer=_init_worker, initargs=(X,)) as pool:
+            futures = [pool.submit(_score_block, start, stop, threshold) for start, stop in bounds]
+            parts = [f.result() for f in futures]
+
+    if not parts:
+        empty = np.array([], dtype=np.int64)
+        return empty, empty, np.array([], dtype=np.float32)
+    rows, cols, scores = (np.concatenate(p) for p in zip(*parts))
+    return rows, cols, scores
+
+# ---------------------------
+# Clustering
+# ---------------------------
+
+def duplicate_clusters(n_docs: int, rows: np.ndarray, cols: np.ndarray, scores: np.ndarray,
+                       metadata: List[Dict]) -> List[Dict]:
+    """
+    Group pairs into clusters (connected components); singletons are dropped
+
+    Returns: clusters sorted by size then best similarity, each with member
+    metadata and its internal pairs
+    """
+    if len(rows) == 0:
+        return []
+    graph = coo_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)), shape=(n_docs, n_docs))
+    _, component = connected_components(graph, directed=False)
+
+    # Sort pairs and documents by component once, then slice each component
+    # out (a mask per component would be quadratic in the number of clusters)
+    pair_component = component[rows]
+    pair_order = np.argsort(pair_component, kind="stable")
+    _, pair_starts = np.unique(pair_component[pair_order], return_index=True)
+    docs = np.unique(np.concatenate([rows, cols]))
+    doc_component = component[docs]
+    doc_order = np.argsort(doc_component, kind="stable")
+    _, doc_starts = np.unique(doc_component[doc_order], return_index=True)
+
+    clusters = []
+    for in_comp, members in zip(np.split(pair_order, pair_starts[1:]),
+                                np.split(docs[doc_order], doc_starts[1:])):
+        order = in_comp[np.argsort(-scores[in_comp], kind="stable")]
+        members = members.tolist()
+        clusters.append({
+            "size": len(members),
+            "max_similarity": round(float(scores[order[0]]), 4),
+            "min_similarity": round(float(scores[order[-1]]), 4),
+            "genres": sorted({metadata[m]["genre"] for m in members}),
+            "members": [dict(metadata[m], doc_index=m) for m in members],
+            "pairs": [
+                {"a": int(rows[p]), "b": int(cols[p]), "similarity": round(float(scores[p]), 4)}
+                for p in order
+            ]
+        })
+
+    clusters.sort(key=lambda c: (-c["size"], -c["max_similarity"]))
+    for cid, cluster in enumerate(clusters):
+        cluster["cluster_id"] = cid
+    return clusters
+
+# ---------------------------
+# Job
+# ---------------------------
+
+def find_duplicates(X, metadata: List[Dict],
+                    threshold: float = DEFAULT_THRESHOLD,
+                    block_size: int = DEFAULT_BLOCK_SIZE,
+                    workers: Optional[int] = None) -> Dict:
+    """Pairs and clusters for an already vectorised corpus"""
+    started = time.time()
+    rows, cols, scores = similar_pairs(X, threshold, block_size, workers)
+    clusters = duplicate_clusters(X.shape[0], rows, cols, scores, metadata)
+    return {
+        "summary": {
+            "documents": X.shape[0],
+            "threshold": threshold,
+            "pairs": int(len(rows)),
+            "clusters": len(clusters),
+            "documents_in_clusters": sum(c["size"] for c in clusters),
+            "seconds": round(time.time() - started, 3)
+        },
+        "clusters": clusters,
+        "pairs": (rows, cols, scores)
+    }
+
+def pairs_frame(rows: np.ndarray, cols: np.ndarray, scores: np.ndarray, metadata: List[Dict]) -> pd.DataFrame:
+    order = np.argsort(-scores, kind="stable")
+    return pd.DataFrame({
+        "doc_a": [metadata[i]["display_name"] for i in rows[order]],
+        "genre_a": [metadata[i]["genre"] for i in rows[order]],
+        "doc_b": [metadata[j]["display_name"] for j in cols[order]],
+        "genre_b": [metadata[j]["genre"] for j in cols[order]],
+        "similarity": np.round(scores[order].astype(float), 4),
+    })
+
+def run_duplicate_job(db_root: str, out_root: str,
+                      threshold: float = DEFAULT_THRESHOLD,
+                      block_size: int = DEFAULT_BLOCK_SIZE,
+                      workers: Optional[int] = None,
+                      output_format: str = "csv") -> Dict:
+    """Load every database file, find duplicate clusters and write them out"""
+    os.makedirs(out_root, exist_ok=True)
+    files = list(iter_database(db_root, max_files_per_genre=None))
+    if not files:
+        raise SystemExit("No .txt files found in the database.")
+    metadata = [info for _, info in files]
+    print(f"📚 Vectorising {len(files)} database documents")
+    # Streamed: only the reader's read-ahead window is held in memory
+    reader = CorpusReader()
+    X = make_vectorizer().fit_transform(simple_preprocess(text) for text in reader.texts(path for path, _ in files))
+    reader.print_summary()
+
+    result = find_duplicates(X, metadata, threshold, block_size, workers)
+    clusters_path = os.path.join(out_root, "duplicate_clusters.json")
+    with open(clusters_path, "w", encoding="utf-8") as f:
+        json.dump({"summary": result["summary"], "clusters": result["clusters"]}, f,
+                  ensure_ascii=False, separators=(",", ":"))
+    pairs_path = write_table(pairs_frame(*result["pairs"], metadata), out_root, "duplicate_pairs", output_format)
+
+    print(f"✅ {result['summary']['pairs']} pairs in {result['summary']['clusters']} clusters")
+    return {"summary": result["summary"], "outputs": {"clusters": clusters_path, "pairs": pairs_path}}
+
+# ---------------------------
+# CLI
+# ---------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Find duplicate / near-copied documents inside a database.")
+    parser.add_argument("--db", default="./db", help="Database root folder (expects ./db/<genre>/*.txt).")
+    parser.add_argument("--out", default="./duplicates", help="Output folder.")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Minimum cosine similarity of a pair.")
+    parser.add_argument("--block_size", type=int, default=DEFAULT_BLOCK_SIZE, help="Rows and columns per tile (bounds memory).")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores).")
+    parser.add_argument("--output_format", choices=OUTPUT_FORMATS, default="csv",
+                        help="Format for the pair table (parquet/arrow need pyarrow, else npz).")
+    args = parser.parse_args()
+
+    results = run_duplicate_job(args.db, args.out, args.threshold, args.block_size, args.workers, args.output_format)
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
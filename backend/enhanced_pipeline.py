@@ -1,6 +1,14 @@
 """
 Enhanced Novel Similarity Pipeline with Thai Language Support
 Extended version of the original pipeline with additional features
+
+Tokenization modes (``--tokenization``):
+    words        word tokens; Thai is segmented with pythainlp ``newmm``
+    char_ngrams  character 2-4-grams, no segmentation (much faster for Thai;
+                 see benchmark_tokenization.py for throughput and ranking
+                 agreement with ``newmm``)
+    auto         words, except Thai without pythainlp, where the ``\\b\\w+\\b``
+                 fallback splits only on spaces and char_ngrams is used instead
 """
 
 import os
@@ -11,13 +19,12 @@ import glob
 import math
 import string
 import argparse
+from functools import partial
 from typing import List, Dict, Tuple, Optional
-import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import networkx as nx
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 
 # Thai language support
 try:
@@ -30,19 +37,36 @@ except ImportError:
     print("⚠️  Thai language support (pythainlp) is not available")
 
 # Import original functions
+from corpus_reader import CorpusReader
 from novel_similarity_pipeline import (
-    read_txt, 
     make_vectorizer,
     annotate_heatmap,
     plot_heatmap, 
     plot_network,
-    classify_relation
+    classify_relation,
+    top_k_order
 )
+from similarity_engine import SimilarityEngine
+from columnar_io import OUTPUT_FORMATS, write_similarity_matrix, write_table
+from network_export import NETWORK_FILE, build_network, network_edges, write_network
+from profiling import StageProfiler, profile_stage
 
 # ---------------------------
 # Enhanced Text Processing
 # ---------------------------
 
+TOKENIZATIONS = ("auto", "words", "char_ngrams")
+CHAR_NGRAM_RANGE = (2, 4)
+CHAR_NGRAM_MAX_FEATURES = 50000
+
+def resolve_tokenization(language: str, tokenization: str = "auto") -> str:
+    """Concrete tokenization mode ('words' or 'char_ngrams') for a language"""
+    if tokenization not in TOKENIZATIONS:
+        raise ValueError(f"Unknown tokenization '{tokenization}'. Expected one of: {', '.join(TOKENIZATIONS)}")
+    if tokenization == "auto":
+        return "char_ngrams" if language == "thai" and not THAI_SUPPORT else "words"
+    return tokenization
+
 def detect_language(text: str) -> str:
     """
     Simple language detection for Thai vs other languages
@@ -56,13 +80,14 @@ def detect_language(text: str) -> str:
     thai_ratio = thai_chars / total_chars
     return 'thai' if thai_ratio > 0.3 else 'other'
 
-def enhanced_preprocess(text: str, language: str = 'auto') -> str:
+def enhanced_preprocess(text: str, language: str = 'auto', tokenization: str = 'words') -> str:
     """
     Enhanced preprocessing with Thai language support
     
     Args:
         text: Input text
         language: 'auto', 'thai', or 'other'
+        tokenization: 'words' or 'char_ngrams' (no word segmentation)
     
     Returns:
         Preprocessed text
@@ -74,6 +99,9 @@ def enhanced_preprocess(text: str, language: str = 'auto') -> str:
     text = text.replace("\n", " ").replace("\r", " ")
     text = re.sub(r"\s+", " ", text).strip()
     
+    if tokenization == 'char_ngrams':
+        # The vectorizer works on characters; only normalise case, punctuation and spaces
+        return preprocess_general_text(text)
     if language == 'thai' and THAI_SUPPORT:
         return preprocess_thai_text(text)
     else:
@@ -131,10 +159,20 @@ def preprocess_general_text(text: str) -> str:
     
     return text
 
-def make_enhanced_vectorizer(language: str = 'auto') -> TfidfVectorizer:
+def make_enhanced_vectorizer(language: str = 'auto', tokenization: str = 'words') -> TfidfVectorizer:
     """
     Create TfidfVectorizer optimized for the detected language
     """
+    if tokenization == 'char_ngrams':
+        # Character n-grams within whitespace-separated runs; Thai needs no segmenter
+        return TfidfVectorizer(
+            analyzer='char_wb',
+            ngram_range=CHAR_NGRAM_RANGE,
+            min_df=1,
+            max_df=0.95,
+            sublinear_tf=True,
+            max_features=CHAR_NGRAM_MAX_FEATURES
+        )
     if language == 'thai' and THAI_SUPPORT:
         # Thai-optimized settings
         return TfidfVectorizer(
@@ -236,7 +274,8 @@ def extract_input_info(filename: str) -> Dict[str, str]:
 # Enhanced Database Loading
 # ---------------------------
 
-def load_database_enhanced(db_root: str, max_files_per_genre: int = 10) -> Tuple[List[str], List[Dict[str, str]], List[str], str]:
+def load_database_enhanced(db_root: str, max_files_per_genre: int = 10,
+                           tokenization: str = 'auto') -> Tuple[List[str], List[Dict[str, str]], List[str], str]:
     """
     Enhanced database loading with language detection and detailed file info
     
@@ -253,13 +292,13 @@ def load_database_enhanced(db_root: str, max_files_per_genre: int = 10) -> Tuple
     if not genre_dirs:
         raise SystemExit(f"No genre subfolders inside {db_root}. Expected: {db_root}/<genre>/*.txt")
     
+    reader = CorpusReader()
     for g in genre_dirs:
         gpath = os.path.join(db_root, g)
         files = sorted(glob.glob(os.path.join(gpath, "**", "*.txt"), recursive=True))
         files = files[:max_files_per_genre]
         
-        for p in files:
-            raw_text = read_txt(p)
+        for p, raw_text in zip(files, reader.texts(files)):
             all_text_sample += raw_text[:1000]  # Sample for language detection
             
             # Extract detailed file information
@@ -271,17 +310,20 @@ def load_database_enhanced(db_root: str, max_files_per_genre: int = 10) -> Tuple
     
     if not texts:
         raise SystemExit("No .txt files found in the database.")
+    reader.print_summary()
     
     # Detect language from sample
     detected_language = detect_language(all_text_sample)
     print(f"🔍 Detected language: {detected_language}")
     
     # Preprocess all texts with detected language
-    processed_texts = [enhanced_preprocess(text, detected_language) for text in texts]
+    mode = resolve_tokenization(detected_language, tokenization)
+    processed_texts = [enhanced_preprocess(text, detected_language, mode) for text in texts]
     
     return processed_texts, file_info_list, genres, detected_language
 
-def load_inputs_enhanced(input_root: str, language: str = 'auto', max_files: int = 5) -> Tuple[List[str], List[Dict[str, str]]]:
+def load_inputs_enhanced(input_root: str, language: str = 'auto', max_files: int = 5,
+                         tokenization: str = 'auto') -> Tuple[List[str], List[Dict[str, str]]]:
     """
     Enhanced input loading with language-aware preprocessing and detailed file info
     
@@ -302,13 +344,14 @@ def load_inputs_enhanced(input_root: str, language: str = 'auto', max_files: int
         files = files[:max_files]
     
     # Read and preprocess texts
-    raw_texts = [read_txt(p) for p in files]
+    raw_texts = list(CorpusReader().texts(files))
     
     # If language is auto, detect from first file
     if language == 'auto' and raw_texts:
         language = detect_language(raw_texts[0])
     
-    processed_texts = [enhanced_preprocess(text, language) for text in raw_texts]
+    mode = resolve_tokenization(language, tokenization)
+    processed_texts = [enhanced_preprocess(text, language, mode) for text in raw_texts]
     
     # Extract detailed input information
     input_info_list = []
@@ -327,75 +370,85 @@ def run_enhanced_pipeline(db_root: str, input_root: str, out_root: str,
                          k_neighbors: int = 3,
                          dup_threshold: float = 0.90,
                          similar_threshold: float = 0.60,
-                         max_files_per_genre: int = 10):
+                         max_files_per_genre: int = 10,
+                         output_format: str = "csv",
+                         network_png: bool = True,
+                         tokenization: str = "auto"):
     """
     Enhanced similarity analysis pipeline with Thai language support
+
+    tokenization: 'auto', 'words' or 'char_ngrams' (see module docstring)
     """
     print("🚀 Starting Enhanced Novel Similarity Analysis")
     
     os.makedirs(out_root, exist_ok=True)
 
     # 1) Load database with language detection
+    profile_stage("1) Load database with language detection")
     print("📚 Loading database...")
-    db_texts, db_labels, db_genres, detected_language = load_database_enhanced(
-        db_root, max_files_per_genre
+    db_texts, db_file_info_list, db_genres, detected_language = load_database_enhanced(
+        db_root, max_files_per_genre, tokenization
     )
+    tokenization = resolve_tokenization(detected_language, tokenization)
+    print(f"🔤 Tokenization: {tokenization}")
+    db_labels = [info['full_name'] for info in db_file_info_list]
     print(f"📊 Loaded {len(db_texts)} documents from {len(set(db_genres))} genres")
 
     # 2) Load inputs with same language setting
+    profile_stage("2) Load inputs with same language setting")
     print("📝 Loading input files...")
-    in_texts, in_labels = load_inputs_enhanced(input_root, detected_language, max_files=5)
+    in_texts, in_info_list = load_inputs_enhanced(input_root, detected_language, max_files=5,
+                                                  tokenization=tokenization)
+    in_labels = [info['input_full_name'] for info in in_info_list]
     print(f"🎯 Loaded {len(in_texts)} input files")
 
-    # 3) Create language-appropriate vectorizer
-    print("🔧 Creating vectorizer...")
-    vec = make_enhanced_vectorizer(detected_language)
-    
-    # 4) Vectorize texts
-    print("🧮 Vectorizing texts...")
-    X_db = vec.fit_transform(db_texts)
-    X_in = vec.transform(in_texts)
-    print(f"📈 Feature matrix: {X_db.shape} (database), {X_in.shape} (inputs)")
+    # 3-4) Build the corpus index with a language-appropriate vectorizer
+    profile_stage("3-4) Build the corpus index with a language-appropriate vectorizer")
+    print("🔧 Building corpus index...")
+    engine = SimilarityEngine(
+        vectorizer_factory=partial(make_enhanced_vectorizer, detected_language, tokenization),
+        preprocess=partial(enhanced_preprocess, language=detected_language, tokenization=tokenization)
+    )
+    engine.fit(db_texts, [dict(info, genre=g) for info, g in zip(db_file_info_list, db_genres)], db_labels)
 
     # 5) Calculate similarities
+    profile_stage("5) Calculate similarities")
     print("⚖️  Calculating similarities...")
-    S = cosine_similarity(X_in, X_db)
+    S = engine.score(in_texts)
+    print(f"📈 Similarity matrix: {S.shape} (inputs x database)")
 
     # 6) Analyze results (same as original)
+    profile_stage("6) Analyze results")
     print("🎯 Analyzing results...")
     rows = []
-    edges = []
+    genre_aggregates = engine.genre_aggregates(S)
     
     for i, in_name in enumerate(in_labels):
         sims = S[i]
-        order = np.argsort(-sims)
+        order = top_k_order(sims, k_neighbors)
         top_idx = order[0]
         top_score = float(sims[top_idx])
         top_db = db_labels[top_idx]
         top_genre = db_genres[top_idx]
         relation = classify_relation(top_score, dup_threshold, similar_threshold)
 
-        # Store edges for network
-        for j in order[:k_neighbors]:
-            edges.append((in_name, db_labels[j], float(sims[j])))
-
         # Genre analysis
-        genre_scores: Dict[str, List[float]] = {}
-        for j, g in enumerate(db_genres):
-            genre_scores.setdefault(g, []).append(float(sims[j]))
-        
         genre_rank = sorted(
-            [(g, float(np.mean(v)), float(np.max(v))) for g, v in genre_scores.items()],
+            [(g, float(mean[i]), float(mx[i])) for g, (mean, mx) in genre_aggregates.items()],
             key=lambda x: x[2], reverse=True
         )
 
         rows.append({
             "input_doc": in_name,
+            "input_folder": in_info_list[i]['input_folder'],
             "top_db_doc": top_db,
             "top_genre": top_genre,
+            "top_db_genre": top_genre,
+            "top_db_folder": db_file_info_list[top_idx]['folder_name'],
             "top_similarity": round(top_score, 4),
             "relation": relation,
             "language": detected_language,
+            "tokenization": tokenization,
             "genre_rank_json": json.dumps([
                 {"genre": g, "mean": round(m,4), "max": round(mx,4)} 
                 for g,m,mx in genre_rank
@@ -403,24 +456,14 @@ def run_enhanced_pipeline(db_root: str, input_root: str, out_root: str,
         })
 
     # 7) Overall rankings
+    profile_stage("7) Overall rankings")
     best_by_db = S.max(axis=0)
     
     # Genre overlap analysis
-    genre_overlap = {}
-    for g in sorted(set(db_genres)):
-        cols = [k for k, gg in enumerate(db_genres) if gg == g]
-        sub = S[:, cols]
-        genre_overlap[g] = {
-            "mean_over_all": float(np.mean(sub)),
-            "max_over_all": float(np.max(sub)),
-        }
-    
-    genre_rank_overall = sorted([
-        (g, v["mean_over_all"], v["max_over_all"]) 
-        for g,v in genre_overlap.items()
-    ], key=lambda x: x[2], reverse=True)
+    genre_rank_overall = engine.genre_rank_overall(S)
 
     # 8) Create DataFrames and save results
+    profile_stage("8) Create DataFrames and save results")
     print("💾 Saving results...")
     comp_df = pd.DataFrame(rows)
     
@@ -440,9 +483,6 @@ def run_enhanced_pipeline(db_root: str, input_root: str, out_root: str,
     in_labels_full = [info['input_full_name'] for info in in_info_list]
     db_labels_full = [info['full_name'] for info in db_file_info_list]
     
-    # Similarity matrix
-    sim_df = pd.DataFrame(S, index=in_labels_full, columns=db_labels_full)
-    
     # Create metadata for matrix labels (for frontend use)
     matrix_metadata = {
         "input_labels": [
@@ -468,17 +508,16 @@ def run_enhanced_pipeline(db_root: str, input_root: str, out_root: str,
     }
 
     # Save files
-    comp_csv = os.path.join(out_root, "comparison_table.csv")
-    sim_csv = os.path.join(out_root, "similarity_matrix.csv")
     overall_json = os.path.join(out_root, "overall_ranking.json")
 
-    comp_df.to_csv(comp_csv, index=False, encoding="utf-8-sig")
-    sim_df.to_csv(sim_csv, encoding="utf-8-sig")
+    comp_csv = write_table(comp_df, out_root, "comparison_table", output_format)
+    sim_csv = write_similarity_matrix(S, in_labels_full, db_labels_full, out_root, output_format)
     
     with open(overall_json, "w", encoding="utf-8") as f:
         json.dump({
             "analysis_info": {
                 "detected_language": detected_language,
+                "tokenization": tokenization,
                 "thai_support_available": THAI_SUPPORT,
                 "total_db_documents": len(db_texts),
                 "total_input_files": len(in_texts),
@@ -503,21 +542,28 @@ def run_enhanced_pipeline(db_root: str, input_root: str, out_root: str,
         }, f, ensure_ascii=False, indent=2)
 
     # 9) Generate visualizations
+    profile_stage("9) Generate visualizations")
     print("📊 Generating visualizations...")
     heatmap_path = os.path.join(out_root, "similarity_heatmap.png")
     plot_heatmap(S, db_labels_full, in_labels_full, 
                 f"Cosine Similarity ({detected_language.title()} Text Analysis)", 
                 heatmap_path)
 
-    network_path = os.path.join(out_root, "network_top_matches.png")
-    plot_network(edges, network_path, topk=k_neighbors)
+    network = build_network(S, in_labels, in_labels_full, db_labels, db_labels_full, k_neighbors)
+    network_data_path = write_network(network, os.path.join(out_root, NETWORK_FILE))
+    network_path = None
+    if network_png:
+        network_path = os.path.join(out_root, "network_top_matches.png")
+        plot_network(network_edges(network), network_path, topk=k_neighbors)
 
     # 10) Enhanced text report
+    profile_stage("10) Enhanced text report")
     report_path = os.path.join(out_root, "report.txt")
     lines = []
     lines.append("# Enhanced Similarity Analysis Report\n")
     lines.append(f"## Analysis Information")
     lines.append(f"- Detected Language: {detected_language.title()}")
+    lines.append(f"- Tokenization: {tokenization}")
     lines.append(f"- Thai Support Available: {'Yes' if THAI_SUPPORT else 'No'}")
     lines.append(f"- Database Documents: {len(db_texts)}")
     lines.append(f"- Input Files: {len(in_texts)}")
@@ -562,9 +608,11 @@ def run_enhanced_pipeline(db_root: str, input_root: str, out_root: str,
         "overall_ranking": overall_json,
         "heatmap": heatmap_path,
         "network": network_path,
+        "network_data": network_data_path,
         "report": report_path,
         "analysis_info": {
             "detected_language": detected_language,
+            "tokenization": tokenization,
             "thai_support": THAI_SUPPORT,
             "total_documents": len(db_texts),
             "total_inputs": len(in_texts),
@@ -591,9 +639,18 @@ def main():
                        help="Similar threshold (cosine similarity)")
     parser.add_argument("--max_files_per_genre", type=int, default=10,
                        help="Maximum files to load per genre")
+    parser.add_argument("--output_format", choices=OUTPUT_FORMATS, default="csv",
+                       help="Format for similarity matrix and comparison table (parquet/arrow need pyarrow, else npz)")
+    parser.add_argument("--no_network_png", action="store_true",
+                       help="Skip rendering network_top_matches.png (network.json layout data is still written)")
+    parser.add_argument("--tokenization", choices=TOKENIZATIONS, default="auto",
+                       help="words (pythainlp newmm for Thai), char_ngrams (no segmentation, fast) or auto")
+    parser.add_argument("--profile", action="store_true",
+                       help="Profile CPU and allocations per stage; writes <out>/profile/ (see profiling.py)")
     
     args = parser.parse_args()
 
+    profiler = StageProfiler(args.out, "enhanced_pipeline").start() if args.profile else None
     try:
         results = run_enhanced_pipeline(
             db_root=args.db,
@@ -602,12 +659,15 @@ def main():
             k_neighbors=args.topk,
             dup_threshold=args.dup_threshold,
             similar_threshold=args.similar_threshold,
-            max_files_per_genre=args.max_files_per_genre
+            max_files_per_genre=args.max_files_per_genre,
+            output_format=args.output_format,
+            network_png=not args.no_network_png,
+            tokenization=args.tokenization
         )
         
         print("\n📋 Generated Files:")
         for key, path in results.items():
-            if key != "analysis_info" and os.path.exists(path):
+            if key != "analysis_info" and path and os.path.exists(path):
                 print(f"  - {key}: {path}")
         
         return results
@@ -615,6 +675,9 @@ def main():
     except Exception as e:
         print(f"❌ Error: {str(e)}")
         sys.exit(1)
+    finally:
+        if profiler is not None:
+            profiler.stop()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
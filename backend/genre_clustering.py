@@ -0,0 +1,218 @@
+"""
+Unsupervised clustering of the database for genre discovery
+
+Genres normally come from folder names. This job clusters the corpus TF-IDF
+vectors (optionally reduced with TruncatedSVD) with mini-batch k-means fed in
+fixed-size batches, so clustering memory depends on the batch size and the
+number of clusters rather than on the corpus size. It reports each cluster's
+top terms, how it lines up with the folder genres, and the documents whose
+folder genre disagrees with their cluster.
+
+The fitted clusters double as a coarse routing layer: a ``ClusterRouter``
+(defined next to the engine so saved indexes unpickle anywhere) attached to a
+SimilarityEngine lets queries score only the documents of the
+closest clusters (``score(..., n_probe=2)``).
+
+Usage:
+    python genre_clustering.py --db ./db --out ./clusters --clusters 12 --svd 200
+    python genre_clustering.py --index corpus.pkl --out ./clusters   # also stores the router in the index
+"""
+
+import os
+import json
+import argparse
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.decomposition import TruncatedSVD
+from sklearn.preprocessing import normalize
+
+from columnar_io import OUTPUT_FORMATS, write_table
+from similarity_engine import ClusterRouter, SimilarityEngine
+
+DEFAULT_BATCH_SIZE = 1024
+DEFAULT_TOP_TERMS = 12
+
+# ---------------------------
+# Clustering
+# ---------------------------
+
+def cluster_matrix(X, n_clusters: int,
+                   svd_components: Optional[int] = None,
+                   batch_size: int = DEFAULT_BATCH_SIZE,
+                   epochs: int = 3,
+                   random_state: int = 0) -> Tuple[ClusterRouter, MiniBatchKMeans]:
+    """
+    Fit mini-batch k-means over the rows of ``X`` (sparse TF-IDF)
+
+    Args:
+        svd_components: Reduce to this many dimensions first (None = cluster the TF-IDF vectors)
+        batch_size: Rows per ``partial_fit`` call
+        epochs: Passes over the corpus (batches are shuffled every pass)
+    """
+    n_docs = X.shape[0]
+    if n_clusters < 2 or n_clusters > n_docs:
+        raise ValueError(f"n_clusters must be between 2 and the number of documents ({n_docs})")
+
+    svd = None
+    if svd_components and svd_components < X.shape[1]:
+        svd = TruncatedSVD(n_components=svd_components, random_state=random_state).fit(X)
+        Z = normalize(svd.transform(X).astype(np.float32))
+    else:
+        Z = X
+
+    # partial_fit initialises from its first batch, which needs >= n_clusters rows
+    batch_size = max(batch_size, n_clusters)
+    km = MiniBatchKMeans(n_clusters=n_clusters, batch_size=batch_size,
+                         random_state=random_state, n_init=3)
+    rng = np.random.default_rng(random_state)
+    for _ in range(epochs):
+        order = rng.permutation(n_docs)
+        for start in range(0, n_docs, batch_size):
+            km.partial_fit(Z[np.sort(order[start:start + batch_size])])
+
+    labels = np.concatenate([km.predict(Z[start:start + batch_size]) for start in range(0, n_docs, batch_size)])
+    return ClusterRouter(km.cluster_centers_, labels, svd), km
+
+def cluster_top_terms(router: ClusterRouter, feature_names: np.ndarray, n_terms: int = DEFAULT_TOP_TERMS) -> List[List[str]]:
+    """Highest-weighted terms of each centroid, mapped back to TF-IDF space"""
+    centers = router.centroids
+    if router.svd is not None:
+        centers = router.svd.inverse_transform(centers)
+    return [feature_names[np.argsort(-row, kind="stable")[:n_terms]].tolist() for row in centers]
+
+def genre_report(router: ClusterRouter, genres: List[str], metadata: List[Dict],
+                 top_terms: List[List[str]]) -> Tuple[List[Dict], pd.DataFrame, pd.DataFrame]:
+    """
+    Compare clusters with folder genres
+
+    Returns: clusters (summary per cluster), crosstab (cluster x genre counts),
+    assignments (one row per document with its cluster and dominant genre)
+    """
+    labels = router.labels
+    crosstab = pd.crosstab(pd.Series(labels, name="cluster"), pd.Series(genres, name="genre"))
+    crosstab = crosstab.reindex(range(router.n_clusters), fill_value=0)
+
+    clusters = []
+    dominant = {}
+    for c in range(router.n_clusters):
+        counts = crosstab.loc[c]
+        size = int(counts.sum())
+        top_genre = str(counts.idxmax()) if size else None
+        dominant[c] = top_genre
+        clusters.append({
+            "cluster_id": c,
+            "size": size,
+            "top_terms": top_terms[c],
+            "dominant_genre": top_genre,
+            "purity": round(float(counts.max()) / size, 4) if size else 0.0,
+            "genre_counts": {str(g): int(n) for g, n in counts.items() if n}
+        })
+
+    assignments = pd.DataFrame({
+        "display_name": [m["display_name"] for m in metadata],
+        "file_name": [m["file_name"] for m in metadata],
+        "genre": genres,
+        "cluster": labels,
+        "cluster_genre": [dominant[int(c)] for c in labels],
+    })
+    assignments["matches_folder_genre"] = assignments["genre"] == assignments["cluster_genre"]
+    return clusters, crosstab, assignments
+
+# ---------------------------
+# Job
+# ---------------------------
+
+def cluster_engine(engine: SimilarityEngine,
+                   n_clusters: Optional[int] = None,
+                   svd_components: Optional[int] = None,
+                   batch_size: int = DEFAULT_BATCH_SIZE) -> Tuple[ClusterRouter, Tuple[Dict, List[Dict], pd.DataFrame, pd.DataFrame]]:
+    """
+    Cluster a fitted engine's corpus
+
+    Returns: router, (summary, clusters, crosstab, assignments)
+    """
+    genres = engine.genres
+    n_clusters = n_clusters or max(2, len(set(genres)))
+    print(f"🧭 Clustering {engine.size} documents into {n_clusters} clusters")
+    router, km = cluster_matrix(engine.matrix, n_clusters, svd_components, batch_size)
+    top_terms = cluster_top_terms(router, engine.vectorizer.get_feature_names_out())
+    clusters, crosstab, assignments = genre_report(router, genres, engine.metadata, top_terms)
+    summary = {
+        "documents": engine.size,
+        "clusters": n_clusters,
+        "svd_components": svd_components,
+        "inertia": round(float(km.inertia_), 4),
+        "folder_genre_agreement": round(float(assignments["matches_folder_genre"].mean()), 4),
+    }
+    return router, (summary, clusters, crosstab, assignments)
+
+def run_clustering_job(out_root: str,
+                       db_root: Optional[str] = None,
+                       index_path: Optional[str] = None,
+                       n_clusters: Optional[int] = None,
+                       svd_components: Optional[int] = None,
+                       batch_size: int = DEFAULT_BATCH_SIZE,
+                       output_format: str = "csv") -> Dict:
+    """
+    Cluster a corpus and write the report
+
+    The corpus comes from ``index_path`` when it exists, otherwise every file
+    under ``db_root`` is loaded. With ``index_path`` the router is attached to
+    the engine and the index is saved back, ready for routed queries.
+    """
+    os.makedirs(out_root, exist_ok=True)
+    if index_path and os.path.exists(index_path):
+        engine = SimilarityEngine.load(index_path)
+    elif db_root:
+        engine = SimilarityEngine.from_database(db_root, max_files_per_genre=None)
+    else:
+        raise SystemExit("A database folder or an existing index is required")
+
+    router, report = cluster_engine(engine, n_clusters, svd_components, batch_size)
+    summary, clusters, crosstab, assignments = report
+
+    clusters_path = os.path.join(out_root, "clusters.json")
+    with open(clusters_path, "w", encoding="utf-8") as f:
+        json.dump({"summary": summary, "clusters": clusters}, f, ensure_ascii=False, indent=2)
+    crosstab_path = os.path.join(out_root, "cluster_genre_crosstab.csv")
+    crosstab.to_csv(crosstab_path, encoding="utf-8-sig")
+    assignments_path = write_table(assignments, out_root, "cluster_assignments", output_format)
+
+    if index_path:
+        engine.set_router(router)
+        engine.save(index_path)
+        print(f"💾 Router saved with the index: {index_path}")
+
+    return {
+        "summary": summary,
+        "outputs": {"clusters": clusters_path, "crosstab": crosstab_path, "assignments": assignments_path}
+    }
+
+# ---------------------------
+# CLI
+# ---------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Cluster the database to discover genres and build a query routing layer.")
+    parser.add_argument("--db", default=None, help="Database root folder (expects ./db/<genre>/*.txt).")
+    parser.add_argument("--index", default=None,
+                        help="Corpus index file: loaded if it exists, otherwise built from --db; the router is saved into it.")
+    parser.add_argument("--out", default="./clusters", help="Output folder.")
+    parser.add_argument("--clusters", type=int, default=None, help="Number of clusters (default: number of folder genres).")
+    parser.add_argument("--svd", type=int, default=None, help="Reduce TF-IDF vectors to this many dimensions first.")
+    parser.add_argument("--batch_size", type=int, default=DEFAULT_BATCH_SIZE, help="Documents per mini-batch.")
+    parser.add_argument("--output_format", choices=OUTPUT_FORMATS, default="csv",
+                        help="Format for the assignment table (parquet/arrow need pyarrow, else npz).")
+    args = parser.parse_args()
+    if not args.db and not (args.index and os.path.exists(args.index)):
+        parser.error("--db is required unless --index points to an existing index")
+
+    results = run_clustering_job(args.out, args.db, args.index, args.clusters, args.svd,
+                                 args.batch_size, args.output_format)
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
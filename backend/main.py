@@ -10,17 +10,20 @@ import zipfile
 from pathlib import Path
 from typing import List, Dict, Any, Optional
 import json
+import time
 import base64
 import asyncio
 from io import BytesIO
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
 
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 import aiofiles
 import uvicorn
-import pandas as pd
+import numpy as np
 
 # Document conversion
 from docx import Document
@@ -40,12 +43,41 @@ import sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 # Import original pipeline for stability
-from novel_similarity_pipeline import run_pipeline
+from novel_similarity_pipeline import (SimilarityResult, compute_similarity, load_inputs, write_outputs, output_paths,
+                                       rerank_from_scores, write_network_png,
+                                       load_match_page, read_txt, DEFAULT_MATCH_LIMIT, MATCH_SCORES_FILE)
+from session_manager import SessionManager
+from columnar_io import OUTPUT_FORMATS, write_table
+from corpus_registry import CorpusRegistry, file_sha256
+from batch_runner import BatchJobManager, DEFAULT_BATCH_SIZE, DEFAULT_TOP_K
+from duplicate_finder import find_duplicates
+from genre_clustering import cluster_engine
+from network_export import network_from_scores, network_records
+from admission import AdmissionController, AdmissionRejected
+from result_cache import ResultCache, cache_key
+from worker_pool import PipelineWorkerPool, fit_index_job, query_job, rank_job, run_query, score_input_job
+from text_store import DEFAULT_SNIPPET_BYTES
+from similarity_engine import SCORING_METHODS, top_candidates
+from profiling import PROFILE_DIR, profiled_call
+from memory_planner import DEFAULT_MEMORY_BUDGET_MB, MemoryBudgetExceeded, plan_run
+from results_archive import ResultsArchive, parse_range, iter_file_range
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run the session eviction loop for the lifetime of the app"""
+    eviction_task = asyncio.create_task(session_manager.run_eviction_loop())
+    try:
+        yield
+    finally:
+        eviction_task.cancel()
+        conversion_executor.shutdown(wait=False)
+        pipeline_pool.shutdown()
 
 app = FastAPI(
     title="Novel Similarity Analyzer API",
     description="API for analyzing text similarity between novels and documents",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS middleware for frontend communication  
@@ -71,6 +103,67 @@ TEMP_DIR.mkdir(exist_ok=True)
 (TEMP_DIR / "db").mkdir(exist_ok=True)
 (TEMP_DIR / "output").mkdir(exist_ok=True)
 
+# Session folders expire after SESSION_TTL_SECONDS of inactivity and are
+# evicted least-recently-used first once SESSION_DISK_QUOTA_MB is exceeded
+session_manager = SessionManager(
+    TEMP_DIR,
+    ttl_seconds=float(os.environ.get("SESSION_TTL_SECONDS", str(6 * 3600))),
+    quota_bytes=int(float(os.environ.get("SESSION_DISK_QUOTA_MB", "2048")) * 1024 * 1024),
+    sweep_interval=float(os.environ.get("SESSION_SWEEP_INTERVAL_SECONDS", "60"))
+)
+
+# Registered corpora persist under CORPORA_DIR and stay resident once loaded
+CORPORA_DIR = Path(os.environ.get("CORPORA_DIR", "corpora"))
+corpus_registry = CorpusRegistry(CORPORA_DIR)
+QUERY_MAX_INPUTS = int(os.environ.get("QUERY_MAX_INPUTS", "50"))
+
+# CPU-bound pipeline work (analysis, output rendering, corpus queries) runs in
+# PIPELINE_WORKERS processes (0 = threads in this process); workers whose RSS
+# exceeds WORKER_MEMORY_LIMIT_MB are recycled
+pipeline_pool = PipelineWorkerPool(
+    workers=int(os.environ.get("PIPELINE_WORKERS", str(min(4, os.cpu_count() or 1)))),
+    max_jobs=int(os.environ.get("PIPELINE_MAX_JOBS", "0")) or None,
+    memory_limit_mb=float(os.environ.get("WORKER_MEMORY_LIMIT_MB", "1536")),
+    max_tasks_per_worker=int(os.environ.get("WORKER_MAX_TASKS", "100"))
+)
+
+# Each analysis is planned to fit ANALYZE_MEMORY_BUDGET_MB (default: the
+# worker recycling limit) before the corpus is loaded
+ANALYZE_MEMORY_BUDGET_MB = float(os.environ.get(
+    "ANALYZE_MEMORY_BUDGET_MB", os.environ.get("WORKER_MEMORY_LIMIT_MB", str(DEFAULT_MEMORY_BUDGET_MB))
+))
+
+# /api/analyze runs at most ANALYZE_MAX_CONCURRENT analyses; up to
+# ANALYZE_MAX_QUEUE more wait ANALYZE_QUEUE_TIMEOUT_SECONDS for a slot, and no
+# analysis starts while available memory is below ANALYZE_MIN_AVAILABLE_MB
+analysis_admission = AdmissionController(
+    max_concurrent=int(os.environ.get("ANALYZE_MAX_CONCURRENT", str(max(1, pipeline_pool.workers)))),
+    max_queue=int(os.environ.get("ANALYZE_MAX_QUEUE", "8")),
+    queue_timeout=float(os.environ.get("ANALYZE_QUEUE_TIMEOUT_SECONDS", "30")),
+    min_available_mb=float(os.environ.get("ANALYZE_MIN_AVAILABLE_MB", "512"))
+)
+
+# Complete /api/analyze results are cached on disk (RESULT_CACHE_MB, 0 = off)
+RESULT_CACHE_DIR = Path(os.environ.get("RESULT_CACHE_DIR", str(TEMP_DIR / "result_cache")))
+result_cache = ResultCache(
+    RESULT_CACHE_DIR,
+    max_bytes=int(float(os.environ.get("RESULT_CACHE_MB", "1024")) * 1024 * 1024)
+)
+
+# Batch screening jobs (JSONL output) run against registered corpora
+JOBS_DIR = Path(os.environ.get("JOBS_DIR", "jobs"))
+batch_jobs = BatchJobManager(JOBS_DIR)
+
+@app.middleware("http")
+async def touch_session_files(request: Request, call_next):
+    """Count static result file access as session activity"""
+    parts = request.url.path.split("/")
+    if len(parts) > 2 and parts[1] == "files" and parts[2].startswith("session_"):
+        session_id = parts[2][len("session_"):]
+        session_manager.touch(session_id)
+        await wait_for_outputs(session_id)
+    return await call_next(request)
+
 # Mount static files for serving results
 app.mount("/files", StaticFiles(directory=str(TEMP_DIR)), name="files")
 
@@ -127,6 +220,60 @@ def convert_file_to_txt(input_path: str, output_path: str) -> None:
     else:
         raise ValueError(f"Unsupported file format: {file_extension}")
 
+# Uploads are copied to disk in fixed-size chunks so large PDFs/ZIPs never sit
+# fully in memory, and DOCX/PDF parsing runs on a dedicated executor so it does
+# not block the event loop for other requests.
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+CONVERSION_WORKERS = int(os.environ.get("CONVERSION_WORKERS", "4"))
+conversion_executor = ThreadPoolExecutor(max_workers=CONVERSION_WORKERS, thread_name_prefix="convert")
+
+async def save_upload_file(upload: UploadFile, destination: Path) -> int:
+    """Stream an uploaded file to disk chunk by chunk, returning bytes written"""
+    written = 0
+    async with aiofiles.open(destination, 'wb') as f:
+        while True:
+            chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            await f.write(chunk)
+            written += len(chunk)
+    return written
+
+async def convert_file_async(input_path: Path, output_path: Path) -> None:
+    """Run convert_file_to_txt on the conversion executor"""
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(conversion_executor, convert_file_to_txt, str(input_path), str(output_path))
+
+async def read_query_inputs(input_files: List[UploadFile], text_input: Optional[str]) -> tuple:
+    """
+    Convert query uploads to plain text in a throwaway folder (no session)
+
+    Returns: (names, texts)
+    """
+    names, texts = [], []
+    if text_input and text_input.strip():
+        names.append("direct_text_input.txt")
+        texts.append(text_input)
+    
+    with tempfile.TemporaryDirectory(dir=TEMP_DIR, prefix="query_") as tmp:
+        jobs = []
+        for i, file in enumerate(input_files):
+            if not file.filename:
+                continue
+            clean_filename = Path(file.filename).name
+            src = Path(tmp) / f"file_{i:02d}_{clean_filename}"
+            dst = Path(tmp) / f"file_{i:02d}.txt"
+            await save_upload_file(file, src)
+            jobs.append((file.filename, src, dst))
+        
+        outcomes = await asyncio.gather(*(convert_file_async(src, dst) for _, src, dst in jobs), return_exceptions=True)
+        for (filename, _, dst), outcome in zip(jobs, outcomes):
+            if isinstance(outcome, BaseException):
+                raise HTTPException(status_code=400, detail=f"Failed to convert {filename}: {str(outcome)}")
+            names.append(f"{Path(filename).stem}.txt")
+            texts.append(read_txt(str(dst)))
+    return names, texts
+
 # ---------------------------
 # Thai Text Processing
 # ---------------------------
@@ -151,6 +298,260 @@ def preprocess_thai_text(text: str) -> str:
         print(f"Thai processing failed: {e}, falling back to simple processing")
         return text.lower().replace('\n', ' ').strip()
 
+# ---------------------------
+# Result Serialisation
+# ---------------------------
+
+# Output files are written after the response has been built; requests that
+# need them (static files, downloads, match pages) wait for the write first
+pending_writes: Dict[str, asyncio.Task] = {}
+
+def schedule_output_write(session_id: str, result: SimilarityResult, output_dir: Path, output_format: str,
+                          network_png: bool = True, profile: bool = False,
+                          heatmap: str = "annotated", heatmap_dpi: int = 300) -> None:
+    """Write a session's output files on a worker thread (profiled per stage with ``profile``)"""
+    session_manager.acquire(session_id)
+    # Build the (memoised) network before the result is handed to a worker, so
+    # the file writer and build_results_payload both reuse this one build
+    result.network()
+    args = (result, str(output_dir), output_format, network_png, heatmap, heatmap_dpi)
+    if profile:
+        job = pipeline_pool.run(profiled_call, str(output_dir), "outputs", write_outputs, *args)
+    else:
+        job = pipeline_pool.run(write_outputs, *args)
+    task = asyncio.create_task(job)
+    pending_writes[session_id] = task
+    
+    def _done(t: asyncio.Task) -> None:
+        if pending_writes.get(session_id) is t:
+            pending_writes.pop(session_id, None)
+        session_manager.release(session_id)
+        if not t.cancelled() and t.exception() is not None:
+            print(f"⚠️ Failed to write outputs for session {session_id}: {t.exception()}")
+    
+    task.add_done_callback(_done)
+
+async def wait_for_outputs(session_id: str) -> None:
+    """Block until the session's background output write has finished"""
+    task = pending_writes.get(session_id)
+    if task is not None:
+        try:
+            await asyncio.shield(task)
+        except Exception:
+            pass
+
+def profile_payload(session_id: str, analysis_profile: Dict[str, Any]) -> Dict[str, Any]:
+    """Stage timings of a debug request plus URLs of its profile artifacts"""
+    base = f"/files/session_{session_id}/output/{PROFILE_DIR}"
+    return {
+        "stages": [
+            {key: stage[key] for key in ("stage", "wall_seconds", "cpu_seconds", "peak_allocated_bytes")}
+            for stage in analysis_profile["stages"]
+        ],
+        "analysis": {
+            "summary_url": f"{base}/{analysis_profile['summary_file']}",
+            "report_url": f"{base}/{analysis_profile['report_file']}",
+            "pstats_urls": [f"{base}/{stage['profile_file']}" for stage in analysis_profile["stages"]],
+        },
+        # Written with the output files, in the background
+        "outputs": {
+            "summary_url": f"{base}/outputs_summary.json",
+            "report_url": f"{base}/outputs_report.txt",
+        },
+    }
+
+# ---------------------------
+# Result Cache
+# ---------------------------
+
+def analysis_cache_key(db_zip_path: Path, input_dir: Path, input_names: List[str],
+                       file_name_mapping: Dict[str, str], parameters: Dict) -> str:
+    """Result cache key: database ZIP, converted inputs (name + content) and parameters"""
+    inputs = [(name, file_sha256(input_dir / name)) for name in input_names]
+    return cache_key(file_sha256(db_zip_path), inputs, dict(parameters, file_name_mapping=file_name_mapping))
+
+def cache_info(hit: bool, bypassed: bool = False) -> Dict[str, Any]:
+    """Per-response cache status plus the server's running hit/miss counts"""
+    return {"hit": hit, "bypassed": bypassed, "totals": result_cache.counts()}
+
+cache_store_tasks: set = set()
+
+def schedule_cache_store(key: str, session_id: str, output_dir: Path, response_data: Dict) -> None:
+    """Copy a session's result into the cache once its outputs are written"""
+    write_task = pending_writes.get(session_id)
+    session_manager.acquire(session_id)
+    
+    async def _store() -> None:
+        try:
+            if write_task is not None:
+                await asyncio.shield(write_task)  # outputs failed: nothing to cache
+            await asyncio.to_thread(result_cache.put, key, session_id, output_dir, response_data)
+        except Exception as e:
+            print(f"⚠️ Result for session {session_id} not cached: {e}")
+        finally:
+            session_manager.release(session_id)
+    
+    task = asyncio.create_task(_store())
+    cache_store_tasks.add(task)
+    task.add_done_callback(cache_store_tasks.discard)
+
+def build_results_payload(result: SimilarityResult, session_id: str, paths: Dict[str, str]) -> Dict[str, Any]:
+    """Serialise an in-memory pipeline result into the /api/analyze response"""
+    def file_url(key: str) -> Optional[str]:
+        if key not in paths:
+            return None  # not written for this result (see /api/reclassify)
+        return f"/files/session_{session_id}/output/{Path(paths[key]).name}"
+    
+    overall = result.overall_ranking()
+    payload = {
+        key: {"url": file_url(key), "filename": Path(paths[key]).name}
+        for key in ("comparison_table", "similarity_matrix", "match_scores", "heatmap", "network")
+        if key in paths
+    }
+    payload["report"] = {
+        "url": file_url("report"),
+        "filename": Path(paths["report"]).name if "report" in paths else None,
+        "content": result.report_text()
+    }
+    payload["overall_ranking"] = {
+        "url": file_url("overall_ranking"),
+        "content": overall
+    }
+    
+    # Data for heatmap visualization
+    payload["similarity_heatmap"] = {
+        "url": file_url("heatmap"),
+        "data": {
+            "x_labels": overall["matrix_labels"]["db_labels"],
+            "y_labels": overall["matrix_labels"]["input_labels"],
+            "values": result.S.tolist()
+        }
+    }
+    
+    # Network graph: top-k edges and layout positions computed server-side
+    payload["network_top_matches"] = {
+        "url": file_url("network") if "network" in paths else None,
+        "data_url": file_url("network_data"),
+        "data": network_records(result.network())
+    }
+    return payload
+
+# ---------------------------
+# Streaming
+# ---------------------------
+
+# Index fitted by a streamed analysis (kept out of output/, which is downloaded and cached)
+STREAM_INDEX_FILE = "stream_index.pkl"
+# Keep proxies from buffering the event stream
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+def sse_event(event: str, data: Any) -> str:
+    """One server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+OUTPUT_FILE_KEYS = ("comparison_table", "similarity_matrix", "match_scores", "heatmap", "network",
+                    "report", "overall_ranking")
+
+def output_urls(results: Dict[str, Any]) -> Dict[str, str]:
+    """File URLs of a results payload, by output name"""
+    return {name: results[name]["url"] for name in OUTPUT_FILE_KEYS if name in results and results[name].get("url")}
+
+def cached_events(response_data: Dict[str, Any]):
+    """A cached result is complete: send it as results, outputs and done at once"""
+    yield sse_event("results", response_data)
+    yield sse_event("outputs", {"status": "written", "files": output_urls(response_data["results"])})
+    yield sse_event("done", {"session_id": response_data["session_id"], "cache_hit": True})
+
+async def stream_analysis(session_id: str, admitted_at: float, response_data: Dict[str, Any],
+                          db_dir: Path, input_dir: Path, output_dir: Path, plan, rank_kwargs: Dict[str, Any],
+                          key: Optional[str] = None, cache_bypassed: bool = False):
+    """
+    Server-sent events of a streamed /api/analyze run
+
+    start (session and parameters), one input event per input as soon as it
+    is scored, results (the /api/analyze response) once all inputs are
+    ranked, outputs once files and images are written, then done. A failure
+    ends the stream with an error event. Owns the admission slot and the
+    session hold taken by the endpoint.
+    """
+    parameters = response_data["parameters"]
+    started = time.perf_counter()
+    first_result = None
+    tasks = []
+    try:
+        yield sse_event("start", {
+            "session_id": session_id,
+            "processed_files": response_data["processed_files"],
+            "file_name_mapping": response_data["file_name_mapping"],
+            "parameters": parameters,
+            "memory_plan": response_data["memory_plan"]
+        })
+        
+        print("🚀 Running Novel Similarity Analysis Pipeline (streamed)...")
+        texts, names = await asyncio.to_thread(load_inputs, str(input_dir), 5)
+        index_path = str(session_manager.session_dir(session_id) / STREAM_INDEX_FILE)
+        await pipeline_pool.run(fit_index_job, str(db_dir), index_path, parameters["scoring"])
+        
+        async def score(i: int):
+            return i, await pipeline_pool.run(score_input_job, index_path, texts[i], names[i],
+                                              plan.block_size, **rank_kwargs)
+        
+        tasks = [asyncio.create_task(score(i)) for i in range(len(texts))]
+        scored = [None] * len(texts)
+        for next_scored in asyncio.as_completed(tasks):
+            i, scored_input = await next_scored
+            scored[i] = scored_input
+            if first_result is None:
+                first_result = time.perf_counter() - started
+            row = scored_input["row"]
+            yield sse_event("input", {
+                "index": i,
+                **scored_input["analysis"],
+                "top_display_name": row["top_display_name"],
+                "top_genre": row["top_genre"],
+                "top_similarity": row["top_similarity"],
+                "relation": row["relation"],
+                "genre_rank": json.loads(row["genre_rank_json"])
+            })
+        
+        S = np.vstack([scored_input["scores"] for scored_input in scored])
+        result = await pipeline_pool.run(rank_job, index_path, S, names, **rank_kwargs)
+        
+        paths = output_paths(str(output_dir), parameters["output_format"])
+        if not parameters["network_png"]:
+            del paths["network"]
+        if plan.heatmap == "none":
+            del paths["heatmap"]
+        schedule_output_write(session_id, result, output_dir, parameters["output_format"], parameters["network_png"],
+                              heatmap=plan.heatmap, heatmap_dpi=plan.heatmap_dpi)
+        response_data["results"] = build_results_payload(result, session_id, paths)
+        if key is not None:
+            schedule_cache_store(key, session_id, output_dir, response_data)
+        response_data["cache"] = cache_info(hit=False, bypassed=cache_bypassed)
+        yield sse_event("results", response_data)
+        
+        write_task = pending_writes.get(session_id)
+        await wait_for_outputs(session_id)
+        failed = write_task is not None and (write_task.cancelled() or write_task.exception() is not None)
+        yield sse_event("outputs", {
+            "status": "failed" if failed else "written",
+            "files": {} if failed else output_urls(response_data["results"])
+        })
+        yield sse_event("done", {
+            "session_id": session_id,
+            "seconds": round(time.perf_counter() - started, 3),
+            "time_to_first_result_seconds": round(first_result, 3) if first_result is not None else None
+        })
+    except (Exception, SystemExit) as e:
+        # load_inputs / iter_database report bad layouts with SystemExit
+        print(f"❌ Pipeline error: {e}")
+        yield sse_event("error", {"detail": f"Analysis pipeline failed: {str(e)}"})
+    finally:
+        for task in tasks:
+            task.cancel()
+        analysis_admission.release(admitted_at)
+        session_manager.release(session_id)
+
 # ---------------------------
 # API Endpoints
 # ---------------------------
@@ -172,7 +573,15 @@ async def analyze_similarity(
     dup_threshold: float = Form(0.90, description="Threshold for duplicate classification"),
     similar_threshold: float = Form(0.60, description="Threshold for similar classification"),
     text_input: Optional[str] = Form(None, description="Optional direct text input"),
-    novel_names: Optional[str] = Form(None, description="Optional comma-separated names for input files/text")
+    novel_names: Optional[str] = Form(None, description="Optional comma-separated names for input files/text"),
+    output_format: str = Form("csv", description="Output format for similarity matrix and comparison table: csv, parquet, arrow or npz"),
+    match_limit: int = Form(DEFAULT_MATCH_LIMIT, description="Matches per input embedded in the response (0 = all)"),
+    network_png: bool = Form(True, description="Render network_top_matches.png (layout data is always returned)"),
+    use_cache: bool = Form(True, description="Reuse the result of an identical earlier request (false = always recompute)"),
+    scoring: str = Form("cosine", description="Scoring function: cosine (TF-IDF) or bm25 (calibrated to 0-1)"),
+    debug: bool = Form(False, description="Profile CPU and allocations per pipeline stage (bypasses the result cache)"),
+    explain: bool = Form(False, description="Dry run: return the memory plan for this request without running it"),
+    stream: bool = Form(False, description="Send results as server-sent events: each input as soon as it is scored")
 ):
     """
     Analyze text similarity between input files and a database of documents
@@ -184,11 +593,36 @@ async def analyze_similarity(
         dup_threshold: Similarity threshold for duplicate classification
         similar_threshold: Similarity threshold for similar classification  
         text_input: Optional direct text input (will be saved as additional file)
+        output_format: csv, parquet, arrow or npz (parquet/arrow fall back to npz without pyarrow)
+        match_limit: Matches per input embedded in the response; the rest is
+            available from /api/matches/{session_id}/{input}
+        network_png: Also render the network graph as a PNG
+        use_cache: Return the stored result of an identical earlier request
+            (same database ZIP, inputs and parameters) instead of recomputing
+        scoring: cosine (TF-IDF) or bm25; the calibration used is reported in
+            analysis_info.scoring
+        debug: Profile each pipeline stage (cProfile + tracemalloc) and write
+            the artifacts to the session's output/profile folder
+        explain: Only plan the run against ANALYZE_MEMORY_BUDGET_MB and
+            return the plan (a run that cannot fit is refused with 413)
+        stream: Respond with a text/event-stream instead (see
+            stream_analysis): each input's top matches and relation are
+            sent as soon as that input is scored, rankings and images follow
     
     Returns:
         JSON response with analysis results and file URLs
+        (429/503 with Retry-After when the server is saturated)
     """
     
+    try:
+        admitted_at = await analysis_admission.acquire()
+    except AdmissionRejected as e:
+        print(f"🚦 Analysis rejected: {e.reason}")
+        raise HTTPException(status_code=e.status_code, detail=e.reason,
+                            headers={"Retry-After": str(e.retry_after)})
+    
+    session_id = None
+    streaming = False
     try:
         # Validate input files count
         if len(input_files) > 5:
@@ -197,10 +631,17 @@ async def analyze_similarity(
         if len(input_files) == 0 and not text_input:
             raise HTTPException(status_code=400, detail="At least one input file or text input is required")
         
-        # Create unique session directory
-        import uuid
-        session_id = str(uuid.uuid4())[:8]
-        session_dir = TEMP_DIR / f"session_{session_id}"
+        if output_format not in OUTPUT_FORMATS:
+            raise HTTPException(status_code=400, detail=f"output_format must be one of: {', '.join(OUTPUT_FORMATS)}")
+        if scoring not in SCORING_METHODS:
+            raise HTTPException(status_code=400, detail=f"scoring must be one of: {', '.join(SCORING_METHODS)}")
+        if stream and debug:
+            raise HTTPException(status_code=400, detail="debug profiling is not available for streamed analyses")
+        
+        # Create unique session directory (protected from eviction until we return)
+        session_id = session_manager.create()
+        session_manager.acquire(session_id)
+        session_dir = session_manager.session_dir(session_id)
         input_dir = session_dir / "input"
         db_dir = session_dir / "db" 
         output_dir = session_dir / "output"
@@ -230,7 +671,10 @@ async def analyze_similarity(
             if custom_names:
                 file_name_mapping[text_filename] = custom_names[0]
         
-        # Handle uploaded files
+        # Handle uploaded files: stream each upload to disk first, then convert
+        # all of them concurrently off the event loop
+        conversion_jobs = []
+        planned_names = set(processed_files)
         for i, file in enumerate(input_files):
             if not file.filename:
                 continue
@@ -242,14 +686,11 @@ async def analyze_similarity(
             clean_filename = Path(original_filename).name  # Get just the filename without path
             
             # Save uploaded file with safe filename
-            file_extension = Path(clean_filename).suffix.lower()
             safe_filename = f"file_{i:02d}_{clean_filename}"
             temp_file_path = input_dir / safe_filename
             
             try:
-                async with aiofiles.open(temp_file_path, 'wb') as f:
-                    content = await file.read()
-                    await f.write(content)
+                await save_upload_file(file, temp_file_path)
                 print(f"✅ Saved temp file: {temp_file_path}")
             except Exception as e:
                 print(f"❌ Failed to save {original_filename}: {e}")
@@ -265,34 +706,48 @@ async def analyze_similarity(
             # Ensure unique filename
             counter = 1
             original_txt_filename = txt_filename
-            while txt_filename in processed_files:
+            while txt_filename in planned_names:
                 base_name = Path(original_txt_filename).stem
                 txt_filename = f"{base_name}_{counter}.txt"
                 counter += 1
+            planned_names.add(txt_filename)
             
-            txt_file_path = input_dir / txt_filename
+            conversion_jobs.append({
+                "index": i,
+                "original_filename": original_filename,
+                "clean_filename": clean_filename,
+                "temp_file_path": temp_file_path,
+                "txt_filename": txt_filename,
+                "txt_file_path": input_dir / txt_filename,
+            })
+        
+        print(f"🔄 Converting {len(conversion_jobs)} file(s) concurrently")
+        conversion_results = await asyncio.gather(
+            *(convert_file_async(job["temp_file_path"], job["txt_file_path"]) for job in conversion_jobs),
+            return_exceptions=True
+        )
+        
+        for job, outcome in zip(conversion_jobs, conversion_results):
+            if isinstance(outcome, BaseException):
+                raise HTTPException(status_code=400, detail=f"Failed to convert {job['original_filename']}: {str(outcome)}")
+        
+        for job in conversion_jobs:
+            txt_filename = job["txt_filename"]
+            processed_files.append(txt_filename)
+            print(f"✅ Converted to: {job['txt_file_path']}")
             
-            try:
-                print(f"🔄 Converting {safe_filename} to {txt_filename}")
-                convert_file_to_txt(str(temp_file_path), str(txt_file_path))
-                processed_files.append(txt_filename)
-                print(f"✅ Converted to: {txt_file_path}")
-                
-                # Map to custom name if available
-                name_index = i + (1 if text_input and text_input.strip() else 0)
-                if name_index < len(custom_names):
-                    file_name_mapping[txt_filename] = custom_names[name_index]
-                else:
-                    # Use original filename as display name for folder uploads
-                    if original_filename != clean_filename:
-                        file_name_mapping[txt_filename] = original_filename
-                
-                # Remove temporary file
-                temp_file_path.unlink()
-                print(f"🗑️ Cleaned up temp file: {safe_filename}")
-                
-            except Exception as e:
-                raise HTTPException(status_code=400, detail=f"Failed to convert {file.filename}: {str(e)}")
+            # Map to custom name if available
+            name_index = job["index"] + (1 if text_input and text_input.strip() else 0)
+            if name_index < len(custom_names):
+                file_name_mapping[txt_filename] = custom_names[name_index]
+            else:
+                # Use original filename as display name for folder uploads
+                if job["original_filename"] != job["clean_filename"]:
+                    file_name_mapping[txt_filename] = job["original_filename"]
+            
+            # Remove temporary file
+            job["temp_file_path"].unlink(missing_ok=True)
+            print(f"🗑️ Cleaned up temp file: {job['temp_file_path'].name}")
         
         # Process database ZIP file
         if not database_file.filename or not database_file.filename.endswith('.zip'):
@@ -300,9 +755,36 @@ async def analyze_similarity(
         
         # Save and extract database ZIP
         db_zip_path = session_dir / "database.zip"
-        async with aiofiles.open(db_zip_path, 'wb') as f:
-            db_content = await database_file.read()
-            await f.write(db_content)
+        await save_upload_file(database_file, db_zip_path)
+        
+        parameters = {
+            "k_neighbors": k_neighbors,
+            "dup_threshold": dup_threshold,
+            "similar_threshold": similar_threshold,
+            "output_format": output_format,
+            "match_limit": match_limit,
+            "network_png": network_png,
+            "scoring": scoring
+        }
+        
+        # Same database, inputs and parameters as an earlier request: reuse its result
+        key = None
+        if explain:
+            pass
+        elif not use_cache or debug:
+            result_cache.record_bypass()
+        elif result_cache.enabled:
+            key = await asyncio.to_thread(
+                analysis_cache_key, db_zip_path, input_dir, processed_files, file_name_mapping, parameters
+            )
+            cached = await asyncio.to_thread(result_cache.get, key, session_id, output_dir)
+            if cached is not None:
+                print(f"♻️ Result cache hit: {key[:12]}")
+                cached["cache"] = cache_info(hit=True)
+                if stream:
+                    return StreamingResponse(cached_events(cached), media_type="text/event-stream",
+                                             headers=SSE_HEADERS)
+                return JSONResponse(content=cached)
         
         # Extract ZIP
         try:
@@ -311,89 +793,83 @@ async def analyze_similarity(
         except Exception as e:
             raise HTTPException(status_code=400, detail=f"Failed to extract database ZIP: {str(e)}")
         
-        # Run similarity analysis pipeline
+        # Plan memory before loading anything: block size, heatmap rendering
+        # and match list truncation, or refuse the run
+        try:
+            plan = await asyncio.to_thread(
+                plan_run, str(db_dir), str(input_dir), ANALYZE_MEMORY_BUDGET_MB, match_limit, k_neighbors
+            )
+        except SystemExit as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if explain:
+            return JSONResponse(content={
+                "status": "plan",
+                "session_id": session_id,
+                "parameters": parameters,
+                "memory_plan": plan.to_dict(),
+                "explanation": plan.explain()
+            })
+        if not plan.fits:
+            raise HTTPException(status_code=413, detail=str(MemoryBudgetExceeded(plan)))
+        for adjustment in plan.adjustments:
+            print(f"🧮 Memory plan: {adjustment}")
+        memory_plan = {
+            key: value for key, value in plan.to_dict().items()
+            if key in ("budget_bytes", "peak_bytes", "block_size", "match_limit", "heatmap", "heatmap_dpi", "adjustments")
+        }
+        
+        if stream:
+            # The event stream takes over the admission slot and the session hold
+            streaming = True
+            response_data = {
+                "status": "success",
+                "message": f"Analysis completed successfully. Processed {len(processed_files)} input files.",
+                "session_id": session_id,
+                "processed_files": processed_files,
+                "file_name_mapping": file_name_mapping,
+                "parameters": parameters,
+                "memory_plan": memory_plan
+            }
+            rank_kwargs = dict(k_neighbors=k_neighbors, dup_threshold=dup_threshold,
+                               similar_threshold=similar_threshold, match_limit=plan.match_limit)
+            return StreamingResponse(
+                stream_analysis(session_id, admitted_at, response_data, db_dir, input_dir, output_dir,
+                                plan, rank_kwargs, key, cache_bypassed=not use_cache),
+                media_type="text/event-stream", headers=SSE_HEADERS
+            )
+        
+        # Run similarity analysis pipeline (results stay in memory; files are
+        # written in the background for download)
         try:
             print("🚀 Running Novel Similarity Analysis Pipeline...")
-            results = await asyncio.to_thread(
-                run_pipeline,
+            analysis_kwargs = dict(
                 db_root=str(db_dir),
                 input_root=str(input_dir),
-                out_root=str(output_dir),
                 k_neighbors=k_neighbors,
                 dup_threshold=dup_threshold,
-                similar_threshold=similar_threshold
+                similar_threshold=similar_threshold,
+                match_limit=plan.match_limit,
+                scoring=scoring,
+                block_size=plan.block_size
             )
-            
-            # Convert to expected format for frontend
-            results = {
-                "comparison_table": results.get("comparison_table"),
-                "similarity_matrix": results.get("similarity_matrix"), 
-                "overall_ranking": results.get("overall_ranking"),
-                "heatmap": results.get("similarity_heatmap"),
-                "network": results.get("network_top_matches"),
-                "report": results.get("report"),
-                "analysis_info": {
-                    "detected_language": "auto",
-                    "thai_support": THAI_SUPPORT,
-                    "thai_support_available": THAI_SUPPORT,
-                    # number of input files
-                    "total_input_files": len(processed_files),
-                    # db document count will be augmented below if available
-                }
-            }
-
-            # Augment overall_ranking JSON to ensure 'novel_title' and friendly metadata for UI
-            try:
-                overall_path = results.get("overall_ranking")
-                if overall_path and os.path.exists(overall_path):
-                    with open(overall_path, 'r', encoding='utf-8') as f:
-                        overall_json = json.load(f)
-
-                    # Attempt to augment db_overall_rank entries with metadata from matrix_labels
-                    db_metadata = None
-                    try:
-                        db_metadata = overall_json.get('matrix_labels', {}).get('db_metadata', None)
-                    except Exception:
-                        db_metadata = None
-
-                    if db_metadata and isinstance(db_metadata, list):
-                        # Build lookup by file name
-                        meta_lookup = {m.get('file_name'): m for m in db_metadata}
-
-                        enhanced_rank = []
-                        for entry in overall_json.get('db_overall_rank', []):
-                            db_doc = entry.get('db_doc') or entry.get('db') or entry.get('filename')
-                            meta = meta_lookup.get(db_doc, {})
-                            enhanced = dict(entry)  # copy
-                            # Prefer metadata fields when available
-                            enhanced['novel_title'] = meta.get('novel_title') or meta.get('folder_name') or entry.get('title') or 'N/A'
-                            enhanced['folder_name'] = meta.get('folder_name') or enhanced.get('folder_name') or (enhanced.get('novel_title') if enhanced.get('novel_title')!='N/A' else 'N/A')
-                            enhanced['chapter_name'] = meta.get('chapter_name') or enhanced.get('chapter_name') or os.path.splitext(db_doc)[0]
-                            enhanced['file_name'] = meta.get('file_name') or db_doc
-                            enhanced['genre'] = meta.get('genre') or enhanced.get('genre') or overall_json.get('matrix_labels', {}).get('db_labels', [])
-                            # Ensure best_similarity is present as float
-                            try:
-                                enhanced['best_similarity'] = float(enhanced.get('best_similarity', enhanced.get('best_similarity', 0)))
-                            except Exception:
-                                enhanced['best_similarity'] = 0.0
-                            enhanced_rank.append(enhanced)
-
-                        # Replace with enhanced rank
-                        overall_json['db_overall_rank'] = enhanced_rank
-
-                        # Update db document count
-                        overall_json.setdefault('analysis_info', {})
-                        overall_json['analysis_info']['total_db_documents'] = len(db_metadata)
-
-                        # Write augmented overall json back to file (so frontend receives the enriched structure)
-                        with open(overall_path, 'w', encoding='utf-8') as f:
-                            json.dump(overall_json, f, ensure_ascii=False, indent=2)
-            except Exception as e:
-                print(f"⚠️ Could not augment overall_ranking.json: {e}")
+            if debug:
+                result, analysis_profile = await pipeline_pool.run(
+                    profiled_call, str(output_dir), "analysis", compute_similarity, **analysis_kwargs
+                )
+            else:
+                result = await pipeline_pool.run(compute_similarity, **analysis_kwargs)
         except Exception as e:
             print(f"❌ Pipeline error: {e}")
             raise HTTPException(status_code=500, detail=f"Analysis pipeline failed: {str(e)}")
         
+        paths = output_paths(str(output_dir), output_format)
+        if not network_png:
+            del paths["network"]
+        if plan.heatmap == "none":
+            del paths["heatmap"]
+        schedule_output_write(session_id, result, output_dir, output_format, network_png, profile=debug,
+                              heatmap=plan.heatmap, heatmap_dpi=plan.heatmap_dpi)
+        
         # Prepare response with file URLs and content
         response_data = {
             "status": "success",
@@ -401,109 +877,15 @@ async def analyze_similarity(
             "session_id": session_id,
             "processed_files": processed_files,
             "file_name_mapping": file_name_mapping,
-            "parameters": {
-                "k_neighbors": k_neighbors,
-                "dup_threshold": dup_threshold,
-                "similar_threshold": similar_threshold
-            },
-            "results": {}
+            "parameters": parameters,
+            "memory_plan": memory_plan,
+            "results": build_results_payload(result, session_id, paths)
         }
-        
-                    # Add file URLs and content to response
-        for key, file_path in results.items():
-            if isinstance(file_path, str) and os.path.exists(file_path):
-                # Create session-specific file URL
-                file_url = f"/files/session_{session_id}/output/{Path(file_path).name}"
-                
-                # Initialize result object
-                response_data["results"][key] = {
-                    "url": file_url,
-                    "filename": Path(file_path).name
-                }
-                
-                # Handle different file types
-                if file_path.endswith('.json') and key == "overall_ranking":
-                    # Read the overall ranking JSON which contains matrix labels and metadata
-                    try:
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            ranking_data = json.load(f)
-                            
-                            # Extract data for heatmap visualization
-                            matrix_data = {
-                                "url": f"/files/session_{session_id}/output/similarity_heatmap.png",
-                                "data": {
-                                    "x_labels": ranking_data["matrix_labels"]["db_labels"],
-                                    "y_labels": ranking_data["matrix_labels"]["input_labels"],
-                                }
-                            }
-                            
-                            # Read similarity matrix CSV
-                            sim_matrix_path = os.path.join(output_dir, "similarity_matrix.csv")
-                            if os.path.exists(sim_matrix_path):
-                                sim_matrix = pd.read_csv(sim_matrix_path, index_col=0)
-                                matrix_data["data"]["values"] = sim_matrix.values.tolist()
-                            
-                            # Add heatmap data to response
-                            response_data["results"]["similarity_heatmap"] = matrix_data
-                            
-                            # Extract data for network visualization
-                            network_data = {
-                                "url": f"/files/session_{session_id}/output/network_top_matches.png",
-                                "data": {
-                                    "nodes": [],
-                                    "edges": []
-                                }
-                            }
-                            
-                            # Process nodes and edges from input analysis
-                            seen_nodes = set()
-                            for analysis in ranking_data["analysis_by_input"]:
-                                input_id = analysis["input_name"]
-                                if input_id not in seen_nodes:
-                                    seen_nodes.add(input_id)
-                                    network_data["data"]["nodes"].append({
-                                        "id": input_id,
-                                        "label": analysis["input_title"],
-                                        "is_input": True
-                                    })
-                                
-                                # Add top k similar documents as nodes and edges
-                                for i, sim in enumerate(analysis["similarities"][:k_neighbors]):
-                                    db_id = sim["database_file"]
-                                    if db_id not in seen_nodes:
-                                        seen_nodes.add(db_id)
-                                        network_data["data"]["nodes"].append({
-                                            "id": db_id,
-                                            "label": sim["display_name"],
-                                            "is_input": False
-                                        })
-                                    
-                                    # Add edge
-                                    network_data["data"]["edges"].append({
-                                        "source": input_id,
-                                        "target": db_id,
-                                        "weight": sim["similarity"] / 100  # Convert percentage back to 0-1 scale
-                                    })
-                            
-                            # Add network data to response
-                            response_data["results"]["network_top_matches"] = network_data
-                            
-                            # Store original data
-                            response_data["results"][key] = {
-                                "url": file_url,
-                                "content": ranking_data
-                            }
-                            
-                    except Exception as e:
-                        print(f"Error processing overall ranking data: {e}")
-                        
-                elif file_path.endswith(('.txt', '.csv')):
-                    # Other text files - include content directly
-                    try:
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            response_data["results"][key]["content"] = f.read()
-                    except Exception as e:
-                        print(f"Error reading text file {file_path}: {e}")
+        if debug:
+            response_data["profile"] = profile_payload(session_id, analysis_profile)
+        if key is not None:
+            schedule_cache_store(key, session_id, output_dir, response_data)
+        response_data["cache"] = cache_info(hit=False, bypassed=not use_cache or debug)
         
         return JSONResponse(content=response_data)
         
@@ -511,42 +893,493 @@ async def analyze_similarity(
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+    finally:
+        if not streaming:
+            analysis_admission.release(admitted_at)
+            if session_id:
+                session_manager.release(session_id)
 
 @app.get("/api/download/{session_id}")
-async def download_results(session_id: str):
-    """Download all analysis results as a ZIP file"""
+async def download_results(session_id: str, request: Request):
+    """
+    Download all analysis results as a ZIP file
+    
+    The archive is streamed while it is compressed. Once complete it is cached
+    in the session folder (keyed by the output files' fingerprint), and cached
+    archives honour HTTP Range requests so interrupted downloads can resume.
+    """
     
-    session_dir = TEMP_DIR / f"session_{session_id}"
+    session_dir = session_manager.session_dir(session_id)
     output_dir = session_dir / "output"
     
     if not output_dir.exists():
         raise HTTPException(status_code=404, detail="Session not found or results not available")
+    session_manager.touch(session_id)
+    await wait_for_outputs(session_id)
+    
+    archive = await asyncio.to_thread(ResultsArchive, session_dir, output_dir)
+    if not archive.files:
+        raise HTTPException(status_code=404, detail="No result files available for this session")
+    
+    headers = {
+        "Content-Disposition": f'attachment; filename="similarity_analysis_results_{session_id}.zip"',
+        "Accept-Ranges": "bytes",
+        "ETag": f'"{archive.etag}"'
+    }
+    
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and if_range and if_range.strip('"') != archive.etag:
+        # Outputs changed since the partial download started: send everything
+        range_header = None
+    
+    cached = archive.cached()
+    if range_header:
+        if cached is None:
+            cached = await asyncio.to_thread(archive.build)
+        size = cached.stat().st_size
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if byte_range is None:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+        return StreamingResponse(iter_file_range(cached, start, end), status_code=206,
+                                 media_type="application/zip", headers=headers)
+    
+    if cached is not None:
+        headers["Content-Length"] = str(cached.stat().st_size)
+        return StreamingResponse(iter_file_range(cached, 0, cached.stat().st_size - 1),
+                                 media_type="application/zip", headers=headers)
+    
+    return StreamingResponse(archive.stream(), media_type="application/zip", headers=headers)
+
+@app.get("/api/matches/{session_id}/{input_ref}")
+async def get_matches(session_id: str, input_ref: str, offset: int = 0, limit: int = 50):
+    """
+    Page through the full ranked match list of one input
+    
+    Args:
+        session_id: Session returned by /api/analyze
+        input_ref: Input index (0-based) or input file name
+        offset: Rank of the first match to return
+        limit: Page size (max 1000)
+    """
+    await wait_for_outputs(session_id)
+    scores_path = session_manager.session_dir(session_id) / "output" / MATCH_SCORES_FILE
+    if not scores_path.exists():
+        raise HTTPException(status_code=404, detail="Session not found or scores not available")
+    if limit < 1 or limit > 1000:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 1000")
+    session_manager.touch(session_id)
+    
+    try:
+        page = await asyncio.to_thread(load_match_page, str(scores_path), input_ref, offset, limit)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return page
+
+# Outputs that depend only on the score matrix stay valid for any k / thresholds
+SCORE_ONLY_OUTPUTS = ("similarity_matrix", "match_scores", "heatmap")
+
+def score_only_paths(output_dir: Path) -> Dict[str, str]:
+    """Existing score-only output files of a session (whatever its output format)"""
+    paths = {}
+    for fmt in OUTPUT_FORMATS:
+        for key, path in output_paths(str(output_dir), fmt).items():
+            if key in SCORE_ONLY_OUTPUTS and os.path.exists(path):
+                paths.setdefault(key, path)
+    return paths
+
+@app.post("/api/reclassify/{session_id}")
+async def reclassify_session(
+    session_id: str,
+    k_neighbors: int = Form(3, description="Number of top neighbors to find"),
+    dup_threshold: float = Form(0.90, description="Threshold for duplicate classification"),
+    similar_threshold: float = Form(0.60, description="Threshold for similar classification"),
+    match_limit: int = Form(DEFAULT_MATCH_LIMIT, description="Matches per input embedded in the response (0 = all)"),
+    network_png: bool = Form(False, description="Render a network PNG for the new k")
+):
+    """
+    Re-rank and re-classify a finished analysis with new k / thresholds
+    
+    Rankings, relations and the network are rebuilt from the session's stored
+    score matrix (match_scores.npz): nothing is extracted, fitted or scored
+    again. The session's files keep the original parameters, so only the
+    score-only outputs (similarity matrix, stored scores, heatmap) are linked,
+    along with a comparison table CSV for the new parameters and, when
+    requested, a network PNG for the new k.
+    """
+    if k_neighbors < 1 or k_neighbors > 100:
+        raise HTTPException(status_code=400, detail="k_neighbors must be between 1 and 100")
+    if not (0 <= similar_threshold <= 1 and 0 <= dup_threshold <= 1):
+        raise HTTPException(status_code=400, detail="Thresholds must be between 0 and 1")
+    await wait_for_outputs(session_id)
+    output_dir = session_manager.session_dir(session_id) / "output"
+    scores_path = output_dir / MATCH_SCORES_FILE
+    if not scores_path.exists():
+        raise HTTPException(status_code=404, detail="Session not found or scores not available")
+    session_manager.touch(session_id)
+    
+    started = time.perf_counter()
+    result = await asyncio.to_thread(
+        rerank_from_scores, str(scores_path), k_neighbors, dup_threshold, similar_threshold, match_limit
+    )
+    paths = await asyncio.to_thread(score_only_paths, output_dir)
+    tag = f"k{k_neighbors}_dup{dup_threshold:g}_sim{similar_threshold:g}"
+    paths["comparison_table"] = await asyncio.to_thread(
+        write_table, result.comparison_frame(), str(output_dir), f"comparison_table_{tag}", "csv"
+    )
+    await asyncio.to_thread(result.network)  # memoised: shared by the image worker and the payload
+    if network_png:
+        png_path = str(output_dir / f"network_top_matches_k{k_neighbors}.png")
+        session_manager.acquire(session_id)
+        try:
+            paths["network"] = await pipeline_pool.run(write_network_png, result, png_path)
+        finally:
+            session_manager.release(session_id)
+    results = build_results_payload(result, session_id, paths)
+    
+    return {
+        "status": "success",
+        "session_id": session_id,
+        "processed_files": result.in_labels,
+        "parameters": {
+            "k_neighbors": k_neighbors,
+            "dup_threshold": dup_threshold,
+            "similar_threshold": similar_threshold,
+            "match_limit": match_limit,
+            "network_png": network_png
+        },
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        "results": results
+    }
+
+@app.get("/api/network/{session_id}")
+async def get_network(session_id: str, k: int = 3, layout: str = "auto"):
+    """
+    Network layout data for a session, rebuilt from its stored scores
+    
+    Lets the client ask for a different top-k or layout without re-running
+    the analysis.
+    """
+    await wait_for_outputs(session_id)
+    scores_path = session_manager.session_dir(session_id) / "output" / MATCH_SCORES_FILE
+    if not scores_path.exists():
+        raise HTTPException(status_code=404, detail="Session not found or scores not available")
+    if k < 1 or k > 100:
+        raise HTTPException(status_code=400, detail="k must be between 1 and 100")
+    session_manager.touch(session_id)
+    
+    try:
+        network = await asyncio.to_thread(network_from_scores, str(scores_path), k, layout)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return network
+
+@app.post("/api/corpora")
+async def register_corpus(
+    database_file: UploadFile = File(..., description="ZIP file containing database documents"),
+    name: Optional[str] = Form(None, description="Optional display name for the corpus")
+):
+    """Register a database ZIP once so later queries only send their inputs"""
+    if not database_file.filename or not database_file.filename.endswith('.zip'):
+        raise HTTPException(status_code=400, detail="Database file must be a ZIP file")
+    
+    with tempfile.TemporaryDirectory(dir=TEMP_DIR, prefix="corpus_") as tmp:
+        zip_path = Path(tmp) / Path(database_file.filename).name
+        await save_upload_file(database_file, zip_path)
+        try:
+            manifest = await asyncio.to_thread(corpus_registry.register, zip_path, name)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "success", "corpus": manifest}
+
+@app.get("/api/corpora")
+async def list_corpora():
+    """List registered corpora"""
+    return {"corpora": await asyncio.to_thread(corpus_registry.list)}
+
+@app.delete("/api/corpora/{corpus_id}")
+async def drop_corpus(corpus_id: str):
+    """Remove a registered corpus and its index"""
+    if not await asyncio.to_thread(corpus_registry.drop, corpus_id):
+        raise HTTPException(status_code=404, detail="Corpus not found")
+    return {"status": "success", "message": f"Corpus {corpus_id} removed"}
+
+@app.get("/api/corpora/{corpus_id}/duplicates")
+async def corpus_duplicates(corpus_id: str, threshold: float = 0.90):
+    """
+    Duplicate / near-copy clusters inside a registered corpus
+    
+    Uses the corpus' fitted matrix; pairs are computed block-wise above the
+    threshold, never as a full N x N matrix.
+    """
+    if not 0 < threshold <= 1:
+        raise HTTPException(status_code=400, detail="threshold must be in (0, 1]")
+    try:
+        engine = await asyncio.to_thread(corpus_registry.get_engine, corpus_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Corpus not found")
+    
+    result = await asyncio.to_thread(find_duplicates, engine.matrix, engine.metadata, threshold, workers=1)
+    return {
+        "status": "success",
+        "corpus_id": corpus_id,
+        "summary": result["summary"],
+        "clusters": result["clusters"]
+    }
+
+@app.post("/api/corpora/{corpus_id}/clusters")
+async def cluster_corpus(
+    corpus_id: str,
+    n_clusters: Optional[int] = Form(None, description="Number of clusters (default: number of folder genres)"),
+    svd_components: Optional[int] = Form(None, description="Reduce TF-IDF vectors to this many dimensions first")
+):
+    """
+    Cluster a registered corpus for genre discovery
+    
+    Reports each cluster's top terms and folder-genre mix, and attaches the
+    clusters to the corpus as a routing layer for /api/query (n_probe).
+    """
+    try:
+        engine = await asyncio.to_thread(corpus_registry.get_engine, corpus_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Corpus not found")
+    
+    try:
+        router, (summary, clusters, _, assignments) = await asyncio.to_thread(
+            cluster_engine, engine, n_clusters, svd_components
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    engine.set_router(router)
+    await asyncio.to_thread(corpus_registry.save_engine, corpus_id)
+    
+    return {
+        "status": "success",
+        "corpus_id": corpus_id,
+        "summary": summary,
+        "clusters": clusters,
+        "misfiled_candidates": assignments[~assignments["matches_folder_genre"]].to_dict("records")
+    }
+
+@app.post("/api/query")
+async def query_corpus(
+    corpus_id: str = Form(..., description="Id of a registered corpus"),
+    input_files: List[UploadFile] = File(default=[], description="Input files to compare (.txt, .docx, .pdf)"),
+    text_input: Optional[str] = Form(None, description="Optional direct text input"),
+    k_neighbors: int = Form(3, description="Number of top neighbors to find"),
+    dup_threshold: float = Form(0.90, description="Threshold for duplicate classification"),
+    similar_threshold: float = Form(0.60, description="Threshold for similar classification"),
+    match_limit: int = Form(DEFAULT_MATCH_LIMIT, description="Matches per input (and overall ranking entries) to return (0 = all)"),
+    n_probe: int = Form(0, description="Score only the n closest clusters (needs /api/corpora/{id}/clusters; 0 = all)"),
+    n_novels: int = Form(0, description="Two-stage retrieval: score only the chapters of the n closest novels (0 = all)"),
+    snippets: bool = Form(False, description="Attach a passage of each input's top match from the corpus text store")
+):
+    """
+    Rank inputs against a registered corpus
+    
+    Only the inputs are uploaded; the corpus index is already fitted and kept
+    in memory, so no session folder or output files are created. With
+    n_novels the response also carries a novel-level ranking.
+    """
+    if len(input_files) > QUERY_MAX_INPUTS:
+        raise HTTPException(status_code=400, detail=f"Maximum {QUERY_MAX_INPUTS} input files allowed")
+    if len(input_files) == 0 and not (text_input and text_input.strip()):
+        raise HTTPException(status_code=400, detail="At least one input file or text input is required")
     
-    # Create ZIP file with all results
-    zip_path = session_dir / "results.zip"
+    if not corpus_registry.exists(corpus_id):
+        raise HTTPException(status_code=404, detail="Corpus not found")
     
-    with zipfile.ZipFile(zip_path, 'w') as zip_file:
-        for file_path in output_dir.glob("*"):
-            if file_path.is_file():
-                zip_file.write(file_path, file_path.name)
+    names, texts = await read_query_inputs(input_files, text_input)
     
-    if not zip_path.exists():
-        raise HTTPException(status_code=404, detail="Failed to create results archive")
+    query_kwargs = dict(
+        n_probe=n_probe,
+        n_novels=n_novels,
+        k_neighbors=k_neighbors,
+        dup_threshold=dup_threshold,
+        similar_threshold=similar_threshold,
+        match_limit=match_limit
+    )
+    try:
+        if pipeline_pool.enabled:
+            # Workers keep their own cached copy of the index
+            outcome = await pipeline_pool.run(query_job, str(corpus_registry.index_path(corpus_id)), texts, names, **query_kwargs)
+        else:
+            engine = await asyncio.to_thread(corpus_registry.get_engine, corpus_id)
+            outcome = await pipeline_pool.run(run_query, engine, texts, names, **query_kwargs)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Corpus not found")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Query failed: {str(e)}")
+    result, novel_ranking = outcome["result"], outcome["novel_ranking"]
     
+    overall = result.overall_ranking()
+    results = {
+        "comparison": [{k: v for k, v in row.items() if k != "input_similarities"} for row in result.rows],
+        "analysis_by_input": overall["analysis_by_input"],
+        "db_overall_rank": overall["db_overall_rank"][:match_limit] if match_limit else overall["db_overall_rank"],
+        "genre_rank_overall": overall["genre_rank_overall"],
+        "analysis_info": overall["analysis_info"]
+    }
+    if novel_ranking is not None:
+        results["novel_ranking"] = [
+            {"input_name": name, "novels": novels} for name, novels in zip(names, novel_ranking)
+        ]
+    if snippets:
+        try:
+            passages = await asyncio.to_thread(top_match_passages, corpus_id, result, texts)
+        except KeyError:
+            passages = None  # corpus registered before text stores existed
+        for row, passage in zip(results["comparison"], passages or []):
+            row["top_passage"] = passage
+    return {
+        "status": "success",
+        "corpus_id": corpus_id,
+        "processed_files": names,
+        "parameters": {
+            "k_neighbors": k_neighbors,
+            "dup_threshold": dup_threshold,
+            "similar_threshold": similar_threshold,
+            "match_limit": match_limit,
+            "n_probe": outcome["n_probe"],
+            "n_novels": outcome["n_novels"]
+        },
+        "results": results
+    }
+
+def top_match_passages(corpus_id: str, result: SimilarityResult, texts: List[str]) -> List[Dict]:
+    """Passage of each input's best match around the input's key terms"""
+    store = corpus_registry.text_store(corpus_id)
+    engine = corpus_registry.get_engine(corpus_id)
+    terms = engine.key_terms(texts, preprocess=True)
+    passages = []
+    for i in range(len(texts)):
+        best, _ = top_candidates(result.S, i, 1)
+        passages.append(store.passage(int(best[0]), terms[i]) if len(best) else None)
+    return passages
+
+@app.get("/api/corpora/{corpus_id}/documents/{doc_index}")
+async def corpus_document(corpus_id: str, doc_index: int, q: Optional[str] = None,
+                          max_bytes: int = DEFAULT_SNIPPET_BYTES):
+    """
+    Metadata and a passage of one corpus document
+    
+    The passage is read straight from the memory-mapped text store: around
+    the first word of ``q`` found in the document, else its opening.
+    """
+    if max_bytes < 1:
+        raise HTTPException(status_code=400, detail="max_bytes must be positive")
+    try:
+        store = await asyncio.to_thread(corpus_registry.text_store, corpus_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Corpus or text store not found")
+    if not 0 <= doc_index < len(store):
+        raise HTTPException(status_code=404, detail="Document not found")
+    terms = q.split() if q else []
+    return {
+        "status": "success",
+        "corpus_id": corpus_id,
+        "doc_index": doc_index,
+        "metadata": store.metadata[doc_index],
+        "passage": store.passage(doc_index, terms, max_bytes)
+    }
+
+@app.post("/api/jobs/batch")
+async def create_batch_job(
+    corpus_id: str = Form(..., description="Id of a registered corpus"),
+    inputs_archive: UploadFile = File(..., description="ZIP archive of .txt inputs to screen"),
+    top_k: int = Form(DEFAULT_TOP_K, description="Top matches written per input"),
+    batch_size: int = Form(DEFAULT_BATCH_SIZE, description="Inputs scored per micro-batch"),
+    dup_threshold: float = Form(0.90, description="Threshold for duplicate classification"),
+    similar_threshold: float = Form(0.60, description="Threshold for similar classification"),
+    n_novels: int = Form(0, description="Two-stage retrieval: score only the chapters of the n closest novels (0 = all)")
+):
+    """
+    Start a batch screening job
+    
+    Inputs are scored in micro-batches on a background thread; results are
+    appended to a JSONL file that can be fetched while the job runs.
+    """
+    if not inputs_archive.filename or not inputs_archive.filename.endswith('.zip'):
+        raise HTTPException(status_code=400, detail="Inputs archive must be a ZIP file")
+    if top_k < 1 or batch_size < 1:
+        raise HTTPException(status_code=400, detail="top_k and batch_size must be positive")
+    try:
+        engine = await asyncio.to_thread(corpus_registry.get_engine, corpus_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Corpus not found")
+    
+    job_id, archive_path = batch_jobs.create(corpus_id, {
+        "top_k": top_k,
+        "batch_size": batch_size,
+        "dup_threshold": dup_threshold,
+        "similar_threshold": similar_threshold,
+        "n_novels": max(n_novels, 0)
+    })
+    await save_upload_file(inputs_archive, archive_path)
+    if not zipfile.is_zipfile(archive_path):
+        await asyncio.to_thread(batch_jobs.remove, job_id)
+        raise HTTPException(status_code=400, detail="Inputs archive is not a valid ZIP file")
+    batch_jobs.start(job_id, engine)
+    return {"status": "accepted", "job": batch_jobs.status(job_id)}
+
+@app.get("/api/jobs/{job_id}")
+async def get_batch_job(job_id: str):
+    """Status and progress of a batch job"""
+    try:
+        return {"job": batch_jobs.status(job_id)}
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+@app.post("/api/jobs/{job_id}/resume")
+async def resume_batch_job(job_id: str):
+    """Resume an interrupted, stopped or failed job after its last complete line"""
+    try:
+        job = batch_jobs.status(job_id)
+        engine = await asyncio.to_thread(corpus_registry.get_engine, job["corpus_id"])
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    if job["status"] == "completed":
+        return {"status": "completed", "job": job}
+    batch_jobs.start(job_id, engine)
+    return {"status": "accepted", "job": batch_jobs.status(job_id)}
+
+@app.post("/api/jobs/{job_id}/stop")
+async def stop_batch_job(job_id: str):
+    """Stop a running job after its current micro-batch"""
+    try:
+        batch_jobs.status(job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Job not found")
+    batch_jobs.stop(job_id)
+    return {"status": "stopping", "job_id": job_id}
+
+@app.get("/api/jobs/{job_id}/results")
+async def get_batch_results(job_id: str):
+    """JSONL results written so far (one line per input)"""
+    try:
+        results_path = batch_jobs.results_path(job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not results_path.exists():
+        raise HTTPException(status_code=404, detail="Job not found or no results yet")
     return FileResponse(
-        path=str(zip_path),
-        filename=f"similarity_analysis_results_{session_id}.zip",
-        media_type="application/zip"
+        path=str(results_path),
+        filename=f"batch_results_{job_id}.jsonl",
+        media_type="application/x-ndjson"
     )
 
 @app.delete("/api/cleanup/{session_id}")
 async def cleanup_session(session_id: str):
     """Clean up temporary files for a session"""
     
-    session_dir = TEMP_DIR / f"session_{session_id}"
-    
-    if session_dir.exists():
-        shutil.rmtree(session_dir)
+    await wait_for_outputs(session_id)
+    if session_manager.remove(session_id):
         return {"status": "success", "message": f"Session {session_id} cleaned up"}
     else:
         raise HTTPException(status_code=404, detail="Session not found")
@@ -563,9 +1396,24 @@ async def health_check():
         "status": "healthy",
         "thai_support": THAI_SUPPORT,
         "temp_dir_exists": TEMP_DIR.exists(),
+        "session_storage": await asyncio.to_thread(session_manager.stats),
+        "pipeline_workers": pipeline_pool.stats(),
+        "analysis_admission": analysis_admission.stats(),
+        "result_cache": await asyncio.to_thread(result_cache.stats),
         "available_endpoints": [
             "/api/analyze",
             "/api/download/{session_id}",
+            "/api/matches/{session_id}/{input_ref}",
+            "/api/network/{session_id}",
+            "/api/reclassify/{session_id}",
+            "/api/corpora",
+            "/api/corpora/{corpus_id}",
+            "/api/corpora/{corpus_id}/duplicates",
+            "/api/corpora/{corpus_id}/clusters",
+            "/api/corpora/{corpus_id}/documents/{doc_index}",
+            "/api/query",
+            "/api/jobs/batch",
+            "/api/jobs/{job_id}",
             "/api/cleanup/{session_id}",
             "/api/health"
         ]
@@ -0,0 +1,289 @@
+"""
+Memory planning for a pipeline run, before anything is loaded
+
+The big allocations of an analysis scale differently:
+
+    corpus index     vocabulary (~ corpus tokens^0.5) and the sparse float64
+                     X_db (non-zeros ~ documents x distinct terms per document)
+    scores           dense S, N_in x N_db float64, plus the sparse product
+                     cosine_similarity builds before densifying it
+    match lists      one dict per (input, match) in input_similarities
+    heatmap          canvas pixels grow with N_db (fixed 40px cells at
+                     300 DPI) and one text artist per annotated cell
+
+``plan_memory`` estimates each stage's peak from file sizes alone (nothing is
+read) and fits the run into a memory budget by, in order:
+
+    1. scoring S in column blocks instead of one sparse product
+    2. rendering the heatmap without cell annotations, then at a lower DPI,
+       then not at all (the matrix is still written as a table)
+    3. truncating the per-input match lists (match_limit)
+
+If the run still does not fit, it is refused with MemoryBudgetExceeded
+before the corpus is loaded. ``MemoryPlan.explain()`` is the dry-run report.
+
+Estimates use rough constants for tokens per byte and Python object sizes;
+they are meant to be within a small factor, not exact.
+"""
+
+import os
+import glob
+import math
+from dataclasses import dataclass, field, asdict
+from typing import Dict, List, Optional
+
+from novel_similarity_pipeline import DEFAULT_MATCH_LIMIT, iter_database
+
+DEFAULT_MEMORY_BUDGET_MB = 1536
+HEATMAP_MODES = ("annotated", "plain", "none")
+HEATMAP_DPI = 300
+MIN_HEATMAP_DPI = 50
+
+# Rough sizes
+BYTES_PER_TOKEN = 6             # average UTF-8 bytes per token incl. separator
+HEAPS_K, HEAPS_BETA = 40.0, 0.5  # distinct terms ~ K * tokens^beta (Heaps' law)
+VOCAB_ENTRY_BYTES = 120         # str + dict slot + int in vectorizer.vocabulary_ (while fitting)
+COMPACT_VOCAB_ENTRY_BYTES = 24  # UTF-8 term + offset + hash slots (compact_vocabulary.py)
+SPARSE_ENTRY_BYTES = 12         # float64 value + int32 index
+TOKEN_OBJECT_BYTES = 60         # str object per token while analysing a document
+MATCH_ENTRY_BYTES = 900         # one input_similarities dict (keys + values)
+DB_RANK_ENTRY_BYTES = 1200      # db_overall_rank entry + db_metadata entry
+TEXT_ARTIST_BYTES = 3000        # matplotlib Text per annotated cell / tick label
+PIXEL_BYTES = 8                 # RGBA canvas + PNG encoding buffer
+BASE_PROCESS_BYTES = 150 * 1024 ** 2  # interpreter, numpy, sklearn, pandas, matplotlib
+
+
+class MemoryBudgetExceeded(ValueError):
+    """The run cannot fit the memory budget even with every reduction applied"""
+
+    def __init__(self, plan: "MemoryPlan"):
+        worst = max(plan.stages, key=lambda s: s["peak_bytes"])
+        super().__init__(
+            f"Estimated peak memory {_mb(plan.peak_bytes)} exceeds the budget of {_mb(plan.budget_bytes)} "
+            f"(largest stage: {worst['stage']}, {_mb(worst['peak_bytes'])}). Reduce the corpus "
+            f"(e.g. fewer files per genre) or raise the memory budget."
+        )
+        self.plan = plan
+
+
+def _mb(n: float) -> str:
+    return f"{n / 1024 ** 2:,.1f}MB"
+
+
+def _distinct_terms(tokens: float) -> float:
+    return min(tokens, HEAPS_K * tokens ** HEAPS_BETA) if tokens > 0 else 0.0
+
+
+@dataclass
+class CorpusStats:
+    """Sizes the planner works from (from ``os.stat``, files are not read)"""
+    n_db: int
+    n_in: int
+    db_bytes: int
+    in_bytes: int
+    max_doc_bytes: int
+
+    @property
+    def db_tokens(self) -> float:
+        return self.db_bytes / BYTES_PER_TOKEN
+
+    @property
+    def vocabulary(self) -> int:
+        return int(_distinct_terms(self.db_tokens))
+
+    @property
+    def nnz_db(self) -> int:
+        """Non-zeros of X_db: distinct terms per (average) document"""
+        if not self.n_db:
+            return 0
+        return int(self.n_db * _distinct_terms(self.db_tokens / self.n_db))
+
+
+def corpus_stats(db_root: str, input_root: str, max_files_per_genre: Optional[int] = 50,
+                 max_inputs: int = 5) -> CorpusStats:
+    """Statistics for the files ``compute_similarity`` would load"""
+    db_sizes = [os.path.getsize(path) for path, _ in iter_database(db_root, max_files_per_genre)]
+    in_sizes = [os.path.getsize(p) for p in sorted(glob.glob(os.path.join(input_root, "*.txt")))[:max_inputs]]
+    return CorpusStats(
+        n_db=len(db_sizes),
+        n_in=len(in_sizes),
+        db_bytes=sum(db_sizes),
+        in_bytes=sum(in_sizes),
+        max_doc_bytes=max(db_sizes + in_sizes, default=0),
+    )
+
+
+@dataclass
+class MemoryPlan:
+    """Chosen settings and per-stage peak estimates (bytes)"""
+    budget_bytes: int
+    stats: CorpusStats
+    block_size: int = 0               # DB documents per scoring block (0 = one product)
+    match_limit: int = DEFAULT_MATCH_LIMIT
+    heatmap: str = "annotated"
+    heatmap_dpi: int = HEATMAP_DPI
+    stages: List[Dict] = field(default_factory=list)
+    adjustments: List[str] = field(default_factory=list)
+
+    @property
+    def peak_bytes(self) -> int:
+        return max((s["peak_bytes"] for s in self.stages), default=0)
+
+    @property
+    def fits(self) -> bool:
+        return self.peak_bytes <= self.budget_bytes
+
+    def to_dict(self) -> Dict:
+        data = asdict(self)
+        data["stats"].update(vocabulary=self.stats.vocabulary, nnz_db=self.stats.nnz_db)
+        data.update(peak_bytes=self.peak_bytes, fits=self.fits)
+        return data
+
+    def explain(self) -> str:
+        s = self.stats
+        lines = [
+            "# Memory plan\n",
+            f"- Corpus: {s.n_db} documents ({_mb(s.db_bytes)}), ~{s.vocabulary:,} terms, ~{s.nnz_db:,} non-zeros",
+            f"- Inputs: {s.n_in} ({_mb(s.in_bytes)})",
+            f"- Budget: {_mb(self.budget_bytes)}; estimated peak: {_mb(self.peak_bytes)} "
+            f"({'fits' if self.fits else 'DOES NOT FIT'})\n",
+            "## Stages (estimated peak, including memory held from earlier stages)",
+        ]
+        for stage in self.stages:
+            lines.append(f"- {stage['stage']}: {_mb(stage['peak_bytes'])}  ({stage['detail']})")
+        lines.append("\n## Settings")
+        lines.append(f"- Scoring: {'blocks of ' + str(self.block_size) + ' documents' if self.block_size else 'single product'}")
+        lines.append(f"- Match list per input: {self.match_limit or 'all'} entries")
+        lines.append(f"- Heatmap: {self.heatmap}" + (f" at {self.heatmap_dpi} DPI" if self.heatmap != "none" else ""))
+        if self.adjustments:
+            lines.append("\n## Adjustments to fit the budget")
+            lines.extend(f"- {a}" for a in self.adjustments)
+        return "\n".join(lines)
+
+
+# ---------------------------
+# Estimates
+# ---------------------------
+
+def _heatmap_bytes(stats: CorpusStats, mode: str, dpi: int) -> int:
+    if mode == "none":
+        return 0
+    # Same figure geometry as plot_heatmap: 40px cells at 300 DPI plus margins
+    width = max(8, stats.n_db * 40 / 300 + 3) * dpi
+    height = max(6, stats.n_in * 40 / 300 + 2.5) * dpi
+    artists = stats.n_db + stats.n_in + (stats.n_in * stats.n_db if mode == "annotated" else 0)
+    return int(width * height * PIXEL_BYTES + artists * TEXT_ARTIST_BYTES)
+
+
+def estimate_stages(plan: MemoryPlan) -> List[Dict]:
+    """Peak bytes per pipeline stage for the plan's settings"""
+    s = plan.stats
+    fit_vocab = s.vocabulary * VOCAB_ENTRY_BYTES
+    vocab = s.vocabulary * COMPACT_VOCAB_ENTRY_BYTES
+    x_db = s.nnz_db * SPARSE_ENTRY_BYTES + (s.n_db + 1) * 4
+    centroids = s.nnz_db * 6  # float32 novel centroids, at most one per document
+    doc_tokens = s.max_doc_bytes / BYTES_PER_TOKEN * TOKEN_OBJECT_BYTES
+    index = vocab + x_db + centroids
+    scores = s.n_in * s.n_db * 8
+    columns = plan.block_size or s.n_db
+    product = s.n_in * columns * (SPARSE_ENTRY_BYTES + (8 if plan.block_size else 0))
+    matches = s.n_in * min(plan.match_limit or s.n_db, s.n_db) * MATCH_ENTRY_BYTES
+    db_rank = s.n_db * DB_RANK_ENTRY_BYTES
+    ranked = index + scores + matches + db_rank
+
+    base = BASE_PROCESS_BYTES
+    return [
+        {"stage": "1) Load database and build the corpus index",
+         "peak_bytes": int(base + index + fit_vocab + 2 * x_db + doc_tokens),
+         "detail": f"vocabulary {_mb(fit_vocab)} while fitting ({_mb(vocab)} compacted), X_db {_mb(x_db)} (+ counts while fitting), novel centroids {_mb(centroids)}"},
+        {"stage": "3) Vectorize inputs and compute similarities",
+         "peak_bytes": int(base + index + scores + product),
+         "detail": f"S {_mb(scores)}, product {_mb(product)}"},
+        {"stage": "4) Per-input rankings",
+         "peak_bytes": int(base + ranked),
+         "detail": f"match lists {_mb(matches)}, overall DB ranking {_mb(db_rank)}"},
+        {"stage": "8) Save tables",
+         "peak_bytes": int(base + ranked + 3 * scores + matches),
+         "detail": "similarity matrix frame and text, overall_ranking.json payload"},
+        {"stage": "9) Visualizations",
+         "peak_bytes": int(base + ranked + _heatmap_bytes(s, plan.heatmap, plan.heatmap_dpi)),
+         "detail": f"heatmap {plan.heatmap}" + (f" at {plan.heatmap_dpi} DPI" if plan.heatmap != "none" else "")},
+    ]
+
+
+# ---------------------------
+# Planning
+# ---------------------------
+
+def plan_memory(stats: CorpusStats, budget_mb: float = DEFAULT_MEMORY_BUDGET_MB,
+                match_limit: Optional[int] = DEFAULT_MATCH_LIMIT,
+                k_neighbors: int = 3, heatmap: str = "annotated") -> MemoryPlan:
+    """
+    Settings that keep the run within ``budget_mb``
+
+    ``match_limit`` and ``heatmap`` are the requested settings; they are only
+    reduced when needed. Check ``plan.fits`` or use ``require_fit``.
+    """
+    if heatmap not in HEATMAP_MODES:
+        raise ValueError(f"heatmap must be one of: {', '.join(HEATMAP_MODES)}")
+    plan = MemoryPlan(budget_bytes=int(budget_mb * 1024 ** 2), stats=stats,
+                      match_limit=match_limit or 0, heatmap=heatmap)
+
+    def refresh() -> bool:
+        plan.stages = estimate_stages(plan)
+        return plan.fits
+
+    if refresh():
+        return plan
+
+    # 1) Score in column blocks: bounds the sparse product to one block
+    if stats.n_in:
+        per_column = stats.n_in * (SPARSE_ENTRY_BYTES + 8)
+        block = max(256, int(plan.budget_bytes * 0.05 / per_column))
+        if block < stats.n_db:
+            plan.block_size = block
+            plan.adjustments.append(f"score in blocks of {block} documents")
+            if refresh():
+                return plan
+
+    # 2) Cheaper heatmap: no annotations, lower DPI, then none
+    if plan.heatmap == "annotated":
+        plan.heatmap = "plain"
+        plan.adjustments.append("heatmap rendered without cell annotations")
+        if refresh():
+            return plan
+    while plan.heatmap == "plain" and plan.heatmap_dpi > MIN_HEATMAP_DPI:
+        plan.heatmap_dpi = max(MIN_HEATMAP_DPI, plan.heatmap_dpi // 2)
+        if refresh():
+            plan.adjustments.append(f"heatmap rendered at {plan.heatmap_dpi} DPI")
+            return plan
+    if plan.heatmap != "none":
+        plan.heatmap = "none"
+        plan.heatmap_dpi = HEATMAP_DPI
+        plan.adjustments.append("heatmap image skipped (the similarity matrix table is still written)")
+        if refresh():
+            return plan
+
+    # 3) Truncate match lists (the full scores stay in match_scores.npz)
+    floor = max(k_neighbors, 1)
+    current = plan.match_limit or stats.n_db
+    if current > floor:
+        per_entry = stats.n_in * MATCH_ENTRY_BYTES * 2  # counted in ranking and in the JSON payload
+        over = plan.peak_bytes - plan.budget_bytes
+        plan.match_limit = max(floor, current - math.ceil(over / per_entry)) if per_entry else floor
+        plan.adjustments.append(f"match lists truncated to {plan.match_limit} entries per input")
+        refresh()
+    return plan
+
+
+def plan_run(db_root: str, input_root: str, budget_mb: float = DEFAULT_MEMORY_BUDGET_MB,
+             match_limit: Optional[int] = DEFAULT_MATCH_LIMIT, k_neighbors: int = 3) -> MemoryPlan:
+    """``plan_memory`` for the files a ``compute_similarity`` run would load"""
+    return plan_memory(corpus_stats(db_root, input_root), budget_mb, match_limit, k_neighbors)
+
+
+def require_fit(plan: MemoryPlan) -> MemoryPlan:
+    """Return the plan, or raise MemoryBudgetExceeded if it does not fit"""
+    if not plan.fits:
+        raise MemoryBudgetExceeded(plan)
+    return plan
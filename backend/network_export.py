@@ -0,0 +1,214 @@
+"""
+Network export: the input <-> database top-k graph as layout data
+
+The graph is built once from the top-k scores of each input, laid out on the
+server and written as compact columnar JSON (node arrays plus edge index
+arrays) for client-side rendering. Rendering a PNG from it is optional.
+
+Layouts ("auto" picks by node count):
+    columns   inputs on the left, database documents on the right, each DB
+              node placed at the mean height of the inputs it connects to
+              (up to ``COLUMN_LAYOUT_MAX_NODES`` nodes)
+    spring    networkx force-directed layout, seeded with the column layout
+              (up to ``SPRING_LAYOUT_MAX_NODES``, where networkx still uses
+              its vectorised solver)
+    spectral  sparse-eigenvector layout of each connected component, with
+              the components packed in rows; scales to thousands of nodes
+"""
+
+import json
+import math
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import networkx as nx
+
+NETWORK_FILE = "network.json"
+COLUMN_LAYOUT_MAX_NODES = 300
+SPRING_LAYOUT_MAX_NODES = 500
+LAYOUTS = ("auto", "columns", "spring", "spectral")
+SPRING_ITERATIONS = 50
+COORD_DECIMALS = 4
+
+
+def top_k_edges(S: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(input index, db index, weight) of each input's k best matches, best first"""
+    n_in, n_db = S.shape
+    k = max(0, min(k, n_db))
+    if k == 0 or n_in == 0:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+    top = np.argpartition(-S, k - 1, axis=1)[:, :k] if k < n_db else np.tile(np.arange(n_db), (n_in, 1))
+    top_scores = np.take_along_axis(S, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind="stable")
+    cols = np.take_along_axis(top, order, axis=1)
+    rows = np.repeat(np.arange(n_in), k)
+    return rows, cols.reshape(-1), np.take_along_axis(top_scores, order, axis=1).reshape(-1).astype(np.float32)
+
+# ---------------------------
+# Layouts
+# ---------------------------
+
+def _spread(n: int) -> np.ndarray:
+    return np.linspace(-1.0, 1.0, n) if n > 1 else np.zeros(n)
+
+def column_layout(n_inputs: int, n_db: int, src: np.ndarray, dst: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """Inputs at x=-1, DB nodes at x=1 ordered by the weighted mean height of their inputs"""
+    pos = np.zeros((n_inputs + n_db, 2))
+    pos[:n_inputs, 0] = -1.0
+    pos[:n_inputs, 1] = _spread(n_inputs)
+    pos[n_inputs:, 0] = 1.0
+    if n_db:
+        db = dst - n_inputs
+        w = np.maximum(weights.astype(float), 1e-6)
+        centre = np.bincount(db, weights=w * pos[src, 1], minlength=n_db) / np.bincount(db, weights=w, minlength=n_db)
+        pos[n_inputs + np.argsort(centre, kind="stable"), 1] = _spread(n_db)
+    return pos
+
+def _graph(n_nodes: int, src: np.ndarray, dst: np.ndarray, weights: np.ndarray) -> nx.Graph:
+    G = nx.Graph()
+    G.add_nodes_from(range(n_nodes))
+    G.add_weighted_edges_from(zip(src.tolist(), dst.tolist(), weights.astype(float).tolist()))
+    return G
+
+def _scale(pos: np.ndarray) -> np.ndarray:
+    """Centre and scale positions into [-1, 1]"""
+    if not len(pos):
+        return pos
+    pos = pos - (pos.max(axis=0) + pos.min(axis=0)) / 2
+    span = np.abs(pos).max()
+    return pos / span if span > 0 else pos
+
+def spring_layout(n_nodes: int, src: np.ndarray, dst: np.ndarray, weights: np.ndarray,
+                  initial: Optional[np.ndarray] = None, seed: int = 0) -> np.ndarray:
+    """Force-directed layout scaled to [-1, 1]"""
+    G = _graph(n_nodes, src, dst, weights)
+    init = {i: tuple(p) for i, p in enumerate(initial)} if initial is not None else None
+    layout = nx.spring_layout(G, pos=init, weight="weight", iterations=SPRING_ITERATIONS, seed=seed)
+    return _scale(np.array([layout[i] for i in range(n_nodes)], dtype=float))
+
+def spectral_layout(n_nodes: int, src: np.ndarray, dst: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """
+    Spectral layout per connected component, components shelf-packed
+
+    A single spectral layout would collapse each component to a point, so
+    every component is laid out on its own inside a square whose side grows
+    with the square root of its size.
+    """
+    G = _graph(n_nodes, src, dst, weights)
+    components = sorted((sorted(c) for c in nx.connected_components(G)), key=len, reverse=True)
+    pos = np.zeros((n_nodes, 2))
+    row_width = math.sqrt(n_nodes)
+    x = y = row_height = 0.0
+    for nodes in components:
+        side = math.sqrt(len(nodes))
+        if x > 0 and x + side > row_width:
+            x, y, row_height = 0.0, y - row_height, 0.0
+        if len(nodes) > 2:
+            layout = nx.spectral_layout(G.subgraph(nodes), weight="weight")
+            local = np.array([layout[n] for n in nodes], dtype=float)
+        else:
+            local = np.array([[0.0, 0.0], [1.0, 0.0]][:len(nodes)])
+        local = (_scale(local) + 1) / 2 * side * 0.9  # [0, side) with a margin
+        pos[nodes] = local + [x, y - side]
+        x += side
+        row_height = max(row_height, side)
+    return _scale(pos)
+
+# ---------------------------
+# Graph
+# ---------------------------
+
+def build_network(S: np.ndarray, input_ids: List[str], input_labels: List[str],
+                  db_ids: List[str], db_labels: List[str], k: int,
+                  layout: str = "auto") -> Dict:
+    """
+    Top-k bipartite graph with positions, as columnar arrays
+
+    Nodes are inputs first, then the DB documents that appear in any top-k
+    list (in corpus order). Edges reference nodes by position.
+
+    Args:
+        layout: one of LAYOUTS; "auto" picks columns, spring or spectral by size
+    """
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown layout '{layout}'. Expected one of: {', '.join(LAYOUTS)}")
+    rows, cols, weights = top_k_edges(S, k)
+    n_in = len(input_ids)
+    used_db, dst_db = np.unique(cols, return_inverse=True)
+    src = rows
+    dst = dst_db.reshape(-1) + n_in
+    n_nodes = n_in + len(used_db)
+
+    if layout == "auto":
+        if n_nodes <= COLUMN_LAYOUT_MAX_NODES:
+            layout = "columns"
+        elif n_nodes <= SPRING_LAYOUT_MAX_NODES:
+            layout = "spring"
+        else:
+            layout = "spectral"
+    if layout == "spectral":
+        pos = spectral_layout(n_nodes, src, dst, weights)
+    else:
+        pos = column_layout(n_in, len(used_db), src, dst, weights)
+        if layout == "spring":
+            pos = spring_layout(n_nodes, src, dst, weights, initial=pos)
+
+    return {
+        "layout": layout,
+        "k": k,
+        "nodes": {
+            "id": list(input_ids) + [db_ids[j] for j in used_db],
+            "label": list(input_labels) + [db_labels[j] for j in used_db],
+            "is_input": [True] * n_in + [False] * len(used_db),
+            "db_index": [None] * n_in + used_db.tolist(),
+            "x": np.round(pos[:, 0], COORD_DECIMALS).tolist(),
+            "y": np.round(pos[:, 1], COORD_DECIMALS).tolist(),
+        },
+        "edges": {
+            "source": src.tolist(),
+            "target": dst.tolist(),
+            "weight": np.round(weights.astype(float), COORD_DECIMALS).tolist(),
+        }
+    }
+
+def network_records(network: Dict) -> Dict[str, List[Dict]]:
+    """Row-oriented nodes/edges (ids instead of positions) as the front end consumes them"""
+    nodes = network["nodes"]
+    ids = nodes["id"]
+    return {
+        "layout": network["layout"],
+        "nodes": [
+            {"id": ids[i], "label": nodes["label"][i], "is_input": nodes["is_input"][i],
+             "x": nodes["x"][i], "y": nodes["y"][i]}
+            for i in range(len(ids))
+        ],
+        "edges": [
+            {"source": ids[s], "target": ids[t], "weight": w}
+            for s, t, w in zip(network["edges"]["source"], network["edges"]["target"], network["edges"]["weight"])
+        ]
+    }
+
+def network_edges(network: Dict) -> List[Tuple[str, str, float]]:
+    """(input_id, db_id, weight) triples, e.g. for ``plot_network``"""
+    ids = network["nodes"]["id"]
+    edges = network["edges"]
+    return [(ids[s], ids[t], w) for s, t, w in zip(edges["source"], edges["target"], edges["weight"])]
+
+def write_network(network: Dict, path: str) -> str:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(network, f, ensure_ascii=False, separators=(",", ":"))
+    return path
+
+def network_from_scores(path: str, k: int, layout: str = "auto") -> Dict:
+    """Build the graph from a stored ``match_scores.npz`` (see save_match_scores)"""
+    with np.load(path, allow_pickle=False) as data:
+        S = data["scores"]
+        input_labels = data["input_labels"].tolist()
+        db_metadata = json.loads(str(data["db_metadata"]))
+    return build_network(
+        S, input_labels,
+        [label.replace('.txt', '').replace('_', ' ').title() for label in input_labels],
+        [m["file_name"] for m in db_metadata],
+        [m["display_name"] for m in db_metadata],
+        k, layout
+    )
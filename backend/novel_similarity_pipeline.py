@@ -6,22 +6,28 @@ import glob
 import math
 import string
 import argparse
-from typing import List, Dict, Tuple
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import networkx as nx
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 import matplotlib.font_manager as fm
 
+from columnar_io import (OUTPUT_FORMATS, FORMAT_EXTENSIONS, resolve_output_format,
+                         write_similarity_matrix, write_table)
+from network_export import NETWORK_FILE, build_network, network_edges, write_network
+from profiling import StageProfiler, profile_stage
+from corpus_reader import CorpusReader, read_text_file
+
 # ---------------------------
 # Utilities
 # ---------------------------
 
 def read_txt(path: str) -> str:
-    with open(path, "r", encoding="utf-8", errors="ignore") as f:
-        return f.read()
+    # Encoding is detected per file (UTF-8, BOMs, Thai cp874/TIS-620), see corpus_reader.py
+    return read_text_file(path)[0]
 
 def simple_preprocess(text: str) -> str:
     # Lowercase, remove punctuation, collapse spaces
@@ -69,12 +75,11 @@ def extract_novel_info(file_path: str, genre_path: str) -> Dict[str, str]:
         "file_name": os.path.basename(file_path)
     }
 
-def load_database(db_root: str) -> Tuple[List[str], List[str], List[str], List[str], List[Dict]]:
+def iter_database(db_root: str, max_files_per_genre: Optional[int] = 50) -> Iterator[Tuple[str, Dict]]:
     """
-    Returns: texts, labels(doc names), genres, titles, metadata (same length as texts)
-    Expects folder structure ./db/<genre>/<title>/*.txt or ./db/<genre>/*.txt
+    Yield (path, file_info) for every database file, in load order, without
+    reading the files. Same layout and limits as ``load_database``.
     """
-    texts, labels, genres, titles, metadata = [], [], [], [], []
     if not os.path.isdir(db_root):
         raise SystemExit(f"Database folder not found: {db_root}")
     genre_dirs = sorted([d for d in os.listdir(db_root) if os.path.isdir(os.path.join(db_root, d))])
@@ -85,21 +90,33 @@ def load_database(db_root: str) -> Tuple[List[str], List[str], List[str], List[s
         gpath = os.path.join(db_root, g)
         # ✅ recursive glob เพื่อให้หาไฟล์ในทุก subfolder
         files = sorted(glob.glob(os.path.join(gpath, "**", "*.txt"), recursive=True))
-        files = files[:50]  # เพิ่มจำกัดไฟล์ต่อ genre
+        if max_files_per_genre:
+            files = files[:max_files_per_genre]  # เพิ่มจำกัดไฟล์ต่อ genre
         
         for p in files:
             # Extract comprehensive file information
-            file_info = extract_novel_info(p, gpath)
-            
-            labels.append(file_info["file_name"])
-            genres.append(file_info["genre"])
-            titles.append(file_info["novel_title"])
-            metadata.append(file_info)
-            
-            texts.append(simple_preprocess(read_txt(p)))
+            yield p, extract_novel_info(p, gpath)
+
+def load_database(db_root: str, max_files_per_genre: Optional[int] = 50) -> Tuple[List[str], List[str], List[str], List[str], List[Dict]]:
+    """
+    Returns: texts, labels(doc names), genres, titles, metadata (same length as texts)
+    Expects folder structure ./db/<genre>/<title>/*.txt or ./db/<genre>/*.txt
+    max_files_per_genre=None loads every file (corpus-wide jobs)
+    """
+    texts, labels, genres, titles, metadata = [], [], [], [], []
+    files = list(iter_database(db_root, max_files_per_genre))
+    reader = CorpusReader()
+    for (p, file_info), text in zip(files, reader.texts(p for p, _ in files)):
+        labels.append(file_info["file_name"])
+        genres.append(file_info["genre"])
+        titles.append(file_info["novel_title"])
+        metadata.append(file_info)
+        
+        texts.append(simple_preprocess(text))
             
     if not texts:
         raise SystemExit("No .txt files found in the database.")
+    reader.print_summary()
     return texts, labels, genres, titles, metadata
 
 def load_inputs(input_root: str, max_files: int = 5) -> Tuple[List[str], List[str]]:
@@ -115,7 +132,7 @@ def load_inputs(input_root: str, max_files: int = 5) -> Tuple[List[str], List[st
         print(f"[WARN] Found {len(files)} input files (<3). Proceeding anyway.")
     if len(files) > max_files:
         files = files[:max_files]
-    texts = [simple_preprocess(read_txt(p)) for p in files]
+    texts = [simple_preprocess(text) for text in CorpusReader().texts(files)]
     names = [os.path.basename(p) for p in files]
     return texts, names
 
@@ -137,7 +154,8 @@ def annotate_heatmap(ax, im, data):
             ax.text(j, i, f"{data[i, j]:.2f}", ha="center", va="center", 
                    fontsize=fontsize, color=text_color, weight='bold')
 
-def plot_heatmap(matrix: np.ndarray, xlabels: List[str], ylabels: List[str], title: str, outpath: str):
+def plot_heatmap(matrix: np.ndarray, xlabels: List[str], ylabels: List[str], title: str, outpath: str,
+                 annotate: bool = True, dpi: int = 300):
     # --- START: ADDED FONT SETUP ---
     try:
         font_path = fm.findfont(fm.FontProperties(family='TH Sarabun New'))
@@ -185,13 +203,14 @@ def plot_heatmap(matrix: np.ndarray, xlabels: List[str], ylabels: List[str], tit
     ax.set_ylabel("ไฟล์ที่วิเคราะห์ (Input Files)", fontsize=12)
     
     # Add annotations with improved visibility
-    annotate_heatmap(ax, im, matrix)
+    if annotate:
+        annotate_heatmap(ax, im, matrix)
     
     # Adjust layout to prevent label cutoff
     plt.tight_layout()
     
     # Save with high DPI for better quality
-    fig.savefig(outpath, dpi=300, bbox_inches='tight')
+    fig.savefig(outpath, dpi=dpi, bbox_inches='tight')
     plt.close(fig)
 
 def plot_network(edges: List[Tuple[str, str, float]], outpath: str, topk:int=3):
@@ -272,203 +291,368 @@ def classify_relation(score: float, dup_threshold: float=0.90, similar_threshold
         return "different"
 
 # ---------------------------
-# Core pipeline
+# Match lists
 # ---------------------------
 
-def run_pipeline(db_root: str, input_root: str, out_root: str,
-                 k_neighbors: int = 3,
-                 dup_threshold: float = 0.90,
-                 similar_threshold: float = 0.60):
-    os.makedirs(out_root, exist_ok=True)
-
-    # 1) Load database with metadata
-    db_texts, db_labels, db_genres, db_titles, db_metadata = load_database(db_root)
-
-    # 2) Load inputs (3–5 files preferred)
-    in_texts, in_labels = load_inputs(input_root, max_files=5)
-
-    # 3) Vectorize (fit on database to form the "knowledge base")
-    vec = make_vectorizer()
-    X_db = vec.fit_transform(db_texts)  # (N_db, V)
-    X_in = vec.transform(in_texts)      # (N_in, V)
-
-    # 4) Similarities
-    S = cosine_similarity(X_in, X_db)   # (N_in x N_db)
-
-    # 5) Per-input rankings & relation classification
-    rows = []
-    edges = []
-    for i, in_name in enumerate(in_labels):
-        sims = S[i]
-        order = np.argsort(-sims)  # descending
-        top_idx = order[0]
-        top_score = float(sims[top_idx])
-        top_db = db_labels[top_idx]
-        top_genre = db_genres[top_idx]
-        relation = classify_relation(top_score, dup_threshold, similar_threshold)
-
-        # Store edges for network
-        for j in order[:k_neighbors]:
-            edges.append((in_name, db_labels[j], float(sims[j])))
-
-        # Aggregate by genre (max & mean within each genre)
-        genre_scores: Dict[str, List[float]] = {}
-        for j, g in enumerate(db_genres):
-            genre_scores.setdefault(g, []).append(float(sims[j]))
-        genre_rank = sorted(
-            [(g, float(np.mean(v)), float(np.max(v))) for g, v in genre_scores.items()],
-            key=lambda x: x[2], reverse=True
-        )
-
-        # Create detailed similarity data for this input with comprehensive metadata
-        input_similarities = []
-        for j in order:  # Show ALL matches, not just top k_neighbors
-            file_meta = db_metadata[j]
-            input_similarities.append({
-                "database_file": db_labels[j],
-                "genre": db_genres[j], 
-                "title": db_titles[j],  # Novel title
-                "folder_name": file_meta["folder_name"],
-                "chapter_name": file_meta["chapter_name"],
-                "display_name": file_meta["display_name"],
-                "similarity": round(float(sims[j]) * 100, 2)  # Convert to percentage
-            })
-        
-        # เพิ่มข้อมูลครบถ้วนของ top match
-        top_novel_title = db_titles[top_idx]
-        top_metadata = db_metadata[top_idx]
-        
-        rows.append({
-            "input_doc": in_name,
-            "input_similarities": input_similarities,
-            "top_db_doc": top_db,
-            "top_genre": top_genre,
-            "top_novel_title": top_novel_title,
-            "top_folder_name": top_metadata["folder_name"],
-            "top_chapter_name": top_metadata["chapter_name"],
-            "top_display_name": top_metadata["display_name"],
-            "top_similarity": round(top_score, 4),
-            "relation": relation,
-            "genre_rank_json": json.dumps([{"genre": g, "mean": round(m,4), "max": round(mx,4)} for g,m,mx in genre_rank], ensure_ascii=False)
-        })
-
-    # 6) Overall rankings
-    # 6.1 Which DB story is most similar (best match) across all inputs?
-    best_by_db = S.max(axis=0)  # (N_db,)
-    # สร้าง overall ranking พร้อม metadata ครบถ้วน
-    db_overall_rank = []
-    for j in range(len(db_labels)):
+# Per-input match lists embedded in overall_ranking.json are cut to this many
+# entries; the rest is served page by page from match_scores.npz
+DEFAULT_MATCH_LIMIT = 20
+MATCH_SCORES_FILE = "match_scores.npz"
+
+def top_k_order(sims: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, descending (all indices if k >= len)"""
+    n = sims.shape[0]
+    if k <= 0 or k >= n:
+        return np.argsort(-sims, kind="stable")
+    part = np.argpartition(-sims, k - 1)[:k]
+    return part[np.argsort(-sims[part], kind="stable")]
+
+def build_match_list(sims: np.ndarray, indices, db_metadata: List[Dict]) -> List[Dict]:
+    """One entry per DB document in ``indices`` with similarity as percentage"""
+    matches = []
+    for j in indices:
         file_meta = db_metadata[j]
-        db_overall_rank.append({
-            "db_doc": db_labels[j],
-            "genre": db_genres[j],
-            "title": db_titles[j],
+        matches.append({
+            "database_file": file_meta["file_name"],
+            "genre": file_meta["genre"],
+            "title": file_meta["novel_title"],  # Novel title
             "folder_name": file_meta["folder_name"],
             "chapter_name": file_meta["chapter_name"],
             "display_name": file_meta["display_name"],
-            "best_similarity": float(best_by_db[j])
+            "similarity": round(float(sims[j]) * 100, 2)  # Convert to percentage
         })
-    db_overall_rank = sorted(db_overall_rank, key=lambda x: x["best_similarity"], reverse=True)
-    # 6.2 Which genres overlap most (by mean/max across inputs)?
-    genre_overlap = {}
-    for g in sorted(set(db_genres)):
-        cols = [k for k, gg in enumerate(db_genres) if gg == g]
-        sub = S[:, cols]
-        genre_overlap[g] = {
-            "mean_over_all": float(np.mean(sub)),
-            "max_over_all": float(np.max(sub)),
-        }
-    genre_rank_overall = sorted([(g, v["mean_over_all"], v["max_over_all"]) for g,v in genre_overlap.items()],
-                                key=lambda x: x[2], reverse=True)
+    return matches
+
+def save_match_scores(out_root: str, S: np.ndarray, in_labels: List[str], db_metadata: List[Dict],
+                      scoring: Optional[Dict] = None) -> str:
+    """Store the full score matrix (float32), DB metadata and scoring method for paginated lookups"""
+    path = os.path.join(out_root, MATCH_SCORES_FILE)
+    np.savez_compressed(
+        path,
+        scores=np.asarray(S, dtype=np.float32),
+        input_labels=np.array(in_labels, dtype=str),
+        db_metadata=np.array(json.dumps(db_metadata, ensure_ascii=False)),
+        scoring=np.array(json.dumps(scoring, ensure_ascii=False))
+    )
+    return path
 
-    # 7) DataFrames
-    comp_df = pd.DataFrame(rows)
-    # Expand genre_rank_json for readability (top-3 only)
-    def top3(gen_json):
-        data = json.loads(gen_json)
-        data = data[:3]
-        return "; ".join([f'{d["genre"]}(max={d["max"]:.2f},mean={d["mean"]:.2f})' for d in data])
-
-    if not comp_df.empty:
-        comp_df["genre_top3"] = comp_df["genre_rank_json"].apply(top3)
-
-    # Table of per-input per-DB similarities with enhanced labels for heatmap
-    # Create display labels for matrix axes
-    db_display_labels = [meta["display_name"] for meta in db_metadata]
-    input_display_labels = [label.replace('.txt', '').replace('_', ' ') for label in in_labels]
-    
-    sim_df = pd.DataFrame(S, index=input_display_labels, columns=db_display_labels)
-
-    # 8) Save tables
-    comp_csv = os.path.join(out_root, "comparison_table.csv")
-    sim_csv = os.path.join(out_root, "similarity_matrix.csv")
-    overall_json = os.path.join(out_root, "overall_ranking.json")
-
-    comp_df.to_csv(comp_csv, index=False, encoding="utf-8-sig")
-    sim_df.to_csv(sim_csv, encoding="utf-8-sig")
-    # Create analysis_by_input structure (like in the image)
-    analysis_by_input = []
-    for row in rows:
-        analysis_by_input.append({
-            "input_name": row["input_doc"],
-            "input_title": row["input_doc"].replace('.txt', '').replace('_', ' ').title(),
-            "similarities": row["input_similarities"]
-        })
-    
-    with open(overall_json, "w", encoding="utf-8") as f:
-        json.dump({
+def load_match_scores(path: str) -> Tuple[np.ndarray, List[str], List[Dict]]:
+    """(scores, input labels, DB metadata) stored by ``save_match_scores``"""
+    with np.load(path, allow_pickle=False) as data:
+        return data["scores"], data["input_labels"].tolist(), json.loads(str(data["db_metadata"]))
+
+def load_match_scoring(path: str) -> Optional[Dict]:
+    """Scoring method and calibration stored by ``save_match_scores`` (None for older files)"""
+    with np.load(path, allow_pickle=False) as data:
+        return json.loads(str(data["scoring"])) if "scoring" in data.files else None
+
+def load_match_page(path: str, input_ref: str, offset: int = 0, limit: int = 50) -> Dict:
+    """
+    Return one page of the ranked matches for a single input
+
+    Args:
+        path: match_scores.npz written by ``save_match_scores``
+        input_ref: Input index or input file name
+        offset: Rank of the first match to return
+        limit: Number of matches to return
+    """
+    with np.load(path, allow_pickle=False) as data:
+        in_labels = data["input_labels"].tolist()
+        if input_ref in in_labels:
+            i = in_labels.index(input_ref)
+        elif str(input_ref).isdigit() and int(input_ref) < len(in_labels):
+            i = int(input_ref)
+        else:
+            raise KeyError(f"Unknown input: {input_ref}")
+        sims = data["scores"][i]
+        db_metadata = json.loads(str(data["db_metadata"]))
+
+    offset = max(0, offset)
+    order = top_k_order(sims, offset + limit)[offset:offset + limit]
+    return {
+        "input_name": in_labels[i],
+        "total_matches": int(sims.shape[0]),
+        "offset": offset,
+        "limit": limit,
+        "matches": build_match_list(sims, order, db_metadata)
+    }
+
+# ---------------------------
+# Core pipeline
+# ---------------------------
+
+@dataclass
+class SimilarityResult:
+    """
+    Everything an analysis produces, kept in memory
+
+    The API serialises this directly; files are only written (by
+    ``write_outputs``) for downloads and for the CLI.
+    """
+    S: np.ndarray                      # (N_in x N_db) similarities (cosine or calibrated BM25); sparse
+                                       # candidates only for routed queries, which are not plotted
+    in_labels: List[str]
+    db_labels: List[str]
+    db_genres: List[str]
+    db_titles: List[str]
+    db_metadata: List[Dict]
+    rows: List[Dict]                   # per-input comparison rows
+    edges: List[Tuple[str, str, float]]
+    db_overall_rank: List[Dict]
+    genre_rank_overall: List[Tuple[str, float, float]]
+    k_neighbors: int = 3
+    scoring: Optional[Dict] = None     # method and calibration (SimilarityEngine.scoring_info)
+    _networks: Dict = field(default_factory=dict, init=False, repr=False, compare=False)
+
+    @property
+    def input_display_labels(self) -> List[str]:
+        return [label.replace('.txt', '').replace('_', ' ') for label in self.in_labels]
+
+    @property
+    def db_display_labels(self) -> List[str]:
+        return [meta["display_name"] for meta in self.db_metadata]
+
+    def network(self, layout: str = "auto") -> Dict:
+        """
+        Top-k input <-> DB graph with layout positions (see network_export)
+
+        Memoised per (layout, k): the API payload and ``write_outputs`` share
+        one build, and the memo travels with the result when it is pickled
+        to a worker process.
+        """
+        key = (layout, self.k_neighbors)
+        if key not in self._networks:
+            self._networks[key] = build_network(
+                self.S, self.in_labels,
+                [label.replace('.txt', '').replace('_', ' ').title() for label in self.in_labels],
+                self.db_labels, self.db_display_labels, self.k_neighbors, layout
+            )
+        return self._networks[key]
+
+    def comparison_frame(self) -> pd.DataFrame:
+        comp_df = pd.DataFrame(self.rows)
+        # Expand genre_rank_json for readability (top-3 only)
+        def top3(gen_json):
+            data = json.loads(gen_json)
+            data = data[:3]
+            return "; ".join([f'{d["genre"]}(max={d["max"]:.2f},mean={d["mean"]:.2f})' for d in data])
+
+        if not comp_df.empty:
+            comp_df["genre_top3"] = comp_df["genre_rank_json"].apply(top3)
+        return comp_df
+
+    def overall_ranking(self) -> Dict:
+        """Payload of overall_ranking.json"""
+        # Create analysis_by_input structure (like in the image)
+        analysis_by_input = []
+        for row in self.rows:
+            analysis_by_input.append({
+                "input_name": row["input_doc"],
+                "input_title": row["input_doc"].replace('.txt', '').replace('_', ' ').title(),
+                "similarities": row["input_similarities"],
+                "total_matches": len(self.db_labels),
+                "returned_matches": len(row["input_similarities"])
+            })
+        return {
             "analysis_by_input": analysis_by_input,
             "db_overall_rank_desc": "DB doc with highest similarity to any input (descending)",
-            "db_overall_rank": db_overall_rank,
+            "db_overall_rank": self.db_overall_rank,
             "matrix_labels": {
-                "input_labels": input_display_labels,
-                "db_labels": db_display_labels,
-                "db_metadata": db_metadata
+                "input_labels": self.input_display_labels,
+                "db_labels": self.db_display_labels,
+                "db_metadata": self.db_metadata
             },
             "genre_rank_overall_desc": "Genres ranked by max similarity across inputs (then mean)",
             "genre_rank_overall": [
-                {"genre": g, "mean": round(m,4), "max": round(mx,4)} for (g,m,mx) in genre_rank_overall
-            ]
-        }, f, ensure_ascii=False, indent=2)
+                {"genre": g, "mean": round(m,4), "max": round(mx,4)} for (g,m,mx) in self.genre_rank_overall
+            ],
+            "analysis_info": {
+                "total_db_documents": len(self.db_labels),
+                "total_input_files": len(self.in_labels),
+                **({"scoring": self.scoring} if self.scoring else {})
+            }
+        }
 
-    # 9) Visualizations with enhanced labels
-    heatmap_path = os.path.join(out_root, "similarity_heatmap.png")
-    plot_heatmap(S, db_display_labels, input_display_labels, "Cosine Similarity (Inputs vs Database)", heatmap_path)
+    def report_text(self, comp_df: Optional[pd.DataFrame] = None) -> str:
+        """Brief text report"""
+        comp_df = self.comparison_frame() if comp_df is None else comp_df
+        lines = []
+        lines.append("# Similarity Report\n")
+        if self.scoring:
+            lines.append(f"Scoring: {self.scoring['method']} ({self.scoring['calibration']})\n")
+        lines.append("## Per-input top match & relation\n")
+        for _, row in comp_df.iterrows():
+            lines.append(f"- {row['input_doc']} ⇒ {row['top_db_doc']} (genre={row['top_genre']}, score={row['top_similarity']:.2f}, relation={row['relation']})")
+            lines.append(f"  Top genres: {row['genre_top3']}")
+        lines.append("\n## Overall DB ranking (best match across inputs)\n")
+        for d in self.db_overall_rank[:10]:
+            lines.append(f"- {d['db_doc']} (title={d['title']}, genre={d['genre']}): {d['best_similarity']:.2f}")
+        lines.append("\n## Overall Genre overlap ranking\n")
+        for g, m, mx in self.genre_rank_overall:
+            lines.append(f"- {g}: max={mx:.2f}, mean={m:.2f}")
+        return "\n".join(lines)
+
+def compute_similarity(db_root: str, input_root: str,
+                       k_neighbors: int = 3,
+                       dup_threshold: float = 0.90,
+                       similar_threshold: float = 0.60,
+                       match_limit: Optional[int] = DEFAULT_MATCH_LIMIT,
+                       engine=None,
+                       scoring: str = "cosine",
+                       block_size: int = 0) -> SimilarityResult:
+    """
+    Load, vectorise, score and rank without touching the output folder
 
-    network_path = os.path.join(out_root, "network_top_matches.png")
-    plot_network(edges, network_path, topk=k_neighbors)
+    Pass a fitted ``SimilarityEngine`` as ``engine`` to reuse an existing
+    corpus index instead of loading ``db_root``; otherwise the index is built
+    for ``scoring`` ("cosine" or "bm25"). ``block_size`` scores that many
+    database documents at a time (see memory_planner.py).
+    """
+    from similarity_engine import SimilarityEngine
 
-    # 10) Brief text report
-    report_path = os.path.join(out_root, "report.txt")
-    lines = []
-    lines.append("# Similarity Report\n")
-    lines.append("## Per-input top match & relation\n")
-    for _, row in comp_df.iterrows():
-        lines.append(f"- {row['input_doc']} ⇒ {row['top_db_doc']} (genre={row['top_genre']}, score={row['top_similarity']:.2f}, relation={row['relation']})")
-        lines.append(f"  Top genres: {row['genre_top3']}")
-    lines.append("\n## Overall DB ranking (best match across inputs)\n")
-    rank_db = sorted(
-        [{"db_doc": db_labels[j], "genre": db_genres[j], "title": db_titles[j], "best_similarity": float(best_by_db[j])}
-         for j in range(len(db_labels))],
-        key=lambda d: d["best_similarity"], reverse=True
-    )
-    for d in rank_db[:10]:
-        lines.append(f"- {d['db_doc']} (title={d['title']}, genre={d['genre']}): {d['best_similarity']:.2f}")
-    lines.append("\n## Overall Genre overlap ranking\n")
-    for g, m, mx in genre_rank_overall:
-        lines.append(f"- {g}: max={mx:.2f}, mean={m:.2f}")
-    with open(report_path, "w", encoding="utf-8") as f:
-        f.write("\n".join(lines))
+    # 1) Load database and build the corpus index (fit on database to form the "knowledge base")
+    profile_stage("1) Load database and build the corpus index")
+    if engine is None:
+        engine = SimilarityEngine.from_database(db_root, scoring=scoring)
 
+    # 2) Load inputs (3–5 files preferred)
+    profile_stage("2) Load inputs")
+    in_texts, in_labels = load_inputs(input_root, max_files=5)
+
+    # 3) Vectorize inputs and compute similarities (N_in x N_db)
+    profile_stage("3) Vectorize inputs and compute similarities")
+    S = engine.score(in_texts, block_size=block_size)
+
+    # 4) Per-input rankings, relation classification and overall rankings
+    profile_stage("4) Per-input rankings, relation classification and overall rankings")
+    return engine.rank(S, in_labels, k_neighbors, dup_threshold, similar_threshold, match_limit)
+
+def rerank_from_scores(scores_path: str,
+                       k_neighbors: int = 3,
+                       dup_threshold: float = 0.90,
+                       similar_threshold: float = 0.60,
+                       match_limit: Optional[int] = DEFAULT_MATCH_LIMIT) -> SimilarityResult:
+    """
+    Rank, classify and rebuild the graph for new k / thresholds from a stored
+    ``match_scores.npz``, without loading or vectorising anything
+    """
+    from similarity_engine import SimilarityEngine
+
+    S, in_labels, db_metadata = load_match_scores(scores_path)
+    # Keep the original scoring description (e.g. calibrated BM25) on the reranked result
+    engine = SimilarityEngine.for_scores(db_metadata, [m["file_name"] for m in db_metadata],
+                                         scoring_info=load_match_scoring(scores_path))
+    return engine.rank(S.astype(np.float64), in_labels, k_neighbors, dup_threshold, similar_threshold, match_limit)
+
+def output_paths(out_root: str, output_format: str = "csv") -> Dict[str, str]:
+    """File paths ``write_outputs`` produces for a given output format"""
+    fmt = resolve_output_format(output_format)
+    ext = FORMAT_EXTENSIONS[fmt]
     return {
-        "comparison_table": comp_csv,
-        "similarity_matrix": sim_csv,
-        "overall_ranking": overall_json,
-        "heatmap": heatmap_path,
-        "network": network_path,
-        "report": report_path
+        "comparison_table": os.path.join(out_root, "comparison_table" + ext),
+        "similarity_matrix": os.path.join(out_root, "similarity_matrix" + ext),
+        "overall_ranking": os.path.join(out_root, "overall_ranking.json"),
+        "match_scores": os.path.join(out_root, MATCH_SCORES_FILE),
+        "heatmap": os.path.join(out_root, "similarity_heatmap.png"),
+        "network": os.path.join(out_root, "network_top_matches.png"),
+        "network_data": os.path.join(out_root, NETWORK_FILE),
+        "report": os.path.join(out_root, "report.txt")
     }
 
+def write_outputs(result: SimilarityResult, out_root: str, output_format: str = "csv",
+                  network_png: bool = True, heatmap: str = "annotated",
+                  heatmap_dpi: int = 300) -> Dict[str, str]:
+    """
+    Write tables, JSON, stored scores, images and report for a computed result
+
+    network_png=False skips rendering the network image; the layout data
+    (network.json) is always written. heatmap is "annotated", "plain" (no
+    cell values) or "none" (no image; the matrix table is always written).
+    """
+    os.makedirs(out_root, exist_ok=True)
+    fmt = resolve_output_format(output_format)
+    paths = output_paths(out_root, fmt)
+
+    # 7) DataFrames
+    profile_stage("7) DataFrames")
+    comp_df = result.comparison_frame()
+
+    # 8) Save tables (csv, or a binary columnar format)
+    profile_stage("8) Save tables")
+    write_table(comp_df, out_root, "comparison_table", fmt)
+    write_similarity_matrix(result.S, result.input_display_labels, result.db_display_labels, out_root, fmt)
+    with open(paths["overall_ranking"], "w", encoding="utf-8") as f:
+        json.dump(result.overall_ranking(), f, ensure_ascii=False, separators=(",", ":"))
+    save_match_scores(out_root, result.S, result.in_labels, result.db_metadata, result.scoring)
+
+    # 9) Visualizations with enhanced labels
+    profile_stage("9) Visualizations with enhanced labels")
+    if heatmap == "none":
+        del paths["heatmap"]
+    else:
+        plot_heatmap(result.S, result.db_display_labels, result.input_display_labels,
+                     "Cosine Similarity (Inputs vs Database)", paths["heatmap"],
+                     annotate=heatmap == "annotated", dpi=heatmap_dpi)
+    network = result.network()
+    write_network(network, paths["network_data"])
+    if network_png:
+        plot_network(network_edges(network), paths["network"], topk=result.k_neighbors)
+    else:
+        del paths["network"]
+
+    # 10) Brief text report
+    profile_stage("10) Brief text report")
+    with open(paths["report"], "w", encoding="utf-8") as f:
+        f.write(result.report_text(comp_df))
+
+    return paths
+
+def write_network_png(result: SimilarityResult, path: str) -> str:
+    """
+    Render the network image for ``result`` to ``path``
+
+    The image is rendered to a temporary name and moved into place, so an
+    existing file (which may be hard-linked elsewhere) is replaced, not rewritten.
+    """
+    tmp = f"{path}.{os.getpid()}.tmp.png"
+    plot_network(network_edges(result.network()), tmp, topk=result.k_neighbors)
+    os.replace(tmp, path)
+    return path
+
+def run_pipeline(db_root: str, input_root: str, out_root: str,
+                 k_neighbors: int = 3,
+                 dup_threshold: float = 0.90,
+                 similar_threshold: float = 0.60,
+                 output_format: str = "csv",
+                 match_limit: Optional[int] = DEFAULT_MATCH_LIMIT,
+                 engine=None,
+                 network_png: bool = True,
+                 scoring: str = "cosine",
+                 memory_budget_mb: Optional[float] = None,
+                 memory_plan=None):
+    """
+    Compute and write an analysis
+
+    With ``memory_budget_mb``, the run is planned first (memory_planner.py):
+    scoring block size, heatmap rendering and match list truncation are
+    chosen to fit the budget, or the run is refused before anything is loaded.
+    Pass an already computed ``memory_plan`` to skip planning again.
+    """
+    block_size, heatmap, heatmap_dpi = 0, "annotated", 300
+    plan = memory_plan
+    if plan is None and memory_budget_mb:
+        from memory_planner import plan_run, require_fit
+        plan = require_fit(plan_run(db_root, input_root, memory_budget_mb, match_limit, k_neighbors))
+    if plan is not None:
+        for adjustment in plan.adjustments:
+            print(f"🧮 Memory plan: {adjustment}")
+        block_size, heatmap, heatmap_dpi = plan.block_size, plan.heatmap, plan.heatmap_dpi
+        match_limit = plan.match_limit
+    os.makedirs(out_root, exist_ok=True)
+    result = compute_similarity(db_root, input_root, k_neighbors, dup_threshold, similar_threshold, match_limit,
+                                engine, scoring, block_size)
+    return write_outputs(result, out_root, output_format, network_png, heatmap, heatmap_dpi)
+
 def main():
     parser = argparse.ArgumentParser(description="Novel similarity: build DB (per-genre) and compare 3–5 inputs.")
     parser.add_argument("--db", default="./db", help="Database root folder (expects ./db/<genre>/*.txt).")
@@ -477,16 +661,69 @@ def main():
     parser.add_argument("--topk", type=int, default=3, help="Top-K neighbors for network graph edges.")
     parser.add_argument("--dup_threshold", type=float, default=0.90, help="Duplicate threshold (cosine).")
     parser.add_argument("--similar_threshold", type=float, default=0.60, help="Similar threshold (cosine).")
+    parser.add_argument("--match_limit", type=int, default=DEFAULT_MATCH_LIMIT,
+                        help="Matches per input embedded in overall_ranking.json (0 = all).")
+    parser.add_argument("--output_format", choices=OUTPUT_FORMATS, default="csv",
+                        help="Format for similarity matrix and comparison table (parquet/arrow need pyarrow, else npz).")
+    parser.add_argument("--index", default=None,
+                        help="Corpus index file: loaded if it exists, otherwise built from --db and saved here.")
+    parser.add_argument("--no_network_png", action="store_true",
+                        help="Skip rendering network_top_matches.png (network.json layout data is still written).")
+    parser.add_argument("--scoring", choices=("cosine", "bm25"), default="cosine",
+                        help="TF-IDF cosine, or BM25 calibrated to 0-1 (see bm25_index.py).")
+    parser.add_argument("--profile", action="store_true",
+                        help="Profile CPU and allocations per stage; writes <out>/profile/ (see profiling.py).")
+    parser.add_argument("--memory_budget_mb", type=float, default=None,
+                        help="Plan the run to fit this much memory, or refuse it early (see memory_planner.py).")
+    parser.add_argument("--explain", action="store_true",
+                        help="Print the memory plan and exit without running (dry run).")
     args = parser.parse_args()
 
-    results = run_pipeline(
-        db_root=args.db,
-        input_root=args.inputs,
-        out_root=args.out,
-        k_neighbors=args.topk,
-        dup_threshold=args.dup_threshold,
-        similar_threshold=args.similar_threshold
-    )
+    if args.explain:
+        from memory_planner import DEFAULT_MEMORY_BUDGET_MB, plan_run
+        plan = plan_run(args.db, args.inputs, args.memory_budget_mb or DEFAULT_MEMORY_BUDGET_MB,
+                        args.match_limit, args.topk)
+        print(plan.explain())
+        return
+    plan = None
+    if args.memory_budget_mb:
+        # Refuse before the index is built or loaded; run_pipeline reuses the plan
+        from memory_planner import MemoryBudgetExceeded, plan_run, require_fit
+        try:
+            plan = require_fit(plan_run(args.db, args.inputs, args.memory_budget_mb, args.match_limit, args.topk))
+        except MemoryBudgetExceeded as e:
+            raise SystemExit(f"❌ {e}")
+
+    profiler = StageProfiler(args.out, "pipeline").start() if args.profile else None
+    try:
+        engine = None
+        if args.index:
+            profile_stage("0) Load or build the corpus index")
+            from similarity_engine import SimilarityEngine
+            if os.path.exists(args.index):
+                engine = SimilarityEngine.load(args.index)
+            else:
+                engine = SimilarityEngine.from_database(args.db, scoring=args.scoring)
+                engine.save(args.index)
+
+        results = run_pipeline(
+            db_root=args.db,
+            input_root=args.inputs,
+            out_root=args.out,
+            k_neighbors=args.topk,
+            dup_threshold=args.dup_threshold,
+            similar_threshold=args.similar_threshold,
+            output_format=args.output_format,
+            match_limit=args.match_limit,
+            engine=engine,
+            network_png=not args.no_network_png,
+            scoring=args.scoring,
+            memory_budget_mb=args.memory_budget_mb,
+            memory_plan=plan
+        )
+    finally:
+        if profiler is not None:
+            profiler.stop()
     print(json.dumps(results, ensure_ascii=False, indent=2))
 
 if __name__ == "__main__":
@@ -0,0 +1,232 @@
+"""
+Per-stage CPU and allocation profiling for pipeline runs
+
+The pipelines mark their numbered stages with ``profile_stage("...")``. The
+call is a no-op unless a StageProfiler is active in the current context;
+then each stage runs under its own cProfile profiler and tracemalloc, and the
+profiler writes, next to the outputs:
+
+    profile/<name>_summary.json         per stage: wall / CPU time, peak and net
+                                        allocated bytes, top allocators, top
+                                        functions by cumulative time
+    profile/<name>_report.txt           the same as plain text
+    profile/<name>_<nn>_<stage>.prof    pstats file per stage, e.g. for
+                                        ``python -m pstats`` or snakeviz
+
+Stages are sequential: starting a stage ends the previous one, and
+``stop()`` (or leaving the ``with`` block) ends the last.
+
+Usage:
+    with StageProfiler(out_dir, "pipeline"):
+        run_pipeline(...)
+
+    # In a worker process (the API's debug flag)
+    result, summary = pipeline_pool.run(profiled_call, out_dir, "analysis", compute_similarity, ...)
+"""
+
+import io
+import os
+import re
+import json
+import time
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+PROFILE_DIR = "profile"
+DEFAULT_TOP_N = 15
+
+_current: ContextVar[Optional["StageProfiler"]] = ContextVar("stage_profiler", default=None)
+# tracemalloc is process-wide: profiled calls on worker threads take turns
+_profile_lock = threading.Lock()
+
+# Allocations made by the profilers themselves are not interesting
+_TRACE_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, cProfile.__file__),
+    tracemalloc.Filter(False, pstats.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+]
+
+
+def profile_stage(name: str) -> None:
+    """Start pipeline stage ``name`` (ends the previous one); no-op unless profiling"""
+    profiler = _current.get()
+    if profiler is not None:
+        profiler.stage(name)
+
+
+def _slug(name: str) -> str:
+    return re.sub(r"[^0-9A-Za-z]+", "_", name).strip("_").lower()[:40].rstrip("_") or "stage"
+
+
+class StageProfiler:
+    """
+    cProfile + tracemalloc per pipeline stage
+
+    Args:
+        out_dir: Output folder; artifacts go to ``out_dir/profile``
+        name: Prefix for the artifact files (e.g. "pipeline", "analysis")
+        top_n: Allocators and functions listed per stage
+    """
+
+    def __init__(self, out_dir: str, name: str = "pipeline", top_n: int = DEFAULT_TOP_N):
+        self.profile_dir = os.path.join(out_dir, PROFILE_DIR)
+        self.name = name
+        self.top_n = top_n
+        self.stages: List[Dict] = []
+        self._stage: Optional[Dict] = None
+        self._token = None
+        self._started_tracing = False
+        self._started = 0.0
+
+    # ---------------------------
+    # Stages
+    # ---------------------------
+
+    def start(self) -> "StageProfiler":
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self._token = _current.set(self)
+        self._started = time.perf_counter()
+        return self
+
+    def stage(self, name: str) -> None:
+        self._end_stage()
+        # The snapshot is taken before the clocks start so it is not counted
+        before = tracemalloc.take_snapshot().filter_traces(_TRACE_FILTERS)
+        tracemalloc.reset_peak()
+        profiler = cProfile.Profile()
+        self._stage = {
+            "name": name,
+            "snapshot": before,
+            "traced_before": tracemalloc.get_traced_memory()[0],
+            "profiler": profiler,
+            "wall": time.perf_counter(),
+            "cpu": time.process_time(),
+        }
+        profiler.enable()
+
+    def _end_stage(self) -> None:
+        stage, self._stage = self._stage, None
+        if stage is None:
+            return
+        stage["profiler"].disable()
+        wall = time.perf_counter() - stage["wall"]
+        cpu = time.process_time() - stage["cpu"]
+        current, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot().filter_traces(_TRACE_FILTERS)
+
+        index = len(self.stages) + 1
+        prof_name = f"{self.name}_{index:02d}_{_slug(stage['name'])}.prof"
+        os.makedirs(self.profile_dir, exist_ok=True)
+        stage["profiler"].dump_stats(os.path.join(self.profile_dir, prof_name))
+
+        self.stages.append({
+            "stage": stage["name"],
+            "wall_seconds": round(wall, 4),
+            "cpu_seconds": round(cpu, 4),
+            "peak_allocated_bytes": max(0, peak - stage["traced_before"]),
+            "net_allocated_bytes": current - stage["traced_before"],
+            "top_allocators": [
+                {
+                    "location": f"{diff.traceback[0].filename}:{diff.traceback[0].lineno}",
+                    "size_diff_bytes": diff.size_diff,
+                    "count_diff": diff.count_diff,
+                }
+                for diff in after.compare_to(stage["snapshot"], "lineno")[:self.top_n]
+            ],
+            "top_functions": self._top_functions(stage["profiler"]),
+            "profile_file": prof_name,
+        })
+
+    def _top_functions(self, profiler: cProfile.Profile) -> List[Dict]:
+        stats = pstats.Stats(profiler, stream=io.StringIO())
+        stats.sort_stats(pstats.SortKey.CUMULATIVE)
+        functions = []
+        for func in stats.fcn_list[:self.top_n]:
+            calls, _, total, cumulative, _ = stats.stats[func]
+            filename, lineno, funcname = func
+            functions.append({
+                "function": f"{os.path.basename(filename)}:{lineno}({funcname})",
+                "calls": calls,
+                "total_seconds": round(total, 4),
+                "cumulative_seconds": round(cumulative, 4),
+            })
+        return functions
+
+    def stop(self) -> Dict:
+        """End the last stage, write the summary and report; returns the summary"""
+        try:
+            self._end_stage()
+        finally:
+            if self._token is not None:
+                _current.reset(self._token)
+                self._token = None
+            if self._started_tracing:
+                tracemalloc.stop()
+                self._started_tracing = False
+        summary = self.summary()
+        os.makedirs(self.profile_dir, exist_ok=True)
+        with open(os.path.join(self.profile_dir, f"{self.name}_summary.json"), "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        with open(os.path.join(self.profile_dir, f"{self.name}_report.txt"), "w", encoding="utf-8") as f:
+            f.write(self.report_text(summary))
+        print(f"🔬 Profile written to {self.profile_dir}")
+        return summary
+
+    def __enter__(self) -> "StageProfiler":
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.stop()
+
+    # ---------------------------
+    # Results
+    # ---------------------------
+
+    def summary(self) -> Dict:
+        return {
+            "name": self.name,
+            "total_wall_seconds": round(time.perf_counter() - self._started, 4),
+            "pid": os.getpid(),
+            "stages": self.stages,
+            "summary_file": f"{self.name}_summary.json",
+            "report_file": f"{self.name}_report.txt",
+        }
+
+    @staticmethod
+    def report_text(summary: Dict) -> str:
+        lines = [f"# Profile: {summary['name']} ({summary['total_wall_seconds']:.3f}s)\n"]
+        for stage in summary["stages"]:
+            lines.append(f"## {stage['stage']}: wall={stage['wall_seconds']:.3f}s cpu={stage['cpu_seconds']:.3f}s "
+                         f"peak={stage['peak_allocated_bytes'] / 1e6:.2f}MB net={stage['net_allocated_bytes'] / 1e6:.2f}MB")
+            lines.append("  Top functions (cumulative):")
+            for fn in stage["top_functions"][:10]:
+                lines.append(f"    {fn['cumulative_seconds']:>9.4f}s {fn['calls']:>8}  {fn['function']}")
+            lines.append("  Top allocators:")
+            for alloc in stage["top_allocators"][:10]:
+                lines.append(f"    {alloc['size_diff_bytes'] / 1e3:>10.1f}KB {alloc['count_diff']:>8}  {alloc['location']}")
+            lines.append(f"  pstats: {stage['profile_file']}\n")
+        return "\n".join(lines)
+
+
+def profiled_call(out_dir: str, name: str, fn: Callable, *args, **kwargs) -> Tuple[Any, Dict]:
+    """
+    Run ``fn`` under a StageProfiler writing to ``out_dir``
+
+    Module-level so it can be sent to worker processes.
+    Returns: (fn's result, profile summary)
+    """
+    with _profile_lock:
+        profiler = StageProfiler(out_dir, name).start()
+        try:
+            result = fn(*args, **kwargs)
+        finally:
+            summary = profiler.stop()
+    return result, summary
@@ -0,0 +1,208 @@
+"""
+On-disk cache of complete /api/analyze results
+
+Resubmitting the same inputs against the same database ZIP with the same
+parameters (e.g. after a browser refresh) returns the earlier response and
+output files instead of running the pipeline again.
+
+Each entry is a folder under the cache root:
+
+    <root>/<key>/response.json   the JSON response of the original request
+    <root>/<key>/output/         the session's output files
+
+The key is a SHA-256 over the database ZIP hash, the name and content hash
+of every input, and the analysis parameters. Entries are evicted least
+recently used first (the folder mtime records the last hit, as for session
+folders) once the cache exceeds its size limit. A hit copies the files into
+the new session (hard links when possible) and rewrites the session id in
+the stored response.
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from session_manager import SESSION_PREFIX, directory_size
+
+# Bump when the response or output layout changes so old entries are ignored
+CACHE_VERSION = 1
+RESPONSE_FILE = "response.json"
+OUTPUT_DIR = "output"
+
+
+def cache_key(corpus_sha256: str, inputs: List[Tuple[str, str]], params: Dict) -> str:
+    """
+    Key for one analysis request
+
+    Args:
+        corpus_sha256: Hash of the uploaded database ZIP
+        inputs: (input name, content SHA-256) in processing order
+        params: Analysis parameters (JSON-serialisable)
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps({
+        "version": CACHE_VERSION,
+        "corpus": corpus_sha256,
+        "inputs": [list(item) for item in inputs],
+        "params": params,
+    }, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _link_or_copy(src: str, dst: str) -> None:
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+class ResultCache:
+    """
+    Size-bounded LRU cache of analysis responses and output files
+
+    Args:
+        root: Cache directory
+        max_bytes: Upper bound for the cache's disk usage (0 disables caching)
+    """
+
+    def __init__(self, root: Path, max_bytes: int = 1024 ** 3):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._bypassed = 0
+        self._stored = 0
+        self._evicted = 0
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def entry_dir(self, key: str) -> Path:
+        return self.root / key
+
+    def record_bypass(self) -> None:
+        with self._lock:
+            self._bypassed += 1
+
+    # ---------------------------
+    # Lookup
+    # ---------------------------
+
+    def get(self, key: str, session_id: str, output_dir: Path) -> Optional[Dict]:
+        """
+        Restore a cached result into ``output_dir`` for ``session_id``
+
+        Returns: the cached response rewritten for the new session, or None
+        """
+        entry = self.entry_dir(key)
+        restored = []
+        try:
+            with open(entry / RESPONSE_FILE, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+            output_dir.mkdir(parents=True, exist_ok=True)
+            for name in os.listdir(entry / OUTPUT_DIR):
+                _link_or_copy(str(entry / OUTPUT_DIR / name), str(output_dir / name))
+                restored.append(output_dir / name)
+            os.utime(entry)  # LRU: mark as recently used
+        except (OSError, ValueError):
+            # Missing, or evicted meanwhile. Drop partial links so the pipeline
+            # does not write through them into the cached files.
+            for path in restored:
+                path.unlink(missing_ok=True)
+            with self._lock:
+                self._misses += 1
+            return None
+
+        old_prefix = f"/{SESSION_PREFIX}{stored['session_id']}/"
+        response = json.loads(json.dumps(stored["response"], ensure_ascii=False)
+                              .replace(old_prefix, f"/{SESSION_PREFIX}{session_id}/"))
+        response["session_id"] = session_id
+        with self._lock:
+            self._hits += 1
+        return response
+
+    # ---------------------------
+    # Store and evict
+    # ---------------------------
+
+    def put(self, key: str, session_id: str, output_dir: Path, response: Dict) -> None:
+        """Store a finished session's response and output files"""
+        if not self.enabled:
+            return
+        entry = self.entry_dir(key)
+        if entry.exists():
+            return
+        tmp = self.root / f".{key}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            (tmp / OUTPUT_DIR).mkdir(parents=True)
+            for name in os.listdir(output_dir):
+                src = output_dir / name
+                if src.is_file():
+                    _link_or_copy(str(src), str(tmp / OUTPUT_DIR / name))
+            with open(tmp / RESPONSE_FILE, "w", encoding="utf-8") as f:
+                json.dump({"session_id": session_id, "created_at": time.time(), "response": response},
+                          f, ensure_ascii=False)
+            os.replace(tmp, entry)
+        except OSError:
+            # Another request stored the same key first, or the disk is full
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        with self._lock:
+            self._stored += 1
+        self.evict()
+
+    def _entries(self) -> List[Tuple[float, int, Path]]:
+        entries = []
+        for entry in self.root.iterdir():
+            if entry.is_dir() and not entry.name.startswith("."):
+                try:
+                    entries.append((entry.stat().st_mtime, directory_size(entry), entry))
+                except OSError:
+                    continue
+        return entries
+
+    def evict(self) -> int:
+        """Remove least recently used entries until the cache fits; returns entries removed"""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            removed += 1
+        with self._lock:
+            self._evicted += removed
+        return removed
+
+    def clear(self) -> None:
+        for _, _, entry in self._entries():
+            shutil.rmtree(entry, ignore_errors=True)
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self._hits, "misses": self._misses, "bypassed": self._bypassed}
+
+    def stats(self) -> Dict:
+        entries = self._entries()
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "entries": len(entries),
+                "disk_usage_bytes": sum(size for _, size, _ in entries),
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "bypassed": self._bypassed,
+                "stored": self._stored,
+                "evicted": self._evicted,
+            }
@@ -0,0 +1,193 @@
+"""
+Streamed ZIP archives of session results
+
+The archive is produced incrementally and handed to the client chunk by chunk
+while it is being compressed, so the first byte goes out immediately and no
+per-request ZIP file is written. Each complete archive is also kept as a cache
+file keyed by a fingerprint of the output folder; repeated downloads and HTTP
+range requests (resumed downloads) are served from that cache.
+
+The bytes are deterministic for a given set of output files, so a resumed
+download always continues the exact archive the client started receiving.
+"""
+
+import os
+import re
+import hashlib
+import zipfile
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+ARCHIVE_CHUNK_SIZE = 256 * 1024
+CACHE_PREFIX = "results-"
+
+# Already-compressed formats gain nothing from deflate, so store them as-is
+STORED_EXTENSIONS = {".png", ".jpg", ".jpeg", ".gif", ".webp", ".zip", ".gz",
+                     ".npz", ".parquet", ".arrow", ".feather"}
+
+
+def compression_for(path: Path) -> int:
+    """Pick the ZIP compression method for a file based on its type"""
+    if path.suffix.lower() in STORED_EXTENSIONS:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def list_output_files(output_dir: Path) -> List[Path]:
+    return sorted(p for p in output_dir.glob("*") if p.is_file())
+
+
+def outputs_fingerprint(files: List[Path]) -> str:
+    """Hash of file names, sizes and modification times"""
+    digest = hashlib.sha1()
+    for p in files:
+        st = p.stat()
+        digest.update(f"{p.name}\0{st.st_size}\0{st.st_mtime_ns}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class _ChunkSink:
+    """Write-only, non-seekable file object that collects bytes for a generator"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._written = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._written += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._written
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_zip_stream(files: List[Path], chunk_size: int = ARCHIVE_CHUNK_SIZE) -> Iterator[bytes]:
+    """Yield a ZIP archive of ``files`` as a sequence of byte chunks"""
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, mode="w", allowZip64=True) as zf:
+        for path in files:
+            st = path.stat()
+            info = zipfile.ZipInfo.from_file(str(path), arcname=path.name)
+            info.compress_type = compression_for(path)
+            with open(path, "rb") as src, zf.open(info, mode="w", force_zip64=st.st_size > 0x7FFFFFFF) as dst:
+                while True:
+                    block = src.read(chunk_size)
+                    if not block:
+                        break
+                    dst.write(block)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            data = sink.drain()
+            if data:
+                yield data
+    data = sink.drain()
+    if data:
+        yield data
+
+
+class ResultsArchive:
+    """
+    Streams and caches the results archive for one session
+
+    Args:
+        session_dir: Session folder; the cache file lives here
+        output_dir: Folder whose files are archived
+    """
+
+    def __init__(self, session_dir: Path, output_dir: Path):
+        self.session_dir = Path(session_dir)
+        self.output_dir = Path(output_dir)
+        self.files = list_output_files(self.output_dir)
+        self.etag = outputs_fingerprint(self.files)
+
+    @property
+    def cache_path(self) -> Path:
+        return self.session_dir / f"{CACHE_PREFIX}{self.etag[:16]}.zip"
+
+    def cached(self) -> Optional[Path]:
+        path = self.cache_path
+        return path if path.exists() else None
+
+    def _drop_stale_caches(self) -> None:
+        for p in self.session_dir.glob(f"{CACHE_PREFIX}*.zip"):
+            if p != self.cache_path:
+                p.unlink(missing_ok=True)
+
+    def stream(self) -> Iterator[bytes]:
+        """
+        Stream the archive while teeing it into the cache file. The cache is
+        only published once the archive completed, so an aborted download
+        never leaves a truncated cache behind.
+        """
+        tmp_path = self.session_dir / f".{CACHE_PREFIX}{os.getpid()}-{id(self)}.part"
+        completed = False
+        try:
+            with open(tmp_path, "wb") as tee:
+                for chunk in iter_zip_stream(self.files):
+                    tee.write(chunk)
+                    yield chunk
+            completed = True
+        finally:
+            if completed:
+                os.replace(tmp_path, self.cache_path)
+                self._drop_stale_caches()
+            else:
+                tmp_path.unlink(missing_ok=True)
+
+    def build(self) -> Path:
+        """Write the archive to the cache without sending it anywhere"""
+        for _ in self.stream():
+            pass
+        return self.cache_path
+
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single ``bytes=start-end`` range against a file of ``size`` bytes
+
+    Returns: inclusive (start, end), or None if the range is not satisfiable
+    Raises: ValueError for malformed or multi-range headers
+    """
+    match = _RANGE_RE.match(header.strip())
+    if not match:
+        raise ValueError(f"Unsupported Range header: {header}")
+    start_s, end_s = match.groups()
+    if not start_s and not end_s:
+        raise ValueError(f"Unsupported Range header: {header}")
+    if not start_s:
+        # Suffix range: last N bytes
+        length = int(end_s)
+        if length == 0:
+            return None
+        return max(0, size - length), size - 1
+    start = int(start_s)
+    end = int(end_s) if end_s else size - 1
+    if start >= size or end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+def iter_file_range(path: Path, start: int, end: int, chunk_size: int = ARCHIVE_CHUNK_SIZE) -> Iterator[bytes]:
+    """Yield bytes ``start..end`` (inclusive) of a file"""
+    remaining = end - start + 1
+    with open(path, "rb") as f:
+        f.seek(start)
+        while remaining > 0:
+            block = f.read(min(chunk_size, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
@@ -0,0 +1,202 @@
+"""
+Session storage lifecycle for the Novel Similarity Analyzer API
+
+Every analysis request gets its own ``session_<id>`` folder under the temp
+directory. The SessionManager tracks those folders, expires them after a
+time-to-live and keeps the total disk usage under a quota by evicting the
+least-recently-used sessions first.
+"""
+
+import os
+import time
+import shutil
+import asyncio
+import threading
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+SESSION_PREFIX = "session_"
+
+
+def directory_size(path: Path) -> int:
+    """Total size in bytes of all files below ``path``"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                # File removed while scanning
+                continue
+    return total
+
+
+class SessionManager:
+    """
+    Creates, tracks and evicts per-request session folders
+
+    Last access time is stored as the session folder's mtime, so the LRU order
+    survives server restarts without a separate index file.
+
+    Args:
+        root: Directory holding the ``session_<id>`` folders
+        ttl_seconds: Sessions idle for longer than this are removed
+        quota_bytes: Upper bound for the disk usage of all sessions together
+        sweep_interval: Seconds between background eviction passes
+    """
+
+    def __init__(self, root: Path, ttl_seconds: float = 6 * 3600,
+                 quota_bytes: int = 2 * 1024 ** 3, sweep_interval: float = 60.0):
+        self.root = Path(root)
+        self.ttl_seconds = ttl_seconds
+        self.quota_bytes = quota_bytes
+        self.sweep_interval = sweep_interval
+        self._lock = threading.Lock()
+        self._pinned: Dict[str, int] = {}
+        self._evicted_total = 0
+        self._freed_bytes_total = 0
+        self._last_sweep: Optional[float] = None
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    # ---------------------------
+    # Session bookkeeping
+    # ---------------------------
+
+    def session_dir(self, session_id: str) -> Path:
+        return self.root / f"{SESSION_PREFIX}{session_id}"
+
+    def create(self) -> str:
+        """Create a new empty session folder and return its id"""
+        while True:
+            session_id = str(uuid.uuid4())[:8]
+            session_dir = self.session_dir(session_id)
+            try:
+                session_dir.mkdir(parents=True)
+                return session_id
+            except FileExistsError:
+                continue
+
+    def exists(self, session_id: str) -> bool:
+        return self.session_dir(session_id).is_dir()
+
+    def touch(self, session_id: str) -> None:
+        """Mark a session as recently used"""
+        try:
+            os.utime(self.session_dir(session_id))
+        except OSError:
+            pass
+
+    def remove(self, session_id: str) -> bool:
+        """Delete a session folder, returning False if it did not exist"""
+        session_dir = self.session_dir(session_id)
+        if not session_dir.exists():
+            return False
+        shutil.rmtree(session_dir, ignore_errors=True)
+        return True
+
+    def acquire(self, session_id: str) -> None:
+        """Protect a session from eviction while a request is working on it"""
+        with self._lock:
+            self._pinned[session_id] = self._pinned.get(session_id, 0) + 1
+
+    def release(self, session_id: str) -> None:
+        """Undo ``acquire`` and mark the session as recently used"""
+        with self._lock:
+            remaining = self._pinned.get(session_id, 1) - 1
+            if remaining <= 0:
+                self._pinned.pop(session_id, None)
+            else:
+                self._pinned[session_id] = remaining
+        self.touch(session_id)
+
+    @contextmanager
+    def in_use(self, session_id: str):
+        """Context manager form of ``acquire``/``release``"""
+        self.acquire(session_id)
+        try:
+            yield self.session_dir(session_id)
+        finally:
+            self.release(session_id)
+
+    def _scan(self) -> List[Dict]:
+        sessions = []
+        for entry in self.root.iterdir():
+            if not entry.is_dir() or not entry.name.startswith(SESSION_PREFIX):
+                continue
+            try:
+                last_access = entry.stat().st_mtime
+            except OSError:
+                continue
+            sessions.append({
+                "session_id": entry.name[len(SESSION_PREFIX):],
+                "last_access": last_access,
+                "size_bytes": directory_size(entry),
+            })
+        return sessions
+
+    # ---------------------------
+    # Eviction
+    # ---------------------------
+
+    def evict(self, now: Optional[float] = None) -> List[str]:
+        """
+        Remove expired sessions, then least-recently-used sessions until the
+        total size fits the quota. Sessions that are in use are never removed.
+
+        Returns: ids of the evicted sessions
+        """
+        now = time.time() if now is None else now
+        sessions = sorted(self._scan(), key=lambda s: s["last_access"])
+        total = sum(s["size_bytes"] for s in sessions)
+        with self._lock:
+            pinned = set(self._pinned)
+
+        evicted = []
+        for s in sessions:
+            if s["session_id"] in pinned:
+                continue
+            expired = now - s["last_access"] > self.ttl_seconds
+            over_quota = total > self.quota_bytes
+            if not (expired or over_quota):
+                continue
+            if self.remove(s["session_id"]):
+                evicted.append(s["session_id"])
+                total -= s["size_bytes"]
+                self._freed_bytes_total += s["size_bytes"]
+
+        self._evicted_total += len(evicted)
+        self._last_sweep = now
+        return evicted
+
+    async def run_eviction_loop(self) -> None:
+        """Background task: evict periodically until cancelled"""
+        while True:
+            try:
+                evicted = await asyncio.to_thread(self.evict)
+                if evicted:
+                    print(f"🧹 Evicted {len(evicted)} session(s): {', '.join(evicted)}")
+            except Exception as e:
+                print(f"⚠️ Session eviction failed: {e}")
+            await asyncio.sleep(self.sweep_interval)
+
+    def stats(self) -> Dict:
+        """Usage statistics for the health endpoint"""
+        sessions = self._scan()
+        total = sum(s["size_bytes"] for s in sessions)
+        with self._lock:
+            active = len(self._pinned)
+        oldest = min((s["last_access"] for s in sessions), default=None)
+        return {
+            "session_count": len(sessions),
+            "active_sessions": active,
+            "disk_usage_bytes": total,
+            "disk_quota_bytes": self.quota_bytes,
+            "disk_usage_percent": round(100.0 * total / self.quota_bytes, 2) if self.quota_bytes else None,
+            "ttl_seconds": self.ttl_seconds,
+            "oldest_session_age_seconds": round(time.time() - oldest, 1) if oldest else None,
+            "evicted_total": self._evicted_total,
+            "freed_bytes_total": self._freed_bytes_total,
+            "last_sweep": self._last_sweep,
+        }
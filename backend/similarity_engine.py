@@ -0,0 +1,631 @@
+"""
+Reusable similarity engine: fit a corpus index once, query it many times
+
+``run_pipeline`` and ``run_enhanced_pipeline`` load, fit, score, rank, write
+and plot in a single call. The SimilarityEngine keeps the fitted vectorizer
+and the database matrix in memory so a long-lived process (the API server, a
+batch job) only pays for vectorising and scoring the new inputs.
+
+Operations:
+    1. Index:  ``fit`` / ``from_database`` / ``from_text_store`` / ``save`` / ``load``
+    2. Score:  ``score`` a batch of input texts against the corpus
+    3. Rank:   ``rank`` per-input matches and relations, ``genre_aggregates``
+    4. Route:  optional ``ClusterRouter`` (fitted by genre_clustering) so
+               ``score(..., n_probe=n)`` only scores the n closest clusters
+    5. Novels: per-novel centroids built at index time;
+               ``score(..., n_novels=n)`` scores the chapters of each input's
+               n best novels exactly, ``novel_ranking`` reports both levels
+
+Routed scores (``n_probe`` / ``n_novels``) are a sparse CSR matrix holding
+only each input's candidates (column ids plus scores per row); ``rank`` and
+``novel_ranking`` rank and aggregate just those candidates, so two-stage
+retrieval never allocates an N_in x N_db matrix.
+
+Scoring is TF-IDF cosine by default. With ``scoring="bm25"`` the engine also
+builds a BM25 inverted index (bm25_index.py) in the same pass and scores with
+it; routing and the novel level still use the TF-IDF vectors.
+
+Queries are thread-safe: fitting swaps the index under a lock, and scoring
+works on a snapshot of the fitted state.
+"""
+
+import json
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
+
+from bm25_index import BM25Index
+from compact_vocabulary import compact_vectorizer, load_index, save_index
+from corpus_reader import CorpusReader
+from novel_similarity_pipeline import (
+    DEFAULT_MATCH_LIMIT,
+    SimilarityResult,
+    build_match_list,
+    classify_relation,
+    iter_database,
+    make_vectorizer,
+    simple_preprocess,
+    top_k_order,
+)
+
+SCORING_METHODS = ("cosine", "bm25")
+COSINE_SCORING = {
+    "method": "cosine",
+    "calibration": "similarity = cosine of the L2-normalised TF-IDF vectors (0-1)",
+}
+
+# ---------------------------
+# Cluster routing
+# ---------------------------
+
+class ClusterRouter:
+    """
+    Cluster centroids plus the corpus documents assigned to each cluster
+
+    Args:
+        centroids: (k x d) cluster centres in the clustering space; dense, or
+            sparse for TF-IDF space centroids over a large vocabulary
+        labels: Cluster id of every corpus document
+        svd: Fitted TruncatedSVD when clustering used reduced vectors
+    """
+
+    def __init__(self, centroids, labels: np.ndarray, svd=None):
+        if sp.issparse(centroids):
+            self.centroids = normalize(centroids.astype(np.float32)).tocsr()
+        else:
+            self.centroids = normalize(np.asarray(centroids, dtype=np.float32))
+        self.labels = np.asarray(labels, dtype=np.int32)
+        self.svd = svd
+        order = np.argsort(self.labels, kind="stable")
+        bounds = np.searchsorted(self.labels[order], np.arange(self.centroids.shape[0] + 1))
+        self.members = [order[bounds[c]:bounds[c + 1]] for c in range(self.centroids.shape[0])]
+
+    @property
+    def n_clusters(self) -> int:
+        return self.centroids.shape[0]
+
+    def project(self, X) -> np.ndarray:
+        """Map TF-IDF rows into the (normalised) clustering space"""
+        Z = self.svd.transform(X) if self.svd is not None else X
+        return normalize(Z)
+
+    def similarities(self, X_in) -> np.ndarray:
+        """Cosine similarity of each input row to every centroid (N_in x k)"""
+        sims = self.project(X_in) @ self.centroids.T
+        return sims.toarray() if sp.issparse(sims) else np.asarray(sims)
+
+    def route(self, X_in, n_probe: int, sims: Optional[np.ndarray] = None) -> List[np.ndarray]:
+        """
+        Corpus document indices of the ``n_probe`` closest clusters, per input row
+
+        Clusters without documents are skipped (mini-batch k-means can leave a
+        centroid with no members), so every probe lands on documents.
+        """
+        if sims is None:
+            sims = self.similarities(X_in)
+        nonempty = np.flatnonzero([len(members) for members in self.members])
+        routed = []
+        for row in sims:
+            nearest = nonempty[top_k_order(row[nonempty], min(n_probe, len(nonempty)))]
+            members = [self.members[c] for c in nearest]
+            routed.append(np.sort(np.concatenate(members)) if members else np.array([], dtype=np.int64))
+        return routed
+
+
+def build_novel_index(X_db, metadata: List[Dict]) -> Tuple[ClusterRouter, List[Dict]]:
+    """
+    Per-novel centroid vectors over the corpus chapters
+
+    Chapters are grouped by (genre, folder_name) as ``extract_novel_info``
+    reports them; files directly under a genre folder are novels of their own.
+
+    Returns: router with one sparse centroid per novel, novel descriptions
+    """
+    keys: Dict[Tuple, int] = {}
+    novels: List[Dict] = []
+    labels = np.empty(len(metadata), dtype=np.int64)
+    for j, meta in enumerate(metadata):
+        folder = meta.get("folder_name", "N/A")
+        key = (meta.get("genre"), folder) if folder != "N/A" else (meta.get("genre"), None, j)
+        if key not in keys:
+            keys[key] = len(novels)
+            novels.append({
+                "genre": meta.get("genre"),
+                "novel_title": meta.get("novel_title", "N/A") if folder != "N/A" else meta.get("display_name"),
+                "folder_name": folder,
+                "chapters": 0
+            })
+        labels[j] = keys[key]
+        novels[labels[j]]["chapters"] += 1
+
+    membership = sp.csr_matrix((np.ones(len(labels), dtype=np.float32), (labels, np.arange(len(labels)))),
+                               shape=(len(novels), len(labels)))
+    # Sum of L2-normalised chapter vectors; normalising it gives the centroid direction
+    return ClusterRouter(membership @ X_db, labels), novels
+
+# ---------------------------
+# Candidates
+# ---------------------------
+
+def candidate_matrix(routed: List[np.ndarray], scores: List[np.ndarray], n_db: int) -> sp.csr_matrix:
+    """Sparse (N_in x N_db) scores of each input's routed documents (sorted column ids)"""
+    indptr = np.zeros(len(routed) + 1, dtype=np.int64)
+    np.cumsum([len(cols) for cols in routed], out=indptr[1:])
+    indices = np.concatenate(routed) if routed else np.array([], dtype=np.int64)
+    data = np.concatenate(scores) if scores else np.array([], dtype=np.float64)
+    return sp.csr_matrix((data, indices, indptr), shape=(len(routed), n_db))
+
+
+def top_candidates(S, i: int, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Column ids and scores of row ``i``'s ``k`` best documents, descending
+    (all of them if ``k`` is 0); a sparse row ranks only its candidates
+    """
+    if sp.issparse(S):
+        start, stop = S.indptr[i], S.indptr[i + 1]
+        cols, scores = S.indices[start:stop], S.data[start:stop]
+        order = top_k_order(scores, k)
+        return cols[order], scores[order]
+    order = top_k_order(S[i], k)
+    return order, S[i][order]
+
+
+def row_scores(S, i: int, cols: np.ndarray) -> np.ndarray:
+    """Scores of row ``i`` at ``cols`` (0 for documents a sparse row did not score)"""
+    if not sp.issparse(S):
+        return S[i, cols]
+    start, stop = S.indptr[i], S.indptr[i + 1]
+    row_cols = S.indices[start:stop]
+    pos = np.searchsorted(row_cols, cols)
+    found = pos < len(row_cols)
+    found[found] = row_cols[pos[found]] == cols[found]
+    sims = np.zeros(len(cols))
+    sims[found] = S.data[start:stop][pos[found]]
+    return sims
+
+
+class SimilarityEngine:
+    """
+    Fitted TF-IDF index over a document corpus
+
+    Args:
+        vectorizer_factory: Callable returning an unfitted TfidfVectorizer
+        preprocess: Text preprocessing applied by ``score(..., preprocess=True)``
+        scoring: "cosine" (TF-IDF) or "bm25"
+    """
+
+    def __init__(self, vectorizer_factory: Callable = make_vectorizer,
+                 preprocess: Callable[[str], str] = simple_preprocess,
+                 scoring: str = "cosine"):
+        if scoring not in SCORING_METHODS:
+            raise ValueError(f"Unknown scoring '{scoring}'. Expected one of: {', '.join(SCORING_METHODS)}")
+        self.vectorizer_factory = vectorizer_factory
+        self.preprocess = preprocess
+        self.scoring = scoring
+        self._lock = threading.RLock()
+        self._state: Optional[Dict] = None
+
+    # ---------------------------
+    # 1) Index
+    # ---------------------------
+
+    def fit(self, texts: Iterable[str], metadata: List[Dict], labels: Optional[List[str]] = None) -> "SimilarityEngine":
+        """
+        Build the corpus index from preprocessed texts
+
+        Args:
+            texts: Preprocessed database documents; any iterable, so a
+                generator streams them through the vectorizer one at a time
+            metadata: One dict per document; needs at least a ``genre`` key
+            labels: Document names (defaults to ``metadata[i]["file_name"]``)
+        """
+        if hasattr(texts, "__len__") and len(texts) != len(metadata):
+            raise ValueError("texts and metadata must have the same length")
+        vec = self.vectorizer_factory()
+        bm25 = None
+        if self.scoring == "bm25":
+            # Same tokens as the vectorizer, collected in the same pass
+            bm25 = BM25Index(vec.build_analyzer())
+            texts = bm25.index_stream(texts)
+        X_db = vec.fit_transform(texts)  # (N_db, V)
+        if X_db.shape[0] != len(metadata):
+            raise ValueError("texts and metadata must have the same length")
+        compact_vectorizer(vec)  # vocabulary_ dict -> CompactVocabulary (see compact_vocabulary.py)
+        state = dict(self._corpus_state(metadata, labels), vectorizer=vec, X_db=X_db, bm25=bm25)
+        state["novel_router"], state["novels"] = build_novel_index(X_db, state["metadata"])
+        with self._lock:
+            self._state = state
+        return self
+
+    @staticmethod
+    def _corpus_state(metadata: List[Dict], labels: Optional[List[str]] = None) -> Dict:
+        """Document names, genres and titles derived from corpus metadata"""
+        genres = [m["genre"] for m in metadata]
+        genre_names = sorted(set(genres))
+        return {
+            "metadata": list(metadata),
+            "labels": list(labels) if labels is not None else [m.get("file_name", str(j)) for j, m in enumerate(metadata)],
+            "genres": genres,
+            "titles": [m.get("novel_title", "N/A") for m in metadata],
+            "genre_cols": {g: np.array([j for j, gg in enumerate(genres) if gg == g]) for g in genre_names},
+        }
+
+    @classmethod
+    def for_scores(cls, metadata: List[Dict], labels: Optional[List[str]] = None,
+                   scoring_info: Optional[Dict] = None) -> "SimilarityEngine":
+        """
+        Rank-only engine over a corpus described by its metadata
+
+        Ranks stored score matrices (e.g. from ``match_scores.npz``) without
+        the vectorizer or the corpus matrix; ``score`` is not available.
+        ``scoring_info`` describes how the stored scores were computed.
+        """
+        engine = cls()
+        engine._state = dict(cls._corpus_state(metadata, labels), scoring_info=scoring_info)
+        return engine
+
+    @classmethod
+    def from_database(cls, db_root: str, max_files_per_genre: Optional[int] = 50, **kwargs) -> "SimilarityEngine":
+        """
+        Fit on ``db_root/<genre>/...`` (the files ``load_database`` would load)
+
+        Files are read ahead on a small thread pool (see corpus_reader.py) and
+        preprocessed in order while the vectorizer consumes them, so the corpus
+        text is never held in memory as a whole.
+        """
+        files = list(iter_database(db_root, max_files_per_genre))
+        if not files:
+            raise SystemExit("No .txt files found in the database.")
+        metadata = [info for _, info in files]
+        reader = CorpusReader()
+        texts = (simple_preprocess(text) for text in reader.texts(path for path, _ in files))
+        engine = cls(**kwargs).fit(texts, metadata, [m["file_name"] for m in metadata])
+        reader.print_summary()
+        return engine
+
+    @classmethod
+    def from_text_store(cls, store, **kwargs) -> "SimilarityEngine":
+        """
+        Fit on a ``TextStore`` (see text_store.py), streaming its documents
+        through the engine's ``preprocess``
+        """
+        engine = cls(**kwargs)
+        texts = (engine.preprocess(text) for text in store.iter_texts())
+        return engine.fit(texts, store.metadata, [m["file_name"] for m in store.metadata])
+
+    def _snapshot(self) -> Dict:
+        with self._lock:
+            if self._state is None:
+                raise RuntimeError("SimilarityEngine is not fitted")
+            return self._state
+
+    @property
+    def is_fitted(self) -> bool:
+        with self._lock:
+            return self._state is not None
+
+    @property
+    def size(self) -> int:
+        return len(self._snapshot()["labels"])
+
+    @property
+    def vectorizer(self):
+        return self._snapshot()["vectorizer"]
+
+    @property
+    def matrix(self):
+        """Fitted corpus TF-IDF matrix (N_db x V, L2-normalised rows)"""
+        return self._snapshot()["X_db"]
+
+    @property
+    def metadata(self) -> List[Dict]:
+        return self._snapshot()["metadata"]
+
+    @property
+    def labels(self) -> List[str]:
+        return self._snapshot()["labels"]
+
+    @property
+    def genres(self) -> List[str]:
+        return self._snapshot()["genres"]
+
+    @property
+    def novels(self) -> List[Dict]:
+        """Novel descriptions (genre, novel_title, folder_name, chapters) in novel-index order"""
+        return self._snapshot()["novels"]
+
+    @property
+    def scoring_info(self) -> Optional[Dict]:
+        """Scoring method and score calibration (as given to ``for_scores`` for rank-only engines)"""
+        state = self._snapshot()
+        if "vectorizer" not in state:
+            return state.get("scoring_info")
+        return state["bm25"].describe() if state.get("bm25") is not None else dict(COSINE_SCORING)
+
+    @property
+    def router(self):
+        """Cluster routing layer (ClusterRouter built by genre_clustering), if attached"""
+        return self._snapshot().get("router")
+
+    def set_router(self, router) -> None:
+        """Attach a routing layer fitted on this index; refitting the index drops it"""
+        with self._lock:
+            state = self._snapshot()
+            if len(router.labels) != len(state["labels"]):
+                raise ValueError("Router was fitted on a different corpus")
+            self._state = dict(state, router=router)
+
+    def save(self, path: str) -> None:
+        """
+        Persist the fitted index (vectorizer, matrix and metadata); the
+        vocabularies go to ``<path>.vocab<k>`` files next to it
+        """
+        state = self._snapshot()
+        save_index({"state": state, "preprocess": self.preprocess,
+                    "vectorizer_factory": self.vectorizer_factory,
+                    "scoring": self.scoring}, path)
+
+    @classmethod
+    def load(cls, path: str, mmap_mode: bool = True) -> "SimilarityEngine":
+        """Load a saved index; its vocabularies are memory-mapped unless ``mmap_mode=False``"""
+        data = load_index(path, mmap_mode)
+        engine = cls(vectorizer_factory=data["vectorizer_factory"], preprocess=data["preprocess"],
+                     scoring=data.get("scoring", "cosine"))
+        state = data["state"]
+        if "vectorizer" in state:
+            # Indexes saved before vocabularies were compact
+            compact_vectorizer(state["vectorizer"])
+        if "novel_router" not in state:
+            # Indexes saved before the novel level existed
+            state["novel_router"], state["novels"] = build_novel_index(state["X_db"], state["metadata"])
+        engine._state = state
+        return engine
+
+    # ---------------------------
+    # 2) Score
+    # ---------------------------
+
+    def transform(self, texts: List[str], preprocess: bool = False):
+        """Vectorise input texts with the fitted vectorizer"""
+        state = self._snapshot()
+        if "vectorizer" not in state:
+            raise RuntimeError("SimilarityEngine was built from stored scores and cannot score new texts")
+        if preprocess:
+            texts = [self.preprocess(t) for t in texts]
+        return state["vectorizer"].transform(texts)
+
+    def key_terms(self, texts: List[str], n_terms: int = 8, preprocess: bool = False) -> List[List[str]]:
+        """Highest-weighted vocabulary terms of each input (e.g. to locate passages)"""
+        X_in = self.transform(texts, preprocess).tocsr()
+        vocabulary = self._snapshot()["vectorizer"].vocabulary_
+        terms = []
+        for i in range(X_in.shape[0]):
+            row = X_in[i]
+            terms.append(vocabulary.terms_for_ids(row.indices[np.argsort(-row.data, kind="stable")[:n_terms]]))
+        return terms
+
+    def score(self, texts: List[str], preprocess: bool = False, n_probe: int = 0, n_novels: int = 0,
+              block_size: int = 0) -> np.ndarray:
+        """
+        Similarity of each input against every corpus document (N_in x N_db):
+        TF-IDF cosine, or calibrated BM25 (0-1) when the engine scores with BM25
+
+        With ``n_novels``, each input is scored only against the chapters of
+        its ``n_novels`` closest novel centroids (see ``score_novels``). With
+        ``n_probe`` and an attached router, only the documents of the
+        ``n_probe`` closest clusters are scored. Routed scores are a sparse
+        CSR matrix of the scored candidates only (unscored documents read as 0).
+        With ``block_size``, cosine scores are computed ``block_size`` corpus
+        documents at a time, so only one block's sparse product is alive.
+        """
+        if n_novels:
+            return self.score_novels(texts, n_novels, preprocess)[0]
+        state = self._snapshot()
+        if preprocess:
+            texts = [self.preprocess(t) for t in texts]
+        router = state.get("router") if n_probe else None
+        if state.get("bm25") is not None:
+            # TF-IDF vectors are only needed to pick the clusters
+            routed = router.route(self.transform(texts), n_probe) if router is not None else None
+            return self._bm25_scores(state["bm25"], texts, routed)
+        X_in = self.transform(texts)
+        if router is None and block_size and block_size < state["X_db"].shape[0]:
+            return self._score_blocks(X_in, state["X_db"], block_size)
+        if router is None:
+            return cosine_similarity(X_in, state["X_db"])
+        return self._score_routed(X_in, state["X_db"], router.route(X_in, n_probe))
+
+    def score_novels(self, texts: List[str], n_novels: int = 5, preprocess: bool = False) -> Tuple[sp.csr_matrix, np.ndarray]:
+        """
+        Two-stage retrieval: novel centroids first, then their chapters exactly
+
+        Returns: chapter scores (sparse N_in x N_db holding only the chapters
+        of each input's ``n_novels`` best novels) and novel-centroid scores
+        (N_in x N_novels)
+        """
+        state = self._snapshot()
+        if preprocess:
+            texts = [self.preprocess(t) for t in texts]
+        X_in = self.transform(texts)
+        novel_router = state["novel_router"]
+        novel_S = novel_router.similarities(X_in)
+        routed = novel_router.route(X_in, n_novels, novel_S)
+        if state.get("bm25") is not None:
+            return self._bm25_scores(state["bm25"], texts, routed), novel_S
+        return self._score_routed(X_in, state["X_db"], routed), novel_S
+
+    @staticmethod
+    def _score_routed(X_in, X_db, routed: List[np.ndarray]) -> sp.csr_matrix:
+        scores = [cosine_similarity(X_in[i], X_db[cols])[0] for i, cols in enumerate(routed)]
+        return candidate_matrix(routed, scores, X_db.shape[0])
+
+    @staticmethod
+    def _score_blocks(X_in, X_db, block_size: int) -> np.ndarray:
+        S = np.empty((X_in.shape[0], X_db.shape[0]))
+        for start in range(0, X_db.shape[0], block_size):
+            stop = min(start + block_size, X_db.shape[0])
+            S[:, start:stop] = cosine_similarity(X_in, X_db[start:stop])
+        return S
+
+    @staticmethod
+    def _bm25_scores(bm25: BM25Index, texts: List[str], routed: Optional[List[np.ndarray]] = None):
+        if routed is None:
+            return bm25.score(texts)
+        scores = [bm25.score_text(text)[cols] for text, cols in zip(texts, routed)]
+        return candidate_matrix(routed, scores, bm25.n_docs)
+
+    # ---------------------------
+    # 3) Rank
+    # ---------------------------
+
+    def genre_aggregates(self, S) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+        """Per genre: (mean per input, max per input) over that genre's documents"""
+        state = self._snapshot()
+        aggregates = {}
+        for g, cols in state["genre_cols"].items():
+            block = S[:, cols]
+            if sp.issparse(block):
+                # Documents that were not candidates count as 0, as in a dense matrix
+                aggregates[g] = (np.asarray(block.mean(axis=1)).ravel(), block.max(axis=1).toarray().ravel())
+            else:
+                aggregates[g] = (block.mean(axis=1), block.max(axis=1))
+        return aggregates
+
+    def genre_rank_overall(self, S) -> List[Tuple[str, float, float]]:
+        """Genres ranked by max similarity across all inputs: (genre, mean, max)"""
+        state = self._snapshot()
+        overall = [(g, float(S[:, cols].mean()), float(S[:, cols].max())) for g, cols in state["genre_cols"].items()]
+        return sorted(overall, key=lambda x: x[2], reverse=True)
+
+    def novel_ranking(self, S, novel_S: np.ndarray, n_novels: int = 5,
+                      chapters_per_novel: int = 3) -> List[List[Dict]]:
+        """
+        Per input: the ``n_novels`` best novels with their centroid score,
+        best chapter score and top chapters (from ``score_novels``)
+        """
+        state = self._snapshot()
+        novel_router, novels, metadata = state["novel_router"], state["novels"], state["metadata"]
+        ranking = []
+        for i in range(S.shape[0]):
+            entries = []
+            for n in top_k_order(novel_S[i], min(n_novels, len(novels))):
+                chapters = novel_router.members[n]
+                sims = row_scores(S, i, chapters)
+                best = top_k_order(sims, chapters_per_novel)[:chapters_per_novel]
+                entries.append(dict(
+                    novels[n],
+                    novel_similarity=round(float(novel_S[i, n]) * 100, 2),
+                    best_chapter_similarity=round(float(sims.max()) * 100, 2),
+                    top_chapters=[
+                        {
+                            "database_file": metadata[j]["file_name"],
+                            "chapter_name": metadata[j].get("chapter_name"),
+                            "display_name": metadata[j].get("display_name"),
+                            "similarity": round(float(score) * 100, 2)
+                        }
+                        for j, score in zip(chapters[best], sims[best])
+                    ]
+                ))
+            ranking.append(entries)
+        return ranking
+
+    def rank(self, S, in_labels: List[str],
+             k_neighbors: int = 3,
+             dup_threshold: float = 0.90,
+             similar_threshold: float = 0.60,
+             match_limit: Optional[int] = DEFAULT_MATCH_LIMIT) -> SimilarityResult:
+        """
+        Per-input rankings, relation labels and overall DB/genre rankings
+
+        ``S`` is dense, or sparse from routed scoring: then only each input's
+        candidates are ranked and ``db_overall_rank`` lists only documents
+        that were a candidate for some input.
+        """
+        state = self._snapshot()
+        db_labels, db_genres, db_titles, db_metadata = state["labels"], state["genres"], state["titles"], state["metadata"]
+        aggregates = self.genre_aggregates(S)
+
+        rows = []
+        edges = []
+        # Only the embedded top matches are sorted; the rest stays in match_scores.npz
+        n_matches = 0 if not match_limit else max(match_limit, k_neighbors)
+        for i, in_name in enumerate(in_labels):
+            order, top_scores = top_candidates(S, i, n_matches)  # descending
+            sims = dict(zip(order.tolist(), top_scores.tolist())) if sp.issparse(S) else S[i]
+            # A routed input can end up with no candidates: no top match, scored 0
+            top_idx = order[0] if len(order) else None
+            top_score = float(top_scores[0]) if len(order) else 0.0
+            relation = classify_relation(top_score, dup_threshold, similar_threshold)
+
+            # Store edges for network
+            for j, score in zip(order[:k_neighbors], top_scores[:k_neighbors]):
+                edges.append((in_name, db_labels[j], float(score)))
+
+            # Aggregate by genre (max & mean within each genre)
+            genre_rank = sorted(
+                [(g, float(mean[i]), float(mx[i])) for g, (mean, mx) in aggregates.items()],
+                key=lambda x: x[2], reverse=True
+            )
+
+            top_metadata = db_metadata[top_idx] if top_idx is not None else {}
+            rows.append({
+                "input_doc": in_name,
+                "input_similarities": build_match_list(sims, order, db_metadata),
+                "top_db_doc": db_labels[top_idx] if top_idx is not None else None,
+                "top_genre": db_genres[top_idx] if top_idx is not None else None,
+                "top_novel_title": db_titles[top_idx] if top_idx is not None else None,
+                "top_folder_name": top_metadata.get("folder_name"),
+                "top_chapter_name": top_metadata.get("chapter_name"),
+                "top_display_name": top_metadata.get("display_name"),
+                "top_similarity": round(top_score, 4),
+                "relation": relation,
+                "genre_rank_json": json.dumps([{"genre": g, "mean": round(m,4), "max": round(mx,4)} for g,m,mx in genre_rank], ensure_ascii=False)
+            })
+
+        # Which DB story is most similar (best match) across all inputs?
+        if sp.issparse(S):
+            # Only documents that were a candidate for some input
+            db_cols, inverse = np.unique(S.indices, return_inverse=True)
+            best_by_db = np.full(len(db_cols), -np.inf)
+            np.maximum.at(best_by_db, inverse, S.data)
+        else:
+            db_cols, best_by_db = np.arange(S.shape[1]), S.max(axis=0)  # (N_db,)
+        db_overall_rank = []
+        for k in np.argsort(-best_by_db, kind="stable"):
+            j = db_cols[k]
+            file_meta = db_metadata[j]
+            db_overall_rank.append({
+                "db_doc": db_labels[j],
+                "genre": db_genres[j],
+                "title": db_titles[j],
+                "novel_title": file_meta["novel_title"],
+                "folder_name": file_meta["folder_name"],
+                "chapter_name": file_meta["chapter_name"],
+                "display_name": file_meta["display_name"],
+                "file_name": file_meta["file_name"],
+                "best_similarity": float(best_by_db[k])
+            })
+
+        return SimilarityResult(
+            S=S,
+            in_labels=list(in_labels),
+            db_labels=db_labels,
+            db_genres=db_genres,
+            db_titles=db_titles,
+            db_metadata=db_metadata,
+            rows=rows,
+            edges=edges,
+            db_overall_rank=db_overall_rank,
+            genre_rank_overall=self.genre_rank_overall(S),
+            k_neighbors=k_neighbors,
+            scoring=self.scoring_info
+        )
+
+    def query(self, texts: List[str], in_labels: List[str], preprocess: bool = False,
+              n_probe: int = 0, n_novels: int = 0, **rank_kwargs) -> SimilarityResult:
+        """Score and rank in one call"""
+        return self.rank(self.score(texts, preprocess, n_probe, n_novels), in_labels, **rank_kwargs)
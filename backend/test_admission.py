@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Unit tests for admission control.
+"""
+
+import os
+import sys
+import asyncio
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import admission
+from admission import AdmissionController, AdmissionRejected
+
+
+class TestAdmissionController(unittest.TestCase):
+    """Test cases for the concurrency limit, wait queue and memory floor."""
+
+    def test_queue_then_reject_when_full(self):
+        async def scenario():
+            ctl = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=5)
+            first = await ctl.acquire()
+            waiter = asyncio.create_task(ctl.acquire())
+            await asyncio.sleep(0)
+            self.assertEqual(ctl.stats()["queued"], 1)
+            with self.assertRaises(AdmissionRejected) as rejected:
+                await ctl.acquire()
+            self.assertEqual(rejected.exception.status_code, 429)
+            self.assertGreaterEqual(rejected.exception.retry_after, 1)
+            ctl.release(first)
+            second = await waiter  # the slot is handed over in FIFO order
+            self.assertEqual(ctl.stats()["active"], 1)
+            ctl.release(second)
+            return ctl.stats()
+
+        stats = asyncio.run(scenario())
+        self.assertEqual(stats["active"], 0)
+        self.assertEqual(stats["admitted"], 2)
+        self.assertEqual(stats["rejected"]["queue_full"], 1)
+
+    def test_queue_timeout_and_cancelled_waiters(self):
+        async def scenario():
+            ctl = AdmissionController(max_concurrent=1, max_queue=2, queue_timeout=0.05)
+            first = await ctl.acquire()
+            with self.assertRaises(AdmissionRejected) as rejected:
+                await ctl.acquire()
+            self.assertEqual(rejected.exception.status_code, 503)
+            ctl.queue_timeout = 5
+            waiter = asyncio.create_task(ctl.acquire())
+            await asyncio.sleep(0)
+            waiter.cancel()
+            ctl.release(first)  # may hand the slot to the waiter being cancelled
+            await asyncio.gather(waiter, return_exceptions=True)
+            return ctl.stats()
+
+        stats = asyncio.run(scenario())
+        self.assertEqual((stats["active"], stats["queued"]), (0, 0))
+        self.assertEqual(stats["rejected"]["queue_timeout"], 1)
+
+    def test_low_memory_is_rejected(self):
+        async def scenario():
+            ctl = AdmissionController(max_concurrent=2, min_available_mb=1024)
+            with mock.patch.object(admission, "available_memory_bytes", return_value=100 * 1024 * 1024):
+                with self.assertRaises(AdmissionRejected) as rejected:
+                    await ctl.acquire()
+            self.assertEqual(rejected.exception.status_code, 503)
+            return ctl.stats()
+
+        stats = asyncio.run(scenario())
+        self.assertEqual(stats["rejected"]["memory"], 1)
+        self.assertEqual(stats["active"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
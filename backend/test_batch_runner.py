@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Unit tests for streaming batch comparison and resume.
+"""
+
+import os
+import sys
+import json
+import unittest
+import tempfile
+import shutil
+import zipfile
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from batch_runner import BatchJobManager, completed_lines, iter_input_documents, run_batch
+from similarity_engine import SimilarityEngine
+
+
+class TestBatchRunner(unittest.TestCase):
+    """Test cases for run_batch output and checkpointing."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='test_batch_')
+        for rel, text in {
+            "db/Romance/love.txt": "love letters and a summer wedding",
+            "db/Sci-Fi/space.txt": "starships crossing the galactic empire",
+            "inputs/a.txt": "a wedding in summer",
+            "inputs/b.txt": "the galactic empire falls",
+            "inputs/nested/c.txt": "love and starships",
+        }.items():
+            path = os.path.join(self.tmp, rel)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(text)
+        self.engine = SimilarityEngine.from_database(os.path.join(self.tmp, "db"))
+        self.inputs = os.path.join(self.tmp, "inputs")
+        self.out = os.path.join(self.tmp, "results.jsonl")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def read_records(self):
+        with open(self.out, encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+
+    def test_one_line_per_input_with_top_k(self):
+        summary = run_batch(self.engine, self.inputs, self.out, batch_size=2, top_k=1)
+        self.assertTrue(summary["completed"])
+        records = self.read_records()
+        self.assertEqual([r["input"] for r in records], ["a.txt", "b.txt", os.path.join("nested", "c.txt")])
+        self.assertEqual(records[0]["top_matches"][0]["genre"], "Romance")
+        self.assertEqual(records[1]["top_matches"][0]["genre"], "Sci-Fi")
+        self.assertTrue(all(len(r["top_matches"]) == 1 for r in records))
+
+    def test_resume_after_torn_line(self):
+        run_batch(self.engine, self.inputs, self.out, batch_size=1)
+        with open(self.out, 'rb') as f:
+            full = f.read()
+        first_line_end = full.index(b"\n") + 1
+        with open(self.out, 'wb') as f:
+            f.write(full[:first_line_end + 10])  # one complete line plus a torn one
+
+        self.assertEqual(completed_lines(self.out), 1)
+        summary = run_batch(self.engine, self.inputs, self.out, batch_size=1)
+        self.assertEqual(summary["skipped_as_done"], 1)
+        with open(self.out, 'rb') as f:
+            self.assertEqual(f.read(), full)
+
+    def test_job_ids_are_validated_and_rejected_jobs_removed(self):
+        jobs = BatchJobManager(Path(self.tmp) / "jobs")
+        for job_id in ("..", "%2E%2E", "", "ABCDEF01", "0123abcd/..", "0123abcd\n"):
+            for accessor in (jobs.job_dir, jobs.results_path, jobs.status):
+                with self.assertRaises(KeyError):
+                    accessor(job_id)
+        job_id, archive_path = jobs.create("0123abcd", {})
+        archive_path.write_bytes(b"not a zip")
+        jobs.remove(job_id)
+        self.assertFalse(jobs.job_dir(job_id).exists())
+        self.assertTrue(jobs.root.is_dir())
+
+    def test_thai_codepage_inputs_are_decoded(self):
+        thai = "นิยายเรื่องนี้เกี่ยวกับมังกร และอัศวิน"
+        folder = os.path.join(self.tmp, "thai")
+        os.makedirs(folder)
+        with open(os.path.join(folder, "tis.txt"), "wb") as f:
+            f.write(thai.encode("cp874"))
+        archive = os.path.join(self.tmp, "thai.zip")
+        with zipfile.ZipFile(archive, "w") as z:
+            z.writestr("tis.txt", thai.encode("cp874"))
+        for source in (folder, archive):
+            self.assertEqual(list(iter_input_documents(source)), [("tis.txt", thai)])
+
+
+if __name__ == "__main__":
+    unittest.main()
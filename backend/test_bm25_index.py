@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the BM25 inverted index and BM25 scoring in the engine.
+"""
+
+import os
+import sys
+import unittest
+import tempfile
+import shutil
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bm25_index import BM25Index
+from similarity_engine import SimilarityEngine
+
+DOCS = [
+    "the dragon guarded the castle gold",
+    "the knight rode to the castle",
+    "a quiet village by the sea",
+    "the dragon slept the dragon woke the dragon burned the village " * 3,
+]
+
+
+class TestBM25Index(unittest.TestCase):
+    """Test cases for postings, saturation and calibration."""
+
+    def setUp(self):
+        self.index = BM25Index(str.split).fit(iter(DOCS))
+
+    def test_postings_layout(self):
+        t = self.index.vocabulary["dragon"]
+        start, end = self.index.indptr[t], self.index.indptr[t + 1]
+        self.assertEqual(self.index.doc_ids[start:end].tolist(), [0, 3])
+        self.assertEqual(self.index.tfs[start:end].tolist(), [1, 9])
+        self.assertEqual(self.index.doc_lengths.tolist(), [len(d.split()) for d in DOCS])
+        self.assertEqual(int(self.index.indptr[-1]), len(self.index.doc_ids))
+
+    def test_saturation_and_length_normalisation(self):
+        raw = self.index.score_text("dragon castle", calibrate=False)
+        # Nine "dragon"s in a long chapter do not beat a short doc with both terms
+        self.assertEqual(int(np.argmax(raw)), 0)
+        self.assertEqual(raw[2], 0.0)
+
+    def test_calibration_maps_an_exact_copy_to_one(self):
+        S = self.index.score([DOCS[1], "unknown words only"])
+        self.assertAlmostEqual(S[0, 1], 1.0, places=6)
+        self.assertTrue(np.all((S >= 0) & (S <= 1)))
+        self.assertFalse(S[1].any())
+
+
+class TestEngineBM25Scoring(unittest.TestCase):
+    """Test cases for BM25 through SimilarityEngine."""
+
+    def test_rank_and_save_load(self):
+        metadata = [{"genre": g, "file_name": f"d{j}.txt", "novel_title": "N/A", "folder_name": "N/A",
+                     "chapter_name": f"d{j}", "display_name": f"d{j}"}
+                    for j, g in enumerate(["a", "b", "c", "a"])]
+        engine = SimilarityEngine(scoring="bm25").fit((d for d in DOCS), metadata)
+        result = engine.query(["the knight rode to the castle"], ["in.txt"])
+        self.assertEqual(result.rows[0]["top_db_doc"], "d1.txt")
+        self.assertEqual(result.rows[0]["relation"], "duplicate/near-duplicate")
+        self.assertEqual(result.overall_ranking()["analysis_info"]["scoring"]["method"], "bm25")
+
+        tmp = tempfile.mkdtemp(prefix='test_bm25_')
+        try:
+            path = os.path.join(tmp, "index.pkl")
+            engine.save(path)
+            loaded = SimilarityEngine.load(path)
+            np.testing.assert_allclose(loaded.score(DOCS[:2]), engine.score(DOCS[:2]))
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+        with self.assertRaises(ValueError):
+            SimilarityEngine(scoring="dot")
+
+
+if __name__ == "__main__":
+    unittest.main()
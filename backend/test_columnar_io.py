@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the binary similarity matrix and table formats.
+"""
+
+import os
+import sys
+import unittest
+import tempfile
+import shutil
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from columnar_io import (PYARROW_SUPPORT, read_similarity_matrix, read_table,
+                         write_similarity_matrix, write_table)
+
+
+class TestColumnarIO(unittest.TestCase):
+    """Round-trip tests for every output format."""
+
+    def setUp(self):
+        self.out_root = tempfile.mkdtemp(prefix='test_columnar_')
+        self.matrix = np.random.default_rng(0).random((3, 5))
+        self.rows = ["input 1", "อินพุต 2", "input 3"]
+        self.cols = [f"Novel - chapter {i}" for i in range(5)]
+
+    def tearDown(self):
+        shutil.rmtree(self.out_root, ignore_errors=True)
+
+    def roundtrip(self, fmt):
+        path = write_similarity_matrix(self.matrix, self.rows, self.cols, self.out_root, fmt)
+        values, rows, cols = read_similarity_matrix(path)
+        self.assertEqual(rows, self.rows)
+        self.assertEqual(cols, self.cols)
+        np.testing.assert_allclose(values, self.matrix, rtol=1e-6)
+        return values
+
+    def test_csv_matrix(self):
+        self.roundtrip("csv")
+
+    def test_npz_matrix_is_float32(self):
+        self.assertEqual(self.roundtrip("npz").dtype, np.float32)
+
+    @unittest.skipUnless(PYARROW_SUPPORT, "pyarrow not installed")
+    def test_arrow_formats(self):
+        self.assertEqual(self.roundtrip("parquet").dtype, np.float32)
+        self.assertEqual(self.roundtrip("arrow").dtype, np.float32)
+
+    def test_npz_table_with_nested_cells(self):
+        df = pd.DataFrame({
+            "input_doc": ["a.txt", "b.txt"],
+            "top_similarity": [0.5, 0.25],
+            "input_similarities": [[{"similarity": 50.0}], []],
+        })
+        loaded = read_table(write_table(df, self.out_root, "comparison_table", "npz"))
+        self.assertEqual(loaded["input_doc"].tolist(), ["a.txt", "b.txt"])
+        self.assertEqual(loaded["top_similarity"].tolist(), [0.5, 0.25])
+        self.assertEqual(loaded["input_similarities"].tolist(), ['[{"similarity": 50.0}]', '[]'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the compact vocabulary and memory-mapped index files.
+"""
+
+import os
+import sys
+import pickle
+import unittest
+import tempfile
+import shutil
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from compact_vocabulary import CompactVocabulary
+from novel_similarity_pipeline import make_vectorizer
+from similarity_engine import SimilarityEngine
+
+DOCS = [
+    "the dragon and the knight",
+    "นิยาย มังกร และ อัศวิน",
+    "a knight without a dragon",
+    "มังกร สีทอง บิน ข้าม ภูเขา",
+]
+
+
+def metadata(n: int):
+    return [{"genre": f"g{j % 2}", "file_name": f"doc{j}.txt", "novel_title": f"novel{j}",
+             "folder_name": f"novel{j}", "chapter_name": f"doc{j}", "display_name": f"doc{j}"}
+            for j in range(n)]
+
+
+class TestCompactVocabulary(unittest.TestCase):
+    """Test cases for lookups, vectorizer use and persistence."""
+
+    def test_mapping_matches_dict(self):
+        vocabulary = {"b": 5, "a": 9, "มังกร": 0, "knight": 3}
+        compact = CompactVocabulary.from_mapping(vocabulary)
+        self.assertEqual(dict(compact.items()), vocabulary)
+        self.assertEqual(list(compact), sorted(vocabulary))
+        self.assertEqual(len(compact), 4)
+        self.assertEqual(compact["มังกร"], 0)
+        self.assertIsNone(compact.get("dragon"))
+        self.assertNotIn("\ud800", compact)
+        with self.assertRaises(KeyError):
+            compact["dragon"]
+        self.assertEqual(dict(pickle.loads(pickle.dumps(compact)).items()), vocabulary)
+        self.assertEqual(compact.terms_for_ids([9, 0, 5]), ["a", "มังกร", "b"])
+        self.assertEqual(len(CompactVocabulary.from_mapping({})), 0)
+
+    def test_vectorizer_output_is_unchanged(self):
+        vec = make_vectorizer().fit(DOCS)
+        expected = vec.transform(DOCS + ["unknown dragon"]).toarray()
+        names = vec.get_feature_names_out()
+        vec.vocabulary_ = CompactVocabulary.from_mapping(vec.vocabulary_)
+        np.testing.assert_allclose(vec.transform(DOCS + ["unknown dragon"]).toarray(), expected)
+        self.assertEqual(vec.get_feature_names_out().tolist(), names.tolist())
+        ids = np.array([len(names) - 1, 0, 3])
+        self.assertEqual(vec.vocabulary_.terms_for_ids(ids), names[ids].tolist())
+
+    def test_saved_index_maps_vocabularies(self):
+        tmp = tempfile.mkdtemp(prefix='test_compact_vocabulary_')
+        try:
+            for scoring in ("cosine", "bm25"):
+                engine = SimilarityEngine(scoring=scoring).fit(DOCS, metadata(len(DOCS)))
+                self.assertIsInstance(engine.vectorizer.vocabulary_, CompactVocabulary)
+                path = os.path.join(tmp, f"{scoring}.pkl")
+                engine.save(path)
+                self.assertTrue(os.path.exists(path + ".vocab0"))
+                self.assertEqual(os.path.exists(path + ".vocab1"), scoring == "bm25")
+
+                loaded = SimilarityEngine.load(path)
+                queries = ["dragon knight", "มังกร บิน"]
+                np.testing.assert_allclose(loaded.score(queries), engine.score(queries))
+                # Saving a loaded (mapped) index over itself keeps it readable
+                loaded.save(path)
+                np.testing.assert_allclose(SimilarityEngine.load(path, mmap_mode=False).score(queries),
+                                           engine.score(queries))
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Unit tests for concurrent corpus reading and encoding detection.
+"""
+
+import os
+import sys
+import unittest
+import tempfile
+import shutil
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from corpus_reader import CorpusReader, decode_text
+from novel_similarity_pipeline import read_txt
+
+THAI = "นิยายเรื่องนี้เกี่ยวกับมังกร และอัศวิน"
+
+
+class TestCorpusReader(unittest.TestCase):
+    """Test cases for encoding detection, ordering and statistics."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='test_corpus_reader_')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def write(self, name: str, data: bytes) -> str:
+        path = os.path.join(self.tmp, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def test_detects_encodings(self):
+        self.assertEqual(decode_text(THAI.encode("utf-8")), (THAI, "utf-8", 0))
+        self.assertEqual(decode_text(THAI.encode("cp874")), (THAI, "cp874", 0))
+        self.assertEqual(decode_text(THAI.encode("tis-620")), (THAI, "cp874", 0))
+        self.assertEqual(decode_text(b"\xef\xbb\xbfhello")[:2], ("hello", "utf-8-sig"))
+        self.assertEqual(decode_text("hello".encode("utf-16"))[:2], ("hello", "utf-16"))
+        # Neither UTF-8 nor Thai: invalid bytes are dropped and counted
+        self.assertEqual(decode_text(b"caf\xe9 \x81x"), ("caf x", "utf-8", 2))
+        # Latin-1 / cp1252 accents are in the Thai byte range but are not Thai text
+        self.assertEqual(decode_text("café résumé".encode("cp1252")), ("caf rsum", "utf-8", 3))
+        self.assertEqual(decode_text("À la carte, déjà vu".encode("latin-1"))[1:], ("utf-8", 3))
+        mixed = "Chapter 1 บทที่หนึ่ง " + THAI
+        self.assertEqual(decode_text(mixed.encode("cp874")), (mixed, "cp874", 0))
+
+    def test_thai_codepage_file_is_not_lost(self):
+        path = self.write("tis.txt", THAI.encode("cp874"))
+        self.assertEqual(read_txt(path), THAI)
+
+    def test_ordered_read_ahead_and_summary(self):
+        paths = [self.write(f"doc{i:02d}.txt", f"document {i}".encode()) for i in range(25)]
+        paths.append(self.write("thai.txt", THAI.encode("cp874")))
+        reader = CorpusReader(workers=4, read_ahead=3)
+        texts = list(reader.texts(paths))
+        self.assertEqual(texts[:25], [f"document {i}" for i in range(25)])
+        self.assertEqual(texts[25], THAI)
+
+        summary = reader.summary()
+        self.assertEqual(summary["files"], 26)
+        self.assertEqual(summary["encodings"], {"utf-8": 25, "cp874": 1})
+        self.assertEqual(summary["bytes"], sum(os.path.getsize(p) for p in paths))
+        self.assertEqual([s["path"] for s in reader.report()["files"]], paths)
+
+        # Serial reading gives the same texts
+        self.assertEqual(list(CorpusReader(workers=0).texts(paths)), texts)
+
+    def test_stopping_early_and_missing_files(self):
+        paths = [self.write(f"doc{i}.txt", b"x") for i in range(10)]
+        reader = CorpusReader(workers=2, read_ahead=2)
+        for _ in reader.texts(paths):
+            break
+        self.assertEqual(reader.summary()["files"], 1)
+        with self.assertRaises(FileNotFoundError):
+            list(CorpusReader(workers=2).texts([paths[0], os.path.join(self.tmp, "missing.txt")]))
+
+
+if __name__ == "__main__":
+    unittest.main()
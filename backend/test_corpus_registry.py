@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Unit tests for corpus id validation in the corpus registry.
+"""
+
+import os
+import sys
+import unittest
+import tempfile
+import shutil
+import zipfile
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from corpus_registry import CorpusRegistry
+
+
+class TestCorpusRegistry(unittest.TestCase):
+    """Test cases for rejecting ids that are not generated corpus ids."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='test_corpus_registry_')
+        self.registry = CorpusRegistry(Path(self.tmp) / "corpora")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_invalid_ids_never_become_paths(self):
+        for corpus_id in ("..", "../..", "", "0123456", "ABCDEF01", "0123abcd/..", "0123abcd\n"):
+            self.assertFalse(self.registry.exists(corpus_id))
+            self.assertFalse(self.registry.drop(corpus_id))
+            for accessor in (self.registry.corpus_dir, self.registry.index_path,
+                             self.registry.text_store_root, self.registry.get_engine,
+                             self.registry.manifest):
+                with self.assertRaises(KeyError):
+                    accessor(corpus_id)
+        self.assertTrue(os.path.isdir(self.tmp))
+        self.assertTrue(os.path.isdir(self.registry.root))
+        self.assertEqual(self.registry.corpus_dir("0123abcd"), self.registry.root / "0123abcd")
+
+    def test_register_indexes_every_file(self):
+        zip_path = os.path.join(self.tmp, "db.zip")
+        with zipfile.ZipFile(zip_path, "w") as z:
+            for i in range(60):
+                z.writestr(f"Romance/doc{i:02d}.txt", f"chapter {i} of a summer wedding story number{i}")
+            z.writestr("Sci-Fi/space.txt", "starships crossing the galactic empire")
+        manifest = self.registry.register(Path(zip_path), "big")
+        self.assertEqual(manifest["documents"], 61)
+        self.assertEqual(self.registry.get_engine(manifest["corpus_id"]).size, 61)
+
+
+if __name__ == "__main__":
+    unittest.main()
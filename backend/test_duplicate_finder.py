@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Unit tests for blocked all-pairs similarity and duplicate clustering.
+"""
+
+import os
+import sys
+import unittest
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from duplicate_finder import duplicate_clusters, similar_pairs
+
+
+class TestDuplicateFinder(unittest.TestCase):
+    """Test cases for similar_pairs and duplicate_clusters."""
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        words = [f"w{i}" for i in range(500)]
+        self.texts = [" ".join(rng.choice(words, 80)) for _ in range(30)]
+        self.texts[7] = self.texts[2]
+        self.texts[19] = self.texts[2] + " w1 w2"
+        self.texts[25] = self.texts[11]
+        self.X = TfidfVectorizer().fit_transform(self.texts)
+        self.metadata = [{"genre": "g", "display_name": f"doc{i}"} for i in range(len(self.texts))]
+
+    def test_blocked_pairs_match_full_matrix(self):
+        full = (self.X @ self.X.T).toarray()
+        expected = {(i, j) for i, j in zip(*np.nonzero(np.triu(full >= 0.3, k=1)))}
+        for block_size in (1, 4, 7, 100):
+            rows, cols, scores = similar_pairs(self.X, 0.3, block_size=block_size, workers=1)
+            self.assertEqual(set(zip(rows.tolist(), cols.tolist())), expected)
+            np.testing.assert_allclose(scores, full[rows, cols], rtol=1e-5)
+
+    def test_clusters_group_transitive_copies(self):
+        rows, cols, scores = similar_pairs(self.X, 0.9, block_size=8, workers=2)
+        clusters = duplicate_clusters(self.X.shape[0], rows, cols, scores, self.metadata)
+        members = [[m["doc_index"] for m in c["members"]] for c in clusters]
+        self.assertEqual(members, [[2, 7, 19], [11, 25]])
+        self.assertEqual(clusters[0]["members"][0]["display_name"], "doc2")
+        self.assertEqual(len(clusters[0]["pairs"]), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
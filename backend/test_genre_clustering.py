@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Unit tests for mini-batch genre clustering and cluster routing.
+"""
+
+import os
+import sys
+import unittest
+
+import numpy as np
+import scipy.sparse as sp
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from genre_clustering import cluster_engine
+from similarity_engine import ClusterRouter, SimilarityEngine
+
+
+class TestGenreClustering(unittest.TestCase):
+    """Test cases for cluster_engine and routed scoring."""
+
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        vocab = {g: [f"{g}{i}" for i in range(60)] for g in ("ghost", "love", "sword")}
+        texts, metadata = [], []
+        for genre in vocab:
+            for n in range(20):
+                # The first document of every folder is written in the next genre's vocabulary
+                source = genre if n else {"ghost": "love", "love": "sword", "sword": "ghost"}[genre]
+                texts.append(" ".join(rng.choice(vocab[source], 60)))
+                metadata.append({"genre": genre, "file_name": f"{genre}{n}.txt", "display_name": f"{genre} {n}"})
+        self.texts = texts
+        self.engine = SimilarityEngine().fit(texts, metadata)
+
+    def test_clusters_follow_vocabulary_and_flag_misfiled(self):
+        router, (summary, clusters, crosstab, assignments) = cluster_engine(self.engine, 3, svd_components=10, batch_size=16)
+        self.assertEqual(sorted(c["dominant_genre"] for c in clusters), ["ghost", "love", "sword"])
+        self.assertEqual(int(crosstab.values.sum()), 60)
+        misfiled = set(assignments.loc[~assignments["matches_folder_genre"], "file_name"])
+        self.assertEqual(misfiled, {"ghost0.txt", "love0.txt", "sword0.txt"})
+        self.assertTrue(all(term.startswith(clusters[0]["dominant_genre"]) for term in clusters[0]["top_terms"][:5]))
+
+    def test_routed_scoring_only_scores_probed_clusters(self):
+        router, _ = cluster_engine(self.engine, 3, batch_size=16)
+        self.engine.set_router(router)
+        full = self.engine.score(self.texts[5:6])
+        routed = self.engine.score(self.texts[5:6], n_probe=1)
+        self.assertEqual(routed.nnz, 20)  # sparse: only the probed cluster's documents
+        routed = routed.toarray()
+        self.assertEqual(int((routed > 0).sum()), 20)
+        self.assertEqual(int(routed.argmax()), int(full.argmax()))
+        np.testing.assert_allclose(routed[routed > 0], full[routed > 0])
+
+    def test_empty_clusters_are_skipped(self):
+        metadata = [dict(meta, folder_name="N/A", chapter_name=meta["display_name"], novel_title="N/A")
+                    for meta in self.engine.metadata]
+        for scoring in ("cosine", "bm25"):
+            engine = SimilarityEngine(scoring=scoring).fit(self.texts, metadata)
+            X = engine.transform(self.texts)
+            # Cluster 0 is the query itself but holds no documents
+            centroids = sp.vstack([X[5], sp.csr_matrix(X.mean(axis=0))])
+            engine.set_router(ClusterRouter(centroids, np.ones(len(self.texts))))
+            routed = engine.score(self.texts[5:6], n_probe=1)
+            self.assertEqual(routed.nnz, len(self.texts))
+            result = engine.query(self.texts[5:6], ["q.txt"], n_probe=1)
+            self.assertEqual(result.rows[0]["top_db_doc"], self.engine.labels[5])
+
+        # An input with no candidates at all still ranks (no top match, scored 0)
+        S = sp.csr_matrix(([0.5], ([0], [3])), shape=(2, len(self.texts)))
+        result = engine.rank(S, ["a.txt", "b.txt"])
+        self.assertEqual(result.rows[0]["top_similarity"], 0.5)
+        self.assertIsNone(result.rows[1]["top_db_doc"])
+        self.assertEqual(result.rows[1]["input_similarities"], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Unit tests for memory planning and blocked scoring.
+"""
+
+import os
+import sys
+import unittest
+import tempfile
+import shutil
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from memory_planner import (CorpusStats, MemoryBudgetExceeded, corpus_stats, plan_memory,
+                            require_fit)
+from similarity_engine import SimilarityEngine
+
+
+def stats(n_db: int, n_in: int = 5, doc_bytes: int = 20000) -> CorpusStats:
+    return CorpusStats(n_db=n_db, n_in=n_in, db_bytes=n_db * doc_bytes,
+                       in_bytes=n_in * doc_bytes, max_doc_bytes=doc_bytes)
+
+
+class TestMemoryPlanner(unittest.TestCase):
+    """Test cases for estimates, adjustments and refusal."""
+
+    def test_small_run_keeps_requested_settings(self):
+        plan = plan_memory(stats(50), budget_mb=2048, match_limit=20)
+        self.assertTrue(plan.fits)
+        self.assertEqual((plan.block_size, plan.match_limit, plan.heatmap), (0, 20, "annotated"))
+        self.assertEqual(plan.adjustments, [])
+        self.assertIn("fits", plan.explain())
+
+    def test_wide_heatmap_is_degraded_before_refusing(self):
+        # An annotated 40px-per-column heatmap over 3000 documents needs gigabytes
+        requested = plan_memory(stats(3000), budget_mb=1e6, match_limit=0)
+        self.assertGreater(requested.peak_bytes, 1024 ** 3)
+        plan = plan_memory(stats(3000), budget_mb=1024, match_limit=0, k_neighbors=3)
+        self.assertTrue(plan.fits)
+        self.assertNotEqual(plan.heatmap, "annotated")
+        self.assertTrue(plan.adjustments)
+        self.assertLess(plan.peak_bytes, requested.peak_bytes)
+
+    def test_refuses_when_nothing_fits(self):
+        plan = plan_memory(stats(200000, doc_bytes=50000), budget_mb=512)
+        self.assertFalse(plan.fits)
+        self.assertEqual(plan.heatmap, "none")
+        self.assertEqual(plan.match_limit, 3)
+        with self.assertRaises(MemoryBudgetExceeded) as refused:
+            require_fit(plan)
+        self.assertIn("exceeds the budget", str(refused.exception))
+
+    def test_corpus_stats_and_blocked_scoring(self):
+        tmp = tempfile.mkdtemp(prefix='test_memory_planner_')
+        try:
+            docs = {f"g{j % 2}/doc{j}.txt": f"story {j} about dragons and knights number {j}" for j in range(7)}
+            for rel, text in docs.items():
+                path = os.path.join(tmp, "db", rel)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(text)
+            os.makedirs(os.path.join(tmp, "in"))
+            s = corpus_stats(os.path.join(tmp, "db"), os.path.join(tmp, "in"))
+            self.assertEqual((s.n_db, s.n_in), (7, 0))
+            self.assertEqual(s.db_bytes, sum(len(t.encode()) for t in docs.values()))
+
+            engine = SimilarityEngine.from_database(os.path.join(tmp, "db"))
+            queries = ["dragons and knights", "story 3"]
+            np.testing.assert_allclose(engine.score(queries, preprocess=True, block_size=3),
+                                       engine.score(queries, preprocess=True))
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the top-k network export and layouts.
+"""
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from network_export import build_network, network_records, top_k_edges
+
+
+class TestNetworkExport(unittest.TestCase):
+    """Test cases for build_network and its layouts."""
+
+    def build(self, S, k, layout="auto"):
+        n_in, n_db = S.shape
+        return build_network(S, [f"in{i}" for i in range(n_in)], [f"Input {i}" for i in range(n_in)],
+                             [f"db{j}" for j in range(n_db)], [f"Doc {j}" for j in range(n_db)], k, layout)
+
+    def test_top_k_edges_best_first(self):
+        S = np.array([[0.1, 0.9, 0.5, 0.7], [0.3, 0.2, 0.8, 0.1]])
+        rows, cols, weights = top_k_edges(S, 2)
+        self.assertEqual(rows.tolist(), [0, 0, 1, 1])
+        self.assertEqual(cols.tolist(), [1, 3, 2, 0])
+        np.testing.assert_allclose(weights, [0.9, 0.7, 0.8, 0.3], rtol=1e-6)
+
+    def test_small_graph_uses_columns_and_only_matched_db_nodes(self):
+        S = np.array([[0.1, 0.9, 0.5, 0.7], [0.3, 0.2, 0.8, 0.1]])
+        network = self.build(S, 2)
+        self.assertEqual(network["layout"], "columns")
+        self.assertEqual(network["nodes"]["id"], ["in0", "in1", "db0", "db1", "db2", "db3"])
+        self.assertEqual(network["nodes"]["x"], [-1.0, -1.0, 1.0, 1.0, 1.0, 1.0])
+        records = network_records(network)
+        self.assertEqual(records["edges"][0], {"source": "in0", "target": "db1", "weight": 0.9})
+
+    def test_large_graph_layout_is_bounded(self):
+        S = np.random.default_rng(0).random((300, 900))
+        network = self.build(S, 3)
+        self.assertEqual(network["layout"], "spectral")
+        xy = np.array([network["nodes"]["x"], network["nodes"]["y"]])
+        self.assertTrue(np.all(np.abs(xy) <= 1.0))
+        self.assertEqual(len(network["edges"]["source"]), 900)
+        with self.assertRaises(ValueError):
+            self.build(S, 3, layout="circle")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Unit tests for per-stage profiling.
+"""
+
+import os
+import sys
+import json
+import unittest
+import tempfile
+import shutil
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from profiling import PROFILE_DIR, StageProfiler, profile_stage, profiled_call
+
+
+def staged_work(n: int) -> int:
+    profile_stage("1) Allocate")
+    blocks = [bytearray(1024) for _ in range(n)]
+    profile_stage("2) Sum")
+    return sum(len(b) for b in blocks)
+
+
+class TestProfiling(unittest.TestCase):
+    """Test cases for stage artifacts and the inactive no-op."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='test_profiling_')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_stages_without_profiler_are_noops(self):
+        self.assertEqual(staged_work(4), 4096)
+        self.assertFalse(os.path.exists(os.path.join(self.tmp, PROFILE_DIR)))
+
+    def test_profiled_call_writes_stage_artifacts(self):
+        result, summary = profiled_call(self.tmp, "analysis", staged_work, 200)
+        self.assertEqual(result, 200 * 1024)
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertEqual([s["stage"] for s in summary["stages"]], ["1) Allocate", "2) Sum"])
+        allocate = summary["stages"][0]
+        self.assertGreaterEqual(allocate["peak_allocated_bytes"], 200 * 1024)
+        self.assertTrue(any(f["function"].endswith("(staged_work)") or "listcomp" in f["function"]
+                            for f in allocate["top_functions"]))
+
+        profile_dir = os.path.join(self.tmp, PROFILE_DIR)
+        for stage in summary["stages"]:
+            self.assertTrue(os.path.exists(os.path.join(profile_dir, stage["profile_file"])))
+        with open(os.path.join(profile_dir, "analysis_summary.json"), encoding="utf-8") as f:
+            self.assertEqual(json.load(f)["stages"], summary["stages"])
+        self.assertIn("1) Allocate", StageProfiler.report_text(summary))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the on-disk analysis result cache.
+"""
+
+import os
+import sys
+import time
+import unittest
+import tempfile
+import shutil
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from result_cache import ResultCache, cache_key
+
+
+class TestResultCache(unittest.TestCase):
+    """Test cases for keys, hits, misses and eviction."""
+
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp(prefix='test_result_cache_'))
+        self.cache = ResultCache(self.tmp / "cache", max_bytes=10 * 1024)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def _session(self, session_id: str, payload: str = "a,b\n1,2\n") -> Path:
+        output_dir = self.tmp / f"session_{session_id}" / "output"
+        output_dir.mkdir(parents=True)
+        (output_dir / "comparison_table.csv").write_text(payload, encoding="utf-8")
+        return output_dir
+
+    def test_key_depends_on_inputs_corpus_and_parameters(self):
+        base = cache_key("zip", [("a.txt", "h1")], {"k_neighbors": 3})
+        self.assertEqual(base, cache_key("zip", [("a.txt", "h1")], {"k_neighbors": 3}))
+        self.assertNotEqual(base, cache_key("zip2", [("a.txt", "h1")], {"k_neighbors": 3}))
+        self.assertNotEqual(base, cache_key("zip", [("a.txt", "h2")], {"k_neighbors": 3}))
+        self.assertNotEqual(base, cache_key("zip", [("a.txt", "h1")], {"k_neighbors": 4}))
+
+    def test_hit_restores_files_for_the_new_session(self):
+        output_dir = self._session("old")
+        response = {"session_id": "old",
+                    "results": {"comparison_table": {"url": "/files/session_old/output/comparison_table.csv"}}}
+        self.assertIsNone(self.cache.get("k1", "new", self.tmp / "session_new" / "output"))
+        self.cache.put("k1", "old", output_dir, response)
+
+        new_output = self.tmp / "session_new" / "output"
+        hit = self.cache.get("k1", "new", new_output)
+        self.assertEqual(hit["session_id"], "new")
+        self.assertEqual(hit["results"]["comparison_table"]["url"], "/files/session_new/output/comparison_table.csv")
+        self.assertEqual((new_output / "comparison_table.csv").read_text(encoding="utf-8"), "a,b\n1,2\n")
+        self.assertEqual(self.cache.counts(), {"hits": 1, "misses": 1, "bypassed": 0})
+
+    def test_least_recently_used_entries_are_evicted(self):
+        for i in range(3):
+            self.cache.put(f"k{i}", f"s{i}", self._session(f"s{i}", "x" * 4000), {"session_id": f"s{i}"})
+            os.utime(self.cache.entry_dir(f"k{i}"), (time.time() - 100 + i, time.time() - 100 + i))
+            if i == 1:
+                # k0 is used again, so k1 becomes the oldest entry
+                self.assertIsNotNone(self.cache.get("k0", "t", self.tmp / "t" / "output"))
+        stats = self.cache.stats()
+        self.assertLessEqual(stats["disk_usage_bytes"], 10 * 1024)
+        self.assertTrue(self.cache.entry_dir("k0").exists())
+        self.assertFalse(self.cache.entry_dir("k1").exists())
+        self.assertTrue(self.cache.entry_dir("k2").exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
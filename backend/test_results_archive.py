@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the streamed results archive and Range parsing.
+"""
+
+import io
+import os
+import sys
+import unittest
+import tempfile
+import shutil
+import zipfile
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from results_archive import ResultsArchive, iter_zip_stream, parse_range
+
+
+class TestResultsArchive(unittest.TestCase):
+    """Test cases for archive streaming and caching."""
+
+    def setUp(self):
+        self.session_dir = Path(tempfile.mkdtemp(prefix='test_archive_'))
+        self.output_dir = self.session_dir / "output"
+        self.output_dir.mkdir()
+        (self.output_dir / "report.txt").write_text("รายงาน report\n" * 200, encoding="utf-8")
+        (self.output_dir / "heatmap.png").write_bytes(os.urandom(4096))
+
+    def tearDown(self):
+        shutil.rmtree(self.session_dir, ignore_errors=True)
+
+    def test_stream_is_valid_zip_with_per_type_compression(self):
+        data = b"".join(iter_zip_stream(sorted(self.output_dir.glob("*"))))
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            self.assertIsNone(zf.testzip())
+            methods = {info.filename: info.compress_type for info in zf.infolist()}
+        self.assertEqual(methods["report.txt"], zipfile.ZIP_DEFLATED)
+        self.assertEqual(methods["heatmap.png"], zipfile.ZIP_STORED)
+
+    def test_cache_matches_streamed_bytes(self):
+        archive = ResultsArchive(self.session_dir, self.output_dir)
+        self.assertIsNone(archive.cached())
+        streamed = b"".join(archive.stream())
+        self.assertEqual(archive.cached().read_bytes(), streamed)
+
+    def test_aborted_stream_leaves_no_cache(self):
+        archive = ResultsArchive(self.session_dir, self.output_dir)
+        stream = archive.stream()
+        next(stream)
+        stream.close()
+        self.assertIsNone(archive.cached())
+        self.assertEqual(list(self.session_dir.glob(".results-*")), [])
+
+    def test_parse_range(self):
+        self.assertEqual(parse_range("bytes=0-9", 100), (0, 9))
+        self.assertEqual(parse_range("bytes=90-", 100), (90, 99))
+        self.assertEqual(parse_range("bytes=-10", 100), (90, 99))
+        self.assertEqual(parse_range("bytes=50-500", 100), (50, 99))
+        self.assertIsNone(parse_range("bytes=100-", 100))
+        with self.assertRaises(ValueError):
+            parse_range("bytes=0-1,5-6", 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Unit tests for session folder expiry and quota eviction.
+"""
+
+import os
+import sys
+import time
+import unittest
+import tempfile
+import shutil
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from session_manager import SessionManager
+
+
+class TestSessionManager(unittest.TestCase):
+    """Test cases for SessionManager eviction policy."""
+
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp(prefix='test_sessions_'))
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def make_session(self, manager, size, age):
+        session_id = manager.create()
+        with open(manager.session_dir(session_id) / "data.bin", "wb") as f:
+            f.write(b"x" * size)
+        stamp = time.time() - age
+        os.utime(manager.session_dir(session_id), (stamp, stamp))
+        return session_id
+
+    def test_expired_sessions_are_removed(self):
+        manager = SessionManager(self.root, ttl_seconds=60, quota_bytes=10 ** 9)
+        old = self.make_session(manager, 10, age=120)
+        fresh = self.make_session(manager, 10, age=5)
+
+        self.assertEqual(manager.evict(), [old])
+        self.assertFalse(manager.exists(old))
+        self.assertTrue(manager.exists(fresh))
+
+    def test_quota_evicts_least_recently_used_first(self):
+        manager = SessionManager(self.root, ttl_seconds=3600, quota_bytes=250)
+        oldest = self.make_session(manager, 100, age=30)
+        middle = self.make_session(manager, 100, age=20)
+        newest = self.make_session(manager, 100, age=10)
+
+        self.assertEqual(manager.evict(), [oldest])
+        self.assertTrue(manager.exists(middle))
+        self.assertTrue(manager.exists(newest))
+
+    def test_sessions_in_use_are_never_evicted(self):
+        manager = SessionManager(self.root, ttl_seconds=60, quota_bytes=10 ** 9)
+        busy = self.make_session(manager, 10, age=120)
+        manager.acquire(busy)
+
+        self.assertEqual(manager.evict(), [])
+        self.assertEqual(manager.stats()["active_sessions"], 1)
+
+        manager.release(busy)
+        self.assertEqual(manager.stats()["active_sessions"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the reusable SimilarityEngine.
+"""
+
+import os
+import sys
+import unittest
+import tempfile
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from similarity_engine import SimilarityEngine
+from novel_similarity_pipeline import rerank_from_scores, save_match_scores
+
+
+class TestSimilarityEngine(unittest.TestCase):
+    """Test cases for fit/score/rank and persistence."""
+
+    def setUp(self):
+        self.db_root = tempfile.mkdtemp(prefix='test_engine_db_')
+        docs = {
+            "Romance/Pride_and_Prejudice/chapter01.txt": "a truth universally acknowledged that a single man must be in want of a wife",
+            "Romance/Pride_and_Prejudice/chapter02.txt": "mr bennet was among the earliest of those who waited on mr bingley",
+            "Sci-Fi/foundation.txt": "hari seldon and the psychohistory of the galactic empire",
+        }
+        for rel, text in docs.items():
+            path = os.path.join(self.db_root, rel)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(text)
+        self.engine = SimilarityEngine.from_database(self.db_root)
+
+    def tearDown(self):
+        shutil.rmtree(self.db_root, ignore_errors=True)
+
+    def test_rank_finds_best_match_and_genres(self):
+        S = self.engine.score(["A truth universally acknowledged: a single man wants a wife!"], preprocess=True)
+        self.assertEqual(S.shape, (1, 3))
+        result = self.engine.rank(S, ["input.txt"], k_neighbors=2, similar_threshold=0.3)
+        row = result.rows[0]
+        self.assertEqual(row["top_db_doc"], "chapter01.txt")
+        self.assertEqual(row["top_genre"], "Romance")
+        self.assertEqual(row["relation"], "similar")
+        self.assertEqual(len(result.edges), 2)
+        self.assertEqual(result.genre_rank_overall[0][0], "Romance")
+
+    def test_save_and_load_roundtrip(self):
+        path = os.path.join(self.db_root, "index.pkl")
+        self.engine.save(path)
+        loaded = SimilarityEngine.load(path)
+        texts = ["galactic empire psychohistory"]
+        np.testing.assert_allclose(loaded.score(texts), self.engine.score(texts))
+        self.assertEqual(loaded.labels, self.engine.labels)
+
+    def test_concurrent_queries(self):
+        texts = [["mr bingley"], ["galactic empire"], ["single man wife"]] * 10
+        expected = [self.engine.score(t) for t in texts]
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            results = list(pool.map(self.engine.score, texts))
+        for got, want in zip(results, expected):
+            np.testing.assert_allclose(got, want)
+
+    def test_novel_then_chapter_retrieval(self):
+        novels = self.engine.novels
+        self.assertEqual([(n["novel_title"], n["chapters"]) for n in novels],
+                         [("Pride and Prejudice", 2), ("foundation", 1)])
+        texts = ["mr bennet waited on mr bingley"]
+        S, novel_S = self.engine.score_novels(texts, n_novels=1)
+        self.assertEqual(novel_S.shape, (1, 2))
+        self.assertEqual(S.indices.tolist(), [0, 1])  # sparse: only the selected novel's chapters
+        self.assertEqual(S[0, 2], 0.0)  # chapter of a novel that was not selected
+        np.testing.assert_allclose(S[0, :2].toarray()[0], self.engine.score(texts)[0, :2])
+        ranking = self.engine.novel_ranking(S, novel_S, n_novels=1, chapters_per_novel=1)
+        self.assertEqual(ranking[0][0]["novel_title"], "Pride and Prejudice")
+        self.assertEqual(ranking[0][0]["top_chapters"][0]["database_file"], "chapter02.txt")
+
+        # Ranking the candidates matches ranking the dense scores, restricted to them
+        result = self.engine.rank(S, ["q.txt"], k_neighbors=2, match_limit=None)
+        dense = self.engine.rank(S.toarray(), ["q.txt"], k_neighbors=2, match_limit=None)
+        self.assertEqual(result.rows[0]["input_similarities"], dense.rows[0]["input_similarities"][:2])
+        self.assertEqual(result.edges, dense.edges)
+        self.assertEqual(result.db_overall_rank, dense.db_overall_rank[:2])
+        self.assertEqual(result.rows[0]["genre_rank_json"], dense.rows[0]["genre_rank_json"])
+        self.assertEqual(result.genre_rank_overall, dense.genre_rank_overall)
+
+    def test_rerank_from_stored_scores(self):
+        texts = ["a truth universally acknowledged that a single man must want a wife", "galactic empire"]
+        S = self.engine.score(texts, preprocess=True)
+        save_match_scores(self.db_root, S, ["a.txt", "b.txt"], self.engine.metadata)
+        path = os.path.join(self.db_root, "match_scores.npz")
+        for dup, sim, k in [(0.9, 0.6, 3), (0.5, 0.2, 1)]:
+            expected = self.engine.rank(S, ["a.txt", "b.txt"], k, dup, sim)
+            got = rerank_from_scores(path, k, dup, sim)
+            self.assertEqual([r["relation"] for r in got.rows], [r["relation"] for r in expected.rows])
+            self.assertEqual(len(got.edges), len(expected.edges))
+            self.assertEqual(got.network()["edges"]["target"], expected.network()["edges"]["target"])
+        with self.assertRaises(RuntimeError):
+            SimilarityEngine.for_scores(self.engine.metadata).score(["text"])
+
+    def test_rerank_keeps_scoring_method(self):
+        bm25 = SimilarityEngine.from_database(self.db_root, scoring="bm25")
+        texts = ["mr bingley", "galactic empire"]
+        save_match_scores(self.db_root, bm25.score(texts), ["a.txt", "b.txt"], bm25.metadata, bm25.scoring_info)
+        got = rerank_from_scores(os.path.join(self.db_root, "match_scores.npz"), 2, 0.5, 0.2)
+        self.assertEqual(got.scoring, bm25.scoring_info)
+        self.assertEqual(got.scoring["method"], "bm25")
+        self.assertEqual(got.overall_ranking()["analysis_info"]["scoring"], bm25.scoring_info)
+
+    def test_unfitted_engine_raises(self):
+        with self.assertRaises(RuntimeError):
+            SimilarityEngine().score(["text"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the memory-mapped corpus text store.
+"""
+
+import os
+import sys
+import unittest
+import tempfile
+import shutil
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from text_store import TextStore, TextStoreWriter, build_text_store
+from similarity_engine import SimilarityEngine
+
+
+class TestTextStore(unittest.TestCase):
+    """Test cases for writing, slicing and indexing from a text store."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='test_text_store_')
+        self.db_root = os.path.join(self.tmp, 'db')
+        docs = {
+            "Romance/Pride_and_Prejudice/chapter01.txt": "A truth universally acknowledged: a single man must be in want of a wife.",
+            "Romance/Pride_and_Prejudice/chapter02.txt": "Mr. Bennet was among the earliest of those who waited on Mr. Bingley.",
+            "Fantasy/เจ้าหญิง.txt": "กาลครั้งหนึ่งนานมาแล้ว มีเจ้าหญิงองค์หนึ่งอาศัยอยู่ในปราสาท",
+        }
+        for rel, text in docs.items():
+            path = os.path.join(self.db_root, rel)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(text)
+        self.store = build_text_store(self.db_root, os.path.join(self.tmp, 'store'))
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_roundtrip_and_zero_copy_slices(self):
+        self.assertEqual(len(self.store), 3)
+        self.assertEqual(self.store.metadata[0]["genre"], "Fantasy")
+        self.assertEqual(self.store.text(0), "กาลครั้งหนึ่งนานมาแล้ว มีเจ้าหญิงองค์หนึ่งอาศัยอยู่ในปราสาท")
+        raw = self.store.raw(2)
+        self.assertIsInstance(raw, memoryview)
+        self.assertEqual(bytes(raw).decode("utf-8"), self.store.text(2))
+        with self.assertRaises(IndexError):
+            self.store.raw(3)
+
+    def test_passages_do_not_split_characters(self):
+        passage = self.store.passage(2, ["bingley"], max_bytes=24)
+        self.assertTrue(passage["matched"])
+        self.assertIn("Bingley", passage["text"])
+        # A window starting inside a 3-byte Thai character drops the fragment
+        self.assertEqual(self.store.snippet(0, start=1, max_bytes=9), "าล")
+        self.assertFalse(self.store.passage(0, ["dragon"])["matched"])
+
+    def test_engine_fits_from_store_like_from_database(self):
+        engine = SimilarityEngine.from_text_store(self.store)
+        reference = SimilarityEngine.from_database(self.db_root)
+        self.assertEqual(engine.labels, reference.labels)
+        texts = ["a single man in want of a wife"]
+        np.testing.assert_allclose(engine.score(texts, preprocess=True), reference.score(texts, preprocess=True))
+
+    def test_empty_documents(self):
+        root = os.path.join(self.tmp, 'empty')
+        with TextStoreWriter(root) as writer:
+            writer.add("", {"genre": "g"})
+        with TextStore(root) as store:
+            self.assertEqual(store.text(0), "")
+            self.assertEqual(store.passage(0, ["x"])["text"], "")
+
+
+if __name__ == "__main__":
+    unittest.main()
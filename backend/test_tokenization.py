@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the enhanced pipeline's tokenization modes.
+"""
+
+import os
+import sys
+import unittest
+from functools import partial
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import enhanced_pipeline
+from enhanced_pipeline import enhanced_preprocess, make_enhanced_vectorizer, resolve_tokenization
+from similarity_engine import SimilarityEngine
+
+
+class TestTokenization(unittest.TestCase):
+    """Test cases for mode selection and character n-gram ranking."""
+
+    def test_resolve_tokenization(self):
+        with mock.patch.object(enhanced_pipeline, "THAI_SUPPORT", False):
+            self.assertEqual(resolve_tokenization("thai"), "char_ngrams")
+        with mock.patch.object(enhanced_pipeline, "THAI_SUPPORT", True):
+            self.assertEqual(resolve_tokenization("thai"), "words")
+        self.assertEqual(resolve_tokenization("other"), "words")
+        self.assertEqual(resolve_tokenization("thai", "char_ngrams"), "char_ngrams")
+        with self.assertRaises(ValueError):
+            resolve_tokenization("thai", "bytes")
+
+    def test_char_ngrams_rank_unsegmented_thai(self):
+        # No spaces inside sentences, so whole-token matching finds nothing in common
+        docs = [
+            "เจ้าหญิงอาศัยอยู่ในปราสาทบนภูเขาสูง",
+            "นักผจญภัยเดินทางเข้าป่าลึกเพื่อตามหาสมบัติ",
+            "บ้านร้างหลังนั้นมีเสียงประหลาดตอนเที่ยงคืน",
+        ]
+        engine = SimilarityEngine(
+            vectorizer_factory=partial(make_enhanced_vectorizer, "thai", "char_ngrams"),
+            preprocess=partial(enhanced_preprocess, language="thai", tokenization="char_ngrams"),
+        )
+        engine.fit((engine.preprocess(d) for d in docs), [{"genre": g} for g in ("fantasy", "adventure", "horror")])
+        S = engine.score(["นักผจญภัยตามหาสมบัติในป่า", "เสียงประหลาดในบ้านร้าง"], preprocess=True)
+        self.assertEqual(list(S.argmax(axis=1)), [1, 2])
+        self.assertEqual(enhanced_preprocess("สวัสดี, ครับ!", "thai", "char_ngrams"), "สวัสดี ครับ")
+
+
+if __name__ == "__main__":
+    unittest.main()
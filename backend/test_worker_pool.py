@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the pipeline process pool.
+"""
+
+import os
+import sys
+import asyncio
+import unittest
+import tempfile
+import shutil
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from novel_similarity_pipeline import compute_similarity, load_inputs
+from worker_pool import PipelineWorkerPool, fit_index_job, rank_job, score_input_job
+
+
+class TestPipelineWorkerPool(unittest.TestCase):
+    """Test cases for process/thread execution and recycling."""
+
+    def test_thread_mode_runs_in_process(self):
+        pool = PipelineWorkerPool(workers=0)
+        self.assertEqual(asyncio.run(pool.run(os.getpid)), os.getpid())
+        self.assertEqual(pool.stats()["mode"], "threads")
+
+    def test_process_mode_recycles_over_memory_limit(self):
+        async def scenario():
+            pool = PipelineWorkerPool(workers=1, memory_limit_mb=1)
+            try:
+                first = await pool.run(os.getpid)
+                second = await pool.run(os.getpid)
+                return first, second, pool.stats()
+            finally:
+                pool.shutdown()
+
+        first, second, stats = asyncio.run(scenario())
+        self.assertNotEqual(first, os.getpid())
+        self.assertNotEqual(first, second)  # every job exceeded 1 MB, so the worker was replaced
+        self.assertEqual(stats["recycled"], 2)
+        self.assertEqual(stats["completed_jobs"], 2)
+
+    def test_streamed_jobs_match_a_whole_run(self):
+        tmp = tempfile.mkdtemp(prefix='test_worker_pool_')
+        try:
+            docs = {f"db/g{j % 2}/doc{j}.txt": f"story {j} about dragons and knights number {j}" for j in range(6)}
+            docs.update({"in/a.txt": "dragons and knights", "in/b.txt": "story 4 number 4"})
+            for rel, text in docs.items():
+                path = os.path.join(tmp, rel)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(text)
+            db_root, input_root = os.path.join(tmp, "db"), os.path.join(tmp, "in")
+            index_path = os.path.join(tmp, "index.pkl")
+
+            self.assertEqual(fit_index_job(db_root, index_path), 6)
+            texts, names = load_inputs(input_root)
+            scored = [score_input_job(index_path, text, name, k_neighbors=2) for text, name in zip(texts, names)]
+            streamed = rank_job(index_path, np.vstack([s["scores"] for s in scored]), names, k_neighbors=2)
+            whole = compute_similarity(db_root, input_root, k_neighbors=2)
+
+            np.testing.assert_allclose(streamed.S, whole.S)
+            self.assertEqual([s["row"] for s in scored], whole.rows)
+            self.assertEqual([s["analysis"] for s in scored], whole.overall_ranking()["analysis_by_input"])
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,231 @@
+"""
+Memory-mapped corpus text store
+
+Database documents are written once, at indexing time, into a single
+directory:
+
+    <store>/texts.bin      every document's UTF-8 text, concatenated
+    <store>/offsets.npy    int64 byte offsets, N + 1 entries (doc i is
+                           texts.bin[offsets[i]:offsets[i + 1]])
+    <store>/metadata.json  one metadata dict per document (load_database order)
+
+``TextStore`` maps ``texts.bin`` read-only and hands out ``memoryview``
+slices of the mapping, so reading a document copies nothing until it is
+decoded, and the pages belong to the OS page cache: resident memory does not
+grow with the corpus, and every process that opens the same store shares
+them. Vectorisation streams documents one at a time (``iter_texts``), and
+passages/snippets are located in the mapped bytes before decoding only the
+window that is shown.
+
+Usage:
+    python text_store.py --db ./db --out ./db_store
+"""
+
+import os
+import json
+import mmap
+import argparse
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from corpus_reader import CorpusReader
+from novel_similarity_pipeline import iter_database
+
+TEXTS_FILE = "texts.bin"
+OFFSETS_FILE = "offsets.npy"
+METADATA_FILE = "metadata.json"
+DEFAULT_SNIPPET_BYTES = 600
+
+# ---------------------------
+# Writing
+# ---------------------------
+
+class TextStoreWriter:
+    """
+    Append documents to a new store; offsets and metadata are written on close
+
+    Only the current document is held in memory.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._file = open(os.path.join(root, TEXTS_FILE), "wb")
+        self._offsets: List[int] = [0]
+        self._metadata: List[Dict] = []
+
+    def add(self, text: str, meta: Dict) -> int:
+        """Append one document; returns its index"""
+        data = text.encode("utf-8")
+        self._file.write(data)
+        self._offsets.append(self._offsets[-1] + len(data))
+        self._metadata.append(meta)
+        return len(self._metadata) - 1
+
+    def __len__(self) -> int:
+        return len(self._metadata)
+
+    def close(self) -> None:
+        if self._file.closed:
+            return
+        self._file.close()
+        np.save(os.path.join(self.root, OFFSETS_FILE), np.asarray(self._offsets, dtype=np.int64))
+        with open(os.path.join(self.root, METADATA_FILE), "w", encoding="utf-8") as f:
+            json.dump(self._metadata, f, ensure_ascii=False)
+
+    def __enter__(self) -> "TextStoreWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+def build_text_store(db_root: str, store_root: str, max_files_per_genre: Optional[int] = 50,
+                     reader: Optional[CorpusReader] = None) -> "TextStore":
+    """
+    Write every database file (same selection as ``load_database``) into a store
+
+    Files are read ahead on a small thread pool (see corpus_reader.py) and
+    stored in order as decoded, before preprocessing, so snippets show the
+    original text. Pass ``reader`` to keep its decode statistics.
+    """
+    reader = reader or CorpusReader()
+    with TextStoreWriter(store_root) as writer:
+        files = list(iter_database(db_root, max_files_per_genre))
+        for (path, file_info), text in zip(files, reader.texts(path for path, _ in files)):
+            writer.add(text, file_info)
+        if not len(writer):
+            raise SystemExit("No .txt files found in the database.")
+    reader.print_summary()
+    return TextStore(store_root)
+
+# ---------------------------
+# Reading
+# ---------------------------
+
+class TextStore:
+    """
+    Read-only view of a store written by ``TextStoreWriter``
+
+    Args:
+        root: Store directory
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.offsets = np.load(os.path.join(root, OFFSETS_FILE), mmap_mode="r")
+        with open(os.path.join(root, METADATA_FILE), "r", encoding="utf-8") as f:
+            self.metadata: List[Dict] = json.load(f)
+        if len(self.offsets) != len(self.metadata) + 1:
+            raise ValueError(f"Corrupt text store (offsets and metadata disagree): {root}")
+        self._file = open(os.path.join(root, TEXTS_FILE), "rb")
+        size = int(self.offsets[-1])
+        # mmap cannot map an empty file
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        self._view = memoryview(self._mmap) if self._mmap is not None else memoryview(b"")
+
+    @classmethod
+    def exists(cls, root: str) -> bool:
+        return all(os.path.exists(os.path.join(root, name)) for name in (TEXTS_FILE, OFFSETS_FILE, METADATA_FILE))
+
+    def __len__(self) -> int:
+        return len(self.metadata)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.offsets[-1])
+
+    def _bounds(self, i: int) -> Tuple[int, int]:
+        if not 0 <= i < len(self.metadata):
+            raise IndexError(f"Document index out of range: {i}")
+        return int(self.offsets[i]), int(self.offsets[i + 1])
+
+    def raw(self, i: int) -> memoryview:
+        """UTF-8 bytes of document ``i`` as a zero-copy slice of the mapping"""
+        start, stop = self._bounds(i)
+        return self._view[start:stop]
+
+    def text(self, i: int) -> str:
+        return str(self.raw(i), "utf-8")
+
+    def __getitem__(self, i: int) -> str:
+        return self.text(i)
+
+    def iter_texts(self, indices: Optional[Iterable[int]] = None) -> Iterator[str]:
+        """Decode documents one at a time (e.g. to stream into ``fit_transform``)"""
+        for i in (range(len(self)) if indices is None else indices):
+            yield self.text(i)
+
+    def snippet(self, i: int, start: int = 0, max_bytes: int = DEFAULT_SNIPPET_BYTES) -> str:
+        """
+        Up to ``max_bytes`` of document ``i`` from byte offset ``start``
+
+        Multi-byte characters cut at either edge are dropped rather than
+        decoded as garbage.
+        """
+        doc_start, doc_stop = self._bounds(i)
+        lo = min(doc_start + max(start, 0), doc_stop)
+        hi = min(lo + max(max_bytes, 0), doc_stop)
+        # Skip UTF-8 continuation bytes (0b10xxxxxx) at the start of the window
+        while lo < hi and (self._view[lo] & 0xC0) == 0x80:
+            lo += 1
+        return str(self._view[lo:hi], "utf-8", errors="ignore").strip()
+
+    def find(self, i: int, terms: Sequence[str]) -> int:
+        """Byte offset (within document ``i``) of the earliest of ``terms``, or -1"""
+        if self._mmap is None:
+            return -1
+        doc_start, doc_stop = self._bounds(i)
+        hits = []
+        for term in terms:
+            for variant in {term, term.lower(), term.capitalize()}:
+                if variant:
+                    pos = self._mmap.find(variant.encode("utf-8"), doc_start, doc_stop)
+                    if pos >= 0:
+                        hits.append(pos)
+        return min(hits) - doc_start if hits else -1
+
+    def passage(self, i: int, terms: Sequence[str] = (), max_bytes: int = DEFAULT_SNIPPET_BYTES) -> Dict:
+        """
+        Snippet of document ``i`` around the first query term it contains
+        (the opening of the document when none occurs)
+
+        Returns: {"offset": byte offset of the window, "matched": bool, "text": str}
+        """
+        pos = self.find(i, terms) if terms else -1
+        start = max(pos - max_bytes // 3, 0) if pos >= 0 else 0
+        return {"offset": start, "matched": pos >= 0, "text": self.snippet(i, start, max_bytes)}
+
+    def close(self) -> None:
+        try:
+            self._view.release()
+            if self._mmap is not None:
+                self._mmap.close()
+        except BufferError:
+            pass  # slices from raw() are still alive; the mapping goes when they do
+        self._file.close()
+
+    def __enter__(self) -> "TextStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+# ---------------------------
+# CLI
+# ---------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a database folder into a memory-mapped text store.")
+    parser.add_argument("--db", required=True, help="Database root folder (expects ./db/<genre>/*.txt).")
+    parser.add_argument("--out", required=True, help="Store directory.")
+    parser.add_argument("--max_files_per_genre", type=int, default=50,
+                        help="Files per genre (0 = all files).")
+    args = parser.parse_args()
+
+    store = build_text_store(args.db, args.out, args.max_files_per_genre or None)
+    print(f"✅ Stored {len(store)} documents ({store.nbytes / 1024 / 1024:.1f} MB) in {args.out}")
+    store.close()
+
+if __name__ == "__main__":
+    main()
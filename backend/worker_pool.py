@@ -0,0 +1,247 @@
+"""
+Process pool for CPU-bound pipeline work in the API server
+
+Tokenisation, pandas and matplotlib hold the GIL, so running analyses on
+threads gives concurrent requests almost nothing from extra cores. The
+PipelineWorkerPool runs them in worker processes instead:
+
+    - a semaphore bounds the number of jobs submitted at once; further
+      requests wait for a slot
+    - every worker imports the pipeline modules (and Thai NLP when it is
+      installed) once, and keeps a small LRU cache of loaded corpus indexes
+      keyed by path and modification time
+    - each job reports the worker's resident memory; once a worker exceeds
+      the memory limit the pool is recycled gracefully: new jobs go to a
+      fresh set of workers while the old ones finish what they are running
+    - workers are also replaced after a fixed number of tasks
+
+With ``workers=0`` jobs run on threads in the server process, as before.
+"""
+
+import os
+import asyncio
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+DEFAULT_ENGINE_CACHE_SIZE = 4
+
+# ---------------------------
+# Worker process state
+# ---------------------------
+
+_engine_cache: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+_engine_cache_size = DEFAULT_ENGINE_CACHE_SIZE
+
+def _init_worker(engine_cache_size: int) -> None:
+    """Warm up a worker: import the pipeline and NLP state once per process"""
+    global _engine_cache_size
+    _engine_cache_size = engine_cache_size
+    import novel_similarity_pipeline  # noqa: F401  (numpy, sklearn, pandas, matplotlib)
+    import similarity_engine  # noqa: F401
+    try:
+        from pythainlp.tokenize import word_tokenize
+        word_tokenize("อุ่นเครื่อง")  # loads the dictionary trie
+    except ImportError:
+        pass
+
+def rss_bytes() -> int:
+    """Resident memory of the current process"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        # ru_maxrss is the peak, in KiB on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+def cached_engine(index_path: str):
+    """Load a saved SimilarityEngine once per worker (reloaded when the file changes)"""
+    from similarity_engine import SimilarityEngine
+    mtime = os.path.getmtime(index_path)
+    hit = _engine_cache.get(index_path)
+    if hit is not None and hit[0] == mtime:
+        _engine_cache.move_to_end(index_path)
+        return hit[1]
+    return _cache_engine(index_path, mtime, SimilarityEngine.load(index_path))
+
+def _cache_engine(index_path: str, mtime: float, engine):
+    _engine_cache[index_path] = (mtime, engine)
+    _engine_cache.move_to_end(index_path)
+    while len(_engine_cache) > _engine_cache_size:
+        _engine_cache.popitem(last=False)
+    return engine
+
+def _run_task(fn: Callable, args: tuple, kwargs: dict) -> Tuple[Any, int]:
+    return fn(*args, **kwargs), rss_bytes()
+
+# ---------------------------
+# Jobs
+# ---------------------------
+
+def run_query(engine, texts: List[str], names: List[str], n_probe: int = 0, n_novels: int = 0,
+              **rank_kwargs) -> Dict[str, Any]:
+    """
+    Score and rank inputs against a corpus
+
+    Returns: result (SimilarityResult), novel_ranking (two-stage mode only)
+    and the n_probe / n_novels actually applied
+    """
+    novel_ranking = None
+    n_novels = max(n_novels, 0)
+    if n_novels:
+        n_probe = 0
+        S, novel_S = engine.score_novels(texts, n_novels, preprocess=True)
+        novel_ranking = engine.novel_ranking(S, novel_S, n_novels)
+    else:
+        n_probe = n_probe if engine.router is not None else 0
+        S = engine.score(texts, preprocess=True, n_probe=n_probe)
+    return {
+        "result": engine.rank(S, names, **rank_kwargs),
+        "novel_ranking": novel_ranking,
+        "n_probe": n_probe,
+        "n_novels": n_novels
+    }
+
+def query_job(index_path: str, texts: List[str], names: List[str], **kwargs):
+    """``run_query`` against the worker's cached copy of a saved index"""
+    return run_query(cached_engine(index_path), texts, names, **kwargs)
+
+# Streamed analyses (/api/analyze with stream=true) run as one job per step,
+# so each input's result can be sent as soon as its job finishes
+
+def fit_index_job(db_root: str, index_path: str, scoring: str = "cosine") -> int:
+    """Fit a corpus index on ``db_root`` and save it for the jobs below"""
+    from similarity_engine import SimilarityEngine
+    engine = SimilarityEngine.from_database(db_root, scoring=scoring)
+    engine.save(index_path)
+    _cache_engine(index_path, os.path.getmtime(index_path), engine)
+    return engine.size
+
+def score_input_job(index_path: str, text: str, name: str, block_size: int = 0, **rank_kwargs) -> Dict[str, Any]:
+    """
+    Score and rank one preprocessed input
+
+    Returns: scores (the input's row of the similarity matrix), row (its
+    comparison table row) and analysis (its analysis_by_input entry)
+    """
+    engine = cached_engine(index_path)
+    S = engine.score([text], block_size=block_size)
+    result = engine.rank(S, [name], **rank_kwargs)
+    return {"scores": S[0], "row": result.rows[0], "analysis": result.overall_ranking()["analysis_by_input"][0]}
+
+def rank_job(index_path: str, S, names: List[str], **rank_kwargs):
+    """Overall rankings over the collected score rows (a SimilarityResult)"""
+    return cached_engine(index_path).rank(S, names, **rank_kwargs)
+
+# ---------------------------
+# Pool
+# ---------------------------
+
+class PipelineWorkerPool:
+    """
+    Bounded process pool with memory-based recycling
+
+    Args:
+        workers: Worker processes (0 = run jobs on threads in this process)
+        max_jobs: Jobs running or queued in the pool at once (default: workers)
+        memory_limit_mb: Recycle the pool once a worker's RSS exceeds this
+        max_tasks_per_worker: Replace each worker after this many jobs
+        engine_cache_size: Corpus indexes kept loaded per worker
+    """
+
+    def __init__(self, workers: int, max_jobs: Optional[int] = None,
+                 memory_limit_mb: Optional[float] = None,
+                 max_tasks_per_worker: Optional[int] = None,
+                 engine_cache_size: int = DEFAULT_ENGINE_CACHE_SIZE):
+        self.workers = max(0, workers)
+        self.max_jobs = max(1, max_jobs or self.workers or 1)
+        self.memory_limit = int(memory_limit_mb * 1024 * 1024) if memory_limit_mb else None
+        self.max_tasks_per_worker = max_tasks_per_worker or None
+        self.engine_cache_size = engine_cache_size
+        self._lock = threading.Lock()
+        self._semaphore = asyncio.Semaphore(self.max_jobs)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._generation = 0
+        self._active = 0
+        self._completed = 0
+        self._recycled = 0
+        self._peak_worker_rss = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        # spawn: forking a server process that runs threads is unsafe
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.engine_cache_size,),
+            max_tasks_per_child=self.max_tasks_per_worker
+        )
+
+    def _current(self) -> Tuple[ProcessPoolExecutor, int]:
+        with self._lock:
+            if self._executor is None:
+                self._executor = self._new_executor()
+            return self._executor, self._generation
+
+    def recycle(self, generation: Optional[int] = None) -> None:
+        """Send new jobs to fresh workers; the old ones exit after their current jobs"""
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return  # already recycled
+            old, self._executor = self._executor, None
+            self._generation += 1
+            self._recycled += 1
+        if old is not None:
+            print(f"♻️  Recycling pipeline workers (generation {self._generation})")
+            old.shutdown(wait=False)
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run ``fn(*args, **kwargs)`` in a worker (or a thread when disabled)"""
+        async with self._semaphore:
+            self._active += 1
+            try:
+                if not self.enabled:
+                    result = await asyncio.to_thread(fn, *args, **kwargs)
+                    self._completed += 1
+                    return result
+                executor, generation = self._current()
+                try:
+                    result, rss = await asyncio.wrap_future(executor.submit(_run_task, fn, args, kwargs))
+                except BrokenProcessPool:
+                    # A worker died (e.g. killed for memory); start over with a fresh pool
+                    self.recycle(generation)
+                    raise RuntimeError("Pipeline worker process terminated unexpectedly")
+                self._peak_worker_rss = max(self._peak_worker_rss, rss)
+                if self.memory_limit and rss > self.memory_limit:
+                    self.recycle(generation)
+                self._completed += 1
+                return result
+            finally:
+                self._active -= 1
+
+    def stats(self) -> Dict:
+        return {
+            "mode": "processes" if self.enabled else "threads",
+            "workers": self.workers,
+            "max_jobs": self.max_jobs,
+            "active_jobs": self._active,
+            "completed_jobs": self._completed,
+            "recycled": self._recycled,
+            "memory_limit_bytes": self.memory_limit,
+            "peak_worker_rss_bytes": self._peak_worker_rss,
+        }
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
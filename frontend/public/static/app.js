@@ -99,6 +99,7 @@ class NovelSimilarityAnalyzer {
 
     this.currentSessionId = null;
     this.currentResults = null;
+    this.lastAnalysis = null; // { signature, data } of the last full analysis
     this.currentFiles = null;
     this.folderFiles = null;
     this.maxInputFiles = 5;
@@ -523,6 +524,15 @@ class NovelSimilarityAnalyzer {
         formData.append('novel_names', novelNames);
       }
       
+      // Same inputs and database as the last analysis: only k / thresholds
+      // changed, so re-rank the stored scores instead of re-running everything
+      const signature = this.analysisSignature(filesToUpload, databaseFile, textInput, novelNames);
+      if (this.currentSessionId && this.lastAnalysis && this.lastAnalysis.signature === signature) {
+        if (await this.reclassifyCurrentSession()) {
+          return;
+        }
+      }
+      
       // Add parameters
       formData.append('k_neighbors', document.getElementById('kNeighbors').value);
       formData.append('dup_threshold', document.getElementById('dupThreshold').value);
@@ -552,6 +562,7 @@ class NovelSimilarityAnalyzer {
       
       if (response.data.status === 'success') {
         this.currentSessionId = response.data.session_id;
+        this.lastAnalysis = { signature, data: response.data };
         this.updateLoadingStatus('การวิเคราะห์เสร็จสิ้น กำลังแสดงผลลัพธ์...');
         this.updateProgress(100, 'เสร็จสิ้น');
         
@@ -611,6 +622,45 @@ class NovelSimilarityAnalyzer {
     }
   }
 
+  analysisSignature(files, databaseFile, textInput, novelNames) {
+    // Identifies the uploaded content; parameters are deliberately left out
+    const describe = (file) => file ? [file.name, file.size, file.lastModified, file.webkitRelativePath || ''] : null;
+    return JSON.stringify({
+      files: Array.from(files || []).map(describe),
+      database: describe(databaseFile),
+      text: textInput,
+      names: novelNames
+    });
+  }
+
+  async reclassifyCurrentSession() {
+    const formData = new FormData();
+    formData.append('k_neighbors', document.getElementById('kNeighbors').value);
+    formData.append('dup_threshold', document.getElementById('dupThreshold').value);
+    formData.append('similar_threshold', document.getElementById('similarThreshold').value);
+    
+    const _apiBase = this.apiBaseUrl || (typeof window !== 'undefined' && window.apiBaseUrl) || 'http://localhost:8000';
+    try {
+      this.updateLoadingStatus('กำลังจัดอันดับใหม่จากคะแนนเดิม...');
+      const response = await axios.post(`${_apiBase}/api/reclassify/${this.currentSessionId}`, formData);
+      if (response.data.status !== 'success') {
+        return false;
+      }
+      const previous = this.lastAnalysis.data;
+      this.updateProgress(100, 'เสร็จสิ้น');
+      this.displayResults({
+        ...previous,
+        parameters: { ...previous.parameters, ...response.data.parameters },
+        results: response.data.results
+      });
+      return true;
+    } catch (error) {
+      // Session expired or scores missing: fall back to a full analysis
+      console.warn('Reclassify failed, running a full analysis:', error);
+      return false;
+    }
+  }
+
   validateForm() {
     // Use this.currentFiles if available (handles folder uploads)
     const filesToValidate = this.currentFiles || (document.getElementById('inputFiles') ? document.getElementById('inputFiles').files : []);
@@ -1426,10 +1476,12 @@ class NovelSimilarityAnalyzer {
 
     // Position Input Nodes
     const inputYStep = inputNodes.length > 1 ? 4 / (inputNodes.length - 1) : 0; // Spread Y from -2 to 2
+    // Positions precomputed by the backend (x, y in [-1, 1]) take precedence
+    const hasLayout = nodes.every(node => typeof node.x === 'number' && typeof node.y === 'number');
     inputNodes.forEach((node, i) => {
       const yPos = inputNodes.length === 1 ? 0 : -2 + i * inputYStep;
-      xCoords[node.id] = -5;  // Left side
-      yCoords[node.id] = yPos;
+      xCoords[node.id] = hasLayout ? node.x * 5 : -5;  // Left side
+      yCoords[node.id] = hasLayout ? node.y * 2 : yPos;
       nodeLookup[node.id] = node;
     });
 
@@ -1437,8 +1489,8 @@ class NovelSimilarityAnalyzer {
     const dbYStep = dbNodes.length > 1 ? 4 / (dbNodes.length - 1) : 0; // Spread Y from -2 to 2
     dbNodes.forEach((node, i) => {
        const yPos = dbNodes.length === 1 ? 0 : -2 + i * dbYStep;
-      xCoords[node.id] = 5;   // Right side
-      yCoords[node.id] = yPos;
+      xCoords[node.id] = hasLayout ? node.x * 5 : 5;   // Right side
+      yCoords[node.id] = hasLayout ? node.y * 2 : yPos;
       nodeLookup[node.id] = node;
     });
 
@@ -1453,8 +1505,8 @@ class NovelSimilarityAnalyzer {
         const targetNode = nodeLookup[edge.target]; // Get full node object
         
         if (sourceNode && targetNode) {
-            edgeX.push(sourceNode.x, targetNode.x, null); // Add null to break the line
-            edgeY.push(sourceNode.y, targetNode.y, null);
+            edgeX.push(xCoords[edge.source], xCoords[edge.target], null); // Add null to break the line
+            edgeY.push(yCoords[edge.source], yCoords[edge.target], null);
             edgeHoverText.push(
                 '', // No text for start point
                  // Combine info for line tooltip
@@ -1961,6 +2013,7 @@ class NovelSimilarityAnalyzer {
     // Clear session ID
     this.currentSessionId = null;
     this.currentResults = null; // Also clear results data
+    this.lastAnalysis = null;
   }
 
   openImageModal(img) {